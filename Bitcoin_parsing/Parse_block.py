@@ -1,36 +1,101 @@
+import os
 import struct
 import json
+import hashlib
 from datetime import datetime, timezone
-import io
+from itertools import islice
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+
+from script_types import classify_output_script
+
+# Optional faster JSON encoder for the NDJSON output
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BLOCK_MAGIC = b'\xf9\xbe\xb4\xd9'
+HEADER_SIZE = 80
+READ_CHUNK_SIZE = 1 << 20  # Read-ahead size used by iter_blocks
+PARALLEL_CHUNK_SIZE = 64  # Blocks handed to a worker process at a time
+NDJSON_BUFFER_SIZE = 1 << 20  # Write buffer of the NDJSON output file
+TRANSACTION_READ_SIZE = 4096  # First read of parse_transaction, grown as needed
+
+# How many blocks parse_block reads when no count is passed, None reads the whole file
+number_of_blocks_to_parse = None
+
+# Precompiled struct formats, reused by every unpack_from call in the parser
+U16_LE = struct.Struct('<H')
+U32_BE = struct.Struct('>I')
+U32_LE = struct.Struct('<I')
+U64_LE = struct.Struct('<Q')
+HEADER_STRUCT = struct.Struct('<I32s32sIII')
+COMPACT_SIZE_WIDTHS = {0xfd: 2, 0xfe: 4, 0xff: 8}
+
+def double_sha256(data):
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
 
 def parse_varint(file):
-    value = 0
-    shift = 0
-    size = 0  # Initialize size to 0
-    while True:
-        byte = file.read(1)
-        size += 1  # Increment size for each byte read
-        if not byte:
-            break
-        value |= (byte[0] & 0x7F) << shift
-        shift += 7
-        if not byte[0] & 0x80:
-            break
-    return value, size
+    # CompactSize integer read from a file, returns the value and the number of
+    # bytes it took
+    prefix = file.read(1)
+    if not prefix:
+        return 0, 1
+    first = prefix[0]
+    if first < 0xfd:
+        return first, 1
+    width = COMPACT_SIZE_WIDTHS[first]
+    return int.from_bytes(file.read(width), 'little'), 1 + width
 
-def parse_transaction(file):
-    version = struct.unpack('>I', file.read(4))[0]  # Change byteorder to 'big'
+def read_varint(buf, offset):
+    # CompactSize integer read from a buffer: values below 0xfd take one byte,
+    # 0xfd, 0xfe and 0xff prefix a 2, 4 or 8 byte little endian integer.
+    # Returns the value and the offset just past it.
+    first = buf[offset]
+    if first < 0xfd:
+        return first, offset + 1
+    if first == 0xfd:
+        return U16_LE.unpack_from(buf, offset + 1)[0], offset + 3
+    if first == 0xfe:
+        return U32_LE.unpack_from(buf, offset + 1)[0], offset + 5
+    return U64_LE.unpack_from(buf, offset + 1)[0], offset + 9
+
+def compact_size(value):
+    # Encodes 'value' the way read_varint reads it
+    if value < 0xfd:
+        return bytes([value])
+    if value <= 0xffff:
+        return b'\xfd' + U16_LE.pack(value)
+    if value <= 0xffffffff:
+        return b'\xfe' + U32_LE.pack(value)
+    return b'\xff' + U64_LE.pack(value)
+
+def parse_transaction_at(buf, offset):
+    # Parses one transaction starting at 'offset' inside 'buf' (a memoryview over
+    # the whole block) and returns it together with the offset of the next byte.
+    # Nothing is copied except the script bytes that end up in the output dict.
+    start = offset
+    version, = U32_BE.unpack_from(buf, offset)  # Change byteorder to 'big'
+    offset += 4
+
+    # BIP144 marker (0x00) and flag (0x01). A legacy transaction never has zero
+    # inputs, so a zero byte here always means the extended format.
+    segwit = buf[offset] == 0 and buf[offset + 1] != 0
+    if segwit:
+        offset += 2
 
-    input_count, size = parse_varint(file)
-    print("txn_in_count:", input_count)
-    # print("Input_size:",size)
+    input_count, offset = read_varint(buf, offset)
     inputs = []
     for _ in range(input_count):
-        txn_hash = file.read(32)[::-1].hex()
-        index = struct.unpack('>I', file.read(4))[0]  # Change byteorder to 'big'
-        script_size, script_size_shift = parse_varint(file)
-        input_script = file.read(script_size)
-        sequence = struct.unpack('>I', file.read(4))[0]  # Change byteorder to 'big'
+        txn_hash = bytes(buf[offset:offset + 32])[::-1].hex()
+        index, = U32_BE.unpack_from(buf, offset + 32)  # Change byteorder to 'big'
+        script_size, offset = read_varint(buf, offset + 36)
+        input_script = buf[offset:offset + script_size]
+        offset += script_size
+        sequence, = U32_BE.unpack_from(buf, offset)  # Change byteorder to 'big'
+        offset += 4
         inputs.append({
             'prev_tx_hash': txn_hash,
             'prev_output_index': index,
@@ -39,117 +104,460 @@ def parse_transaction(file):
             'sequence': sequence
         })
 
-    output_count, size = parse_varint(file)
-    print("txn_out_count:", output_count)
-    # print("output_size:",size)
+    output_count, offset = read_varint(buf, offset)
     outputs = []
     for _ in range(output_count):
-        satoshis = struct.unpack('<Q', file.read(8))[0]  # Keep byteorder as 'little'
-        script_size, script_size_shift = parse_varint(file)
-        output_script = file.read(script_size)
+        satoshis, = U64_LE.unpack_from(buf, offset)  # Keep byteorder as 'little'
+        script_size, offset = read_varint(buf, offset + 8)
+        if offset + script_size > len(buf):
+            # Checked before the script reaches the classify_output_script cache
+            raise IndexError("Output script runs past the end of the buffer.")
+        output_script = bytes(buf[offset:offset + script_size])
+        offset += script_size
+        script_type, address = classify_output_script(output_script)
         outputs.append({
             'satoshis': satoshis,
             'output_script_size': script_size,
-            'output_script_bytes': output_script.hex()
+            'output_script_bytes': output_script.hex(),
+            'script_type': script_type,
+            'address': address
         })
 
-    lock_time = struct.unpack('<I', file.read(4))[0]  # Keep byteorder as 'little'
+    # Witness stacks are only skipped over here, read_witness decodes them on demand
+    witness_offsets = []
+    witness_size = 0
+    if segwit:
+        witness_start = offset
+        for _ in range(input_count):
+            witness_offsets.append(offset)
+            offset = skip_witness(buf, offset)
+        witness_size = offset - witness_start + 2  # Marker and flag count as witness data
 
-    return {
+    lock_time, = U32_LE.unpack_from(buf, offset)  # Keep byteorder as 'little'
+    offset += 4
+
+    # Both ids are hashed straight from the bytes just consumed. The txid of a
+    # SegWit transaction leaves out the marker, flag and witness stacks.
+    if segwit:
+        first_hash = hashlib.sha256(buf[start:start + 4])
+        first_hash.update(buf[start + 6:witness_start])
+        first_hash.update(buf[offset - 4:offset])
+        txid = hashlib.sha256(first_hash.digest()).digest()
+    else:
+        txid = double_sha256(buf[start:offset])
+
+    transaction = {
+        'txid': txid[::-1].hex(),
         'version': version,
         'txn_inputs': inputs,
         'txn_outputs': outputs,
-        'lock_time': lock_time
+        'lock_time': lock_time,
+        'stripped_size': offset - start - witness_size,
+        'total_size': offset - start
     }
+    if segwit:
+        transaction['wtxid'] = double_sha256(buf[start:offset])[::-1].hex()
+        # One offset into 'buf' per input, pointing at its witness item count
+        transaction['witness_offsets'] = witness_offsets
+    return transaction, offset
 
-def parse_block(file_path):
-    with open(file_path, 'rb') as file:
-        blocks = []
-        for block_number in range(number_of_blocks_to_parse):  # Read only the first block
-            # Read magic number
-            magic = file.read(4)
+def skip_witness(buf, offset):
+    # Returns the offset just past the witness stack starting at 'offset'
+    item_count, offset = read_varint(buf, offset)
+    for _ in range(item_count):
+        item_size, offset = read_varint(buf, offset)
+        offset += item_size
+    return offset
 
-            # Check if it's a valid Bitcoin block file
-            if magic != b'\xf9\xbe\xb4\xd9':
-                print("Invalid magic number. Not a Bitcoin block file.")
-                return None
+def read_witness(buf, offset):
+    # Decodes the witness stack at one of a transaction's 'witness_offsets'
+    # into a list of bytes items
+    item_count, offset = read_varint(buf, offset)
+    items = []
+    for _ in range(item_count):
+        item_size, offset = read_varint(buf, offset)
+        items.append(bytes(buf[offset:offset + item_size]))
+        offset += item_size
+    return items
 
-            # Read block size
-            block_size = struct.unpack('<I', file.read(4))[0]
+def parse_transaction(file):
+    # File based wrapper around parse_transaction_at, leaves the file positioned
+    # right after the transaction. Reads TRANSACTION_READ_SIZE bytes and doubles
+    # the buffer while the transaction runs past its end, rather than reading
+    # the rest of the file.
+    start = file.tell()
+    data = file.read(TRANSACTION_READ_SIZE)
+    while True:
+        try:
+            transaction, end = parse_transaction_at(memoryview(data), 0)
+            if end <= len(data):
+                break
+        except (IndexError, struct.error):
+            pass
+        more = file.read(len(data) or TRANSACTION_READ_SIZE)
+        if not more:
+            raise ValueError("Truncated transaction.")
+        data += more
+    print("txn_in_count:", len(transaction['txn_inputs']))
+    print("txn_out_count:", len(transaction['txn_outputs']))
+    file.seek(start + end)
+    return transaction
 
-            # Read the entire block data
-            block_data = file.read(block_size)
+def parse_block_header(buf, block_number=0):
+    # Decodes the 80 byte header at the start of 'buf'
+    version, prev_hash, merkle, timestamp, bits, nonce = HEADER_STRUCT.unpack_from(buf, 0)
 
-            # Parse the block header
-            version, = struct.unpack('<I', block_data[:4])
-            prev_block_hash = block_data[4:36][::-1].hex()
-            merkle_root = block_data[36:68][::-1].hex()
+    try:
+        timestamp_readable = datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')
+    except (ValueError, OverflowError, OSError):
+        timestamp_readable = "Invalid Timestamp"
 
-            try:
-                timestamp, = struct.unpack('<I', block_data[68:72])
-                timestamp_readable = datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S UTC')
-            except ValueError:
-                timestamp_readable = "Invalid Timestamp"
-
-            bits, = struct.unpack('<I', block_data[72:76])
-            nonce, = struct.unpack('<I', block_data[76:80])
-
-            nbits = format(bits, '08x')
-
-            block_header = {
-                "version": version,
-                "prev_block_hash": prev_block_hash,
-                "merkle_root": merkle_root,
-                "timestamp_readable": timestamp_readable,
-                "nbits": nbits,
-                "nonce": nonce,
-                "block_number": block_number
-            }
+    return {
+        "block_hash": double_sha256(buf[:HEADER_SIZE])[::-1].hex(),
+        "version": version,
+        "prev_block_hash": prev_hash[::-1].hex(),
+        "merkle_root": merkle[::-1].hex(),
+        "timestamp_readable": timestamp_readable,
+        "nbits": format(bits, '08x'),
+        "nonce": nonce,
+        "block_number": block_number
+    }
+
+def parse_block_data(block_data, block_number=0, magic=BLOCK_MAGIC):
+    # Parses the body of one block (everything after the magic and size fields).
+    # A single memoryview is walked with an integer cursor, so the cost is linear
+    # in the block size.
+    buf = memoryview(block_data)
+    block_header = parse_block_header(buf, block_number)
+
+    # Parse transaction count (varint)
+    tx_count, offset = read_varint(buf, HEADER_SIZE)
 
-            # Parse transaction count (varint)
-            tx_count, size = parse_varint(io.BytesIO(block_data[80:]))
-            current_offset = 80 + size
+    # Parse transactions
+    transactions = []
+    for _ in range(tx_count):
+        parsed_transaction, offset = parse_transaction_at(buf, offset)
+        transactions.append(parsed_transaction)
+
+    return {
+        "magic_number": magic.hex(),
+        "block_size": len(buf),
+        "block_header": block_header,
+        "transaction_count": tx_count,
+        "transactions": transactions,
+        "block_number": block_number,
+        "txn_input_count": sum(len(tx['txn_inputs']) for tx in transactions),
+        "txn_output_count": sum(len(tx['txn_outputs']) for tx in transactions)
+    }
 
-            if 'tx_count' not in locals():
-                print("Error: tx_count not defined.")
-                return None
+def merkle_root(digests):
+    # Builds the merkle tree level by level inside one preallocated list of raw
+    # 32 byte digests (internal byte order). An odd node is paired with itself.
+    level = list(digests)
+    count = len(level)
+    if count == 0:
+        return bytes(32)
+    level.append(None)  # Spare slot for duplicating an odd last node
+    while count > 1:
+        if count & 1:
+            level[count] = level[count - 1]
+        for i in range(0, count, 2):
+            level[i >> 1] = double_sha256(level[i] + level[i + 1])
+        count = (count + 1) >> 1
+    return level[0]
 
-            # Parse transactions
-            transactions = []
-            for transaction_number in range(tx_count):
-                tx_data = io.BytesIO(block_data[current_offset:])
-                parsed_transaction = parse_transaction(tx_data)
-                if parsed_transaction:
-                    transactions.append(parsed_transaction)
-                    current_offset += len(tx_data.getvalue())
+def verify_merkle_root(block):
+    # True when the txids of a parsed block hash up to the merkle_root in its header
+    digests = [bytes.fromhex(tx['txid'])[::-1] for tx in block['transactions']]
+    return merkle_root(digests)[::-1].hex() == block['block_header']['merkle_root']
 
-            block = {
+def verify_merkle_roots(blocks):
+    # Batch form of verify_merkle_root, returns the blocks that fail
+    return [block for block in blocks if not verify_merkle_root(block)]
+
+def ensure_merkle_root(block):
+    if not verify_merkle_root(block):
+        raise ValueError(f"Merkle root mismatch in block {block['block_number']}.")
+    return block
+
+def iter_raw_blocks(file_path, chunk_size=READ_CHUNK_SIZE):
+    # Yields (magic, block_data) for every block in a blk file, reading ahead in
+    # fixed size chunks so memory stays flat regardless of the file size.
+    # block_data is a memoryview into the read-ahead buffer, nothing is copied
+    # unless a block is larger than what is already buffered.
+    with open(file_path, 'rb') as file:
+        buffer = b''
+        pos = 0
+        while True:
+            # Skip the zero padding bitcoind leaves at the end of preallocated files
+            if buffer[pos:pos + 1] == b'\x00':
+                buffer = buffer[pos:].lstrip(b'\x00')
+                pos = 0
+                if not buffer:
+                    chunk = file.read(chunk_size)
+                    if not chunk:
+                        return
+                    buffer = chunk
+                    continue
+
+            # Top up the buffer until the magic number and block size are available
+            if len(buffer) - pos < 8:
+                chunk = file.read(chunk_size)
+                if chunk:
+                    buffer = buffer[pos:] + chunk
+                    pos = 0
+                    continue
+                if len(buffer) == pos:
+                    return
+                raise ValueError("Truncated block header at end of file.")
+
+            magic = buffer[pos:pos + 4]
+            if magic != BLOCK_MAGIC:
+                raise ValueError("Invalid magic number. Not a Bitcoin block file.")
+            block_size, = U32_LE.unpack_from(buffer, pos + 4)
+            pos += 8
+
+            available = len(buffer) - pos
+            if available >= block_size:
+                block_data = memoryview(buffer)[pos:pos + block_size]
+                pos += block_size
+            else:
+                # Block spans past the buffered data, read the remainder directly
+                block_data = buffer[pos:] + file.read(block_size - available)
+                buffer = b''
+                pos = 0
+                if len(block_data) < block_size:
+                    raise ValueError("Truncated block at end of file.")
+
+            yield magic, block_data
+
+def iter_blocks(file_path, chunk_size=READ_CHUNK_SIZE, first_block_number=0, verify_merkle=False):
+    # Yields parsed blocks one at a time until the end of the file
+    raw_blocks = iter_raw_blocks(file_path, chunk_size)
+    for block_number, (magic, block_data) in enumerate(raw_blocks, first_block_number):
+        block = parse_block_data(block_data, block_number, magic)
+        yield ensure_merkle_root(block) if verify_merkle else block
+
+def iter_block_headers(file_path, first_block_number=0):
+    # Header-only scan: reads the magic, size, 80 byte header and transaction
+    # count of each block and seeks past the rest of the body, so no
+    # transaction is decoded.
+    with open(file_path, 'rb') as file:
+        offset = 0
+        block_number = first_block_number
+        while True:
+            # 8 byte prefix + header + the longest possible varint
+            prefix = file.read(8 + HEADER_SIZE + 9)
+            if len(prefix) < 8 or prefix[0] == 0:
+                return  # End of file or zero padding
+            magic = prefix[:4]
+            if magic != BLOCK_MAGIC:
+                raise ValueError("Invalid magic number. Not a Bitcoin block file.")
+            block_size, = U32_LE.unpack_from(prefix, 4)
+            if len(prefix) < 8 + HEADER_SIZE or block_size < HEADER_SIZE:
+                raise ValueError("Truncated block header at end of file.")
+            if block_size <= HEADER_SIZE:
+                raise ValueError(f"Block {block_number} has no transaction count after its header.")
+            header = memoryview(prefix)[8:8 + block_size]
+            try:
+                tx_count, _ = read_varint(header, HEADER_SIZE)
+            except (IndexError, struct.error):
+                raise ValueError(f"Block {block_number} has a truncated transaction count.") from None
+            yield {
                 "magic_number": magic.hex(),
                 "block_size": block_size,
-                "block_header": block_header,
+                "block_header": parse_block_header(header, block_number),
                 "transaction_count": tx_count,
-                "transactions": transactions,
-                "block_number": block_number,
-                "txn_input_count": sum(len(tx['txn_inputs']) for tx in transactions),
-                "txn_output_count": sum(len(tx['txn_outputs']) for tx in transactions)
+                "block_number": block_number
             }
+            block_number += 1
+            offset += 8 + block_size
+            file.seek(offset)
+
+def parse_block(file_path, number_of_blocks=None, headers_only=False, verify_merkle=False):
+    if number_of_blocks is None:
+        number_of_blocks = number_of_blocks_to_parse
+    if headers_only:
+        blocks_iter = iter_block_headers(file_path)
+    else:
+        blocks_iter = iter_blocks(file_path, verify_merkle=verify_merkle)
+    try:
+        blocks = list(islice(blocks_iter, number_of_blocks))
+    except ValueError as error:
+        print(error)
+        return None
+    return {"blocks": blocks}  # Include 'blocks' key at the top level
 
-            blocks.append(block)
+def scan_block_offsets(file_path):
+    # Quick pre-scan that only follows the magic/size framing of a blk file.
+    # Returns (offset of block data, block size) for every block, no block
+    # bodies are read.
+    locations = []
+    with open(file_path, 'rb') as file:
+        offset = 0
+        while True:
+            prefix = file.read(8)
+            if len(prefix) < 8 or prefix[0] == 0:
+                break  # End of file or zero padding
+            if prefix[:4] != BLOCK_MAGIC:
+                raise ValueError(f"Invalid magic number at offset {offset} in {file_path}.")
+            block_size, = U32_LE.unpack_from(prefix, 4)
+            locations.append((offset + 8, block_size))
+            offset += 8 + block_size
+            file.seek(offset)
+    return locations
+
+def parse_block_range(file_path, locations, first_block_number, verify_merkle=False):
+    # Worker entry point: parses the given (offset, size) blocks of one file
+    blocks = []
+    with open(file_path, 'rb') as file:
+        for block_number, (offset, block_size) in enumerate(locations, first_block_number):
+            file.seek(offset)
+            block = parse_block_data(file.read(block_size), block_number)
+            blocks.append(ensure_merkle_root(block) if verify_merkle else block)
+    return blocks
+
+def iter_blocks_parallel(file_paths, workers=None, chunk_size=PARALLEL_CHUNK_SIZE, number_of_blocks=None,
+                         verify_merkle=False):
+    # Spreads the blocks of one or more blk files over a process pool in chunks
+    # of 'chunk_size' blocks and yields them back in file order, numbered
+    # continuously across files.
+    tasks = []
+    block_number = 0
+    for file_path in file_paths:
+        locations = scan_block_offsets(file_path)
+        if number_of_blocks is not None:
+            locations = locations[:max(number_of_blocks - block_number, 0)]
+        for start in range(0, len(locations), chunk_size):
+            tasks.append((file_path, locations[start:start + chunk_size], block_number + start, verify_merkle))
+        block_number += len(locations)
+
+    if not tasks:
+        return
+    # At most 'window' chunks are in flight, so parsed blocks never pile up in
+    # memory ahead of a slow consumer. Futures are yielded in submission
+    # order, so the merge is just concatenation.
+    window = 2 * (workers or os.cpu_count() or 1)
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for task in tasks:
+            if len(pending) >= window:
+                yield from pending.popleft().result()
+            pending.append(executor.submit(parse_block_range, *task))
+        while pending:
+            yield from pending.popleft().result()
+
+def iter_block_files(file_paths, number_of_blocks=None, workers=1, chunk_size=PARALLEL_CHUNK_SIZE,
+                     headers_only=False, verify_merkle=False):
+    # Yields the blocks of several blk files in order, numbered continuously.
+    # workers=1 parses in this process, anything else uses iter_blocks_parallel
+    # (None means one worker per CPU). Header-only scans are cheap enough to
+    # always run in this process.
+    if workers != 1 and not headers_only:
+        yield from iter_blocks_parallel(file_paths, workers, chunk_size, number_of_blocks, verify_merkle)
+        return
+    block_number = 0
+    for file_path in file_paths:
+        if headers_only:
+            file_blocks = iter_block_headers(file_path, block_number)
+        else:
+            file_blocks = iter_blocks(file_path, first_block_number=block_number, verify_merkle=verify_merkle)
+        for block in file_blocks:
+            if number_of_blocks is not None and block_number >= number_of_blocks:
+                return
+            yield block
+            block_number += 1
+
+def parse_block_files(file_paths, number_of_blocks=None, workers=1, chunk_size=PARALLEL_CHUNK_SIZE,
+                      headers_only=False, verify_merkle=False):
+    # Parses several blk files into one {"blocks": [...]} document
+    try:
+        blocks = list(iter_block_files(file_paths, number_of_blocks, workers, chunk_size,
+                                       headers_only, verify_merkle))
+    except ValueError as error:
+        print(error)
+        return None
+    return {"blocks": blocks}
 
-        return {"blocks": blocks}  # Include 'blocks' key at the top level
+def json_line_encoder():
+    # Returns a function turning one object into a compact JSON line (bytes),
+    # using orjson when it is installed
+    if orjson is not None:
+        def encode(obj):
+            return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+    else:
+        encoder = json.JSONEncoder(separators=(',', ':'))
+
+        def encode(obj):
+            return (encoder.encode(obj) + '\n').encode('utf-8')
+    return encode
+
+def write_ndjson(blocks, output_file, per_transaction=False, buffer_size=NDJSON_BUFFER_SIZE):
+    # Writes one JSON line per block as soon as it is parsed, or with
+    # per_transaction one line per transaction tagged with its block's number
+    # and hash. Returns the number of lines written.
+    encode = json_line_encoder()
+    lines = 0
+    with open(output_file, 'wb', buffering=buffer_size) as ndjson_file:
+        for block in blocks:
+            if per_transaction:
+                block_hash = block['block_header']['block_hash']
+                for transaction in block.get('transactions', ()):
+                    record = {'block_number': block['block_number'], 'block_hash': block_hash}
+                    record.update(transaction)
+                    ndjson_file.write(encode(record))
+                    lines += 1
+            else:
+                ndjson_file.write(encode(block))
+                lines += 1
+    return lines
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Parse Bitcoin blk files into JSON.")
+    parser.add_argument('block_files', nargs='*', default=['blk00000-b0.blk'],
+                        help="blk files to parse, in chain order")
+    parser.add_argument('-o', '--output',
+                        help="output file (default: first input file + .json or .ndjson)")
+    parser.add_argument('--format', choices=('json', 'ndjson'), default='json',
+                        help="one indented JSON document, or one compact line per block (default: json)")
+    parser.add_argument('--per-transaction', action='store_true',
+                        help="with --format ndjson, write one line per transaction instead of per block")
+    parser.add_argument('-n', '--number-of-blocks', type=int, default=1,
+                        help="number of blocks to parse, 0 parses every block (default: 1)")
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help="worker processes, 0 uses one per CPU (default: 1)")
+    parser.add_argument('--chunk-size', type=int, default=PARALLEL_CHUNK_SIZE,
+                        help=f"blocks per worker task (default: {PARALLEL_CHUNK_SIZE})")
+    parser.add_argument('--headers-only', action='store_true',
+                        help="only decode block headers and transaction counts")
+    parser.add_argument('--verify-merkle', action='store_true',
+                        help="check every block's merkle root against its txids")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
-    # Replace 'path/to/your/blockfile.blk' with the path to your .blk file
-    block_file_path = 'blk00000-b0.blk'
-    output_json_file = 'blk00000-b0.blk.json'
-    number_of_blocks_to_parse=1
-    # Parse the first block
-    parsed_blocks = parse_block(block_file_path)
-    
-
-    if parsed_blocks:
-        # Save the output in a JSON file
-        with open(output_json_file, 'w') as json_file:
-            json.dump(parsed_blocks, json_file, indent=2)
-
-        print("Output saved to", output_json_file)
+    args = parse_args()
+    number_of_blocks_to_parse = args.number_of_blocks or None
+
+    if args.format == 'ndjson':
+        output_ndjson_file = args.output or args.block_files[0] + '.ndjson'
+        blocks = iter_block_files(args.block_files, number_of_blocks_to_parse, args.workers or None,
+                                  args.chunk_size, args.headers_only, args.verify_merkle)
+        try:
+            lines = write_ndjson(blocks, output_ndjson_file, args.per_transaction)
+        except ValueError as error:
+            print(error)
+        else:
+            print(f"{lines} lines saved to", output_ndjson_file)
+    else:
+        output_json_file = args.output or args.block_files[0] + '.json'
+        # Parse the requested blocks
+        parsed_blocks = parse_block_files(args.block_files, number_of_blocks_to_parse,
+                                          args.workers or None, args.chunk_size, args.headers_only,
+                                          args.verify_merkle)
+
+        if parsed_blocks:
+            # Save the output in a JSON file
+            with open(output_json_file, 'w') as json_file:
+                json.dump(parsed_blocks, json_file, indent=2)
+
+            print("Output saved to", output_json_file)
@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+from Parse_block import (iter_block_headers, iter_blocks, iter_blocks_parallel, iter_raw_blocks, parse_block,
+                         write_ndjson)
+from block_objects import decode_block
+from synthetic_blocks import write_block_file
+
+# Parser throughput benchmarks over synthetic blk files. Every mode runs in a
+# fresh process so its peak RSS is not inflated by the modes before it.
+# Results are saved as JSON and can be compared against an earlier run to
+# fail CI on a throughput regression.
+
+DEFAULT_TOLERANCE = 0.25  # Allowed throughput drop against the baseline
+
+
+def run_parse_block(path, workers):
+    return len(parse_block(path)['blocks'])
+
+
+def run_iter_blocks(path, workers):
+    return sum(1 for block in iter_blocks(path))
+
+
+def run_verify_merkle(path, workers):
+    return sum(1 for block in iter_blocks(path, verify_merkle=True))
+
+
+def run_headers_only(path, workers):
+    return sum(1 for header in iter_block_headers(path))
+
+
+def run_decode_block(path, workers):
+    return sum(1 for magic, block_data in iter_raw_blocks(path) if decode_block(block_data).to_dict())
+
+
+def run_parallel(path, workers):
+    return sum(1 for block in iter_blocks_parallel([path], workers, chunk_size=1))
+
+
+def run_ndjson(path, workers):
+    return write_ndjson(iter_blocks(path), os.devnull)
+
+
+MODES = {
+    'parse_block': run_parse_block,
+    'iter_blocks': run_iter_blocks,
+    'verify_merkle': run_verify_merkle,
+    'headers_only': run_headers_only,
+    'decode_block': run_decode_block,
+    'parallel': run_parallel,
+    'ndjson': run_ndjson,
+}
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    usage = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return usage / (1 << 20) if sys.platform == 'darwin' else usage / 1024
+
+
+def measure_mode(mode, path, repeat=1, workers=None):
+    # Runs one mode 'repeat' times in this process and keeps the fastest run
+    size = os.path.getsize(path)
+    best = None
+    blocks = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        blocks = MODES[mode](path, workers)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {
+        'blocks': blocks,
+        'seconds': best,
+        'blocks_per_sec': blocks / best if best else 0.0,
+        'mb_per_sec': size / (1 << 20) / best if best else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_benchmarks(path, modes=None, repeat=1, workers=None):
+    results = {}
+    for mode in modes or MODES:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results[mode] = executor.submit(measure_mode, mode, path, repeat, workers).result()
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'file_size': os.path.getsize(path),
+        'results': results,
+    }
+
+
+def compare_results(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    # Returns a message for every mode whose throughput dropped by more than
+    # 'tolerance' (a fraction) compared to the baseline run
+    regressions = []
+    for mode, result in current['results'].items():
+        previous = baseline.get('results', {}).get(mode)
+        if not previous or not previous['blocks_per_sec']:
+            continue
+        if result['blocks_per_sec'] < previous['blocks_per_sec'] * (1 - tolerance):
+            regressions.append(f"{mode}: {result['blocks_per_sec']:.2f} blocks/s, "
+                               f"baseline {previous['blocks_per_sec']:.2f} blocks/s")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the block parser on synthetic blocks.")
+    parser.add_argument('--blocks', type=int, default=5, help="synthetic blocks to generate (default: 5)")
+    parser.add_argument('--transactions', type=int, default=2000, help="transactions per block (default: 2000)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed of the generator (default: 0)")
+    parser.add_argument('--block-file', help="benchmark this blk file instead of generating one")
+    parser.add_argument('--modes', nargs='+', choices=sorted(MODES), help="modes to run (default: all)")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per mode, the fastest is kept (default: 3)")
+    parser.add_argument('-j', '--workers', type=int, default=0,
+                        help="workers of the parallel mode, 0 uses one per CPU (default: 0)")
+    parser.add_argument('-o', '--output', default='benchmark_results.json', help="JSON results file")
+    parser.add_argument('--baseline', help="earlier results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f"allowed throughput drop against the baseline (default: {DEFAULT_TOLERANCE})")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        block_file = args.block_file
+        if block_file is None:
+            block_file = os.path.join(tmp_dir, 'blk00000.dat')
+            write_block_file(block_file, args.blocks, args.transactions, args.seed, padding=1 << 16)
+        results = run_benchmarks(block_file, args.modes, args.repeat, args.workers or None)
+
+    with open(args.output, 'w') as json_file:
+        json.dump(results, json_file, indent=2)
+    for mode, result in results['results'].items():
+        print(f"{mode:15} {result['blocks_per_sec']:10.2f} blocks/s {result['mb_per_sec']:8.2f} MB/s "
+              f"peak RSS {result['peak_rss_mb'] or 0:.1f} MB")
+    print("Results saved to", args.output)
+
+    if args.baseline:
+        with open(args.baseline) as json_file:
+            regressions = compare_results(results, json.load(json_file), args.tolerance)
+        for regression in regressions:
+            print("Regression:", regression)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,303 @@
+import hashlib
+
+from script_types import classify_output_script
+from Parse_block import (BLOCK_MAGIC, HEADER_SIZE, U32_BE, U32_LE, U64_LE, HEADER_STRUCT, double_sha256,
+                         read_varint, skip_witness, read_witness, parse_block_header)
+
+# Compact alternative to the nested dicts of Parse_block. Decoding only records
+# offsets into the raw block bytes; field values, hashes and hex strings are
+# produced when they are read. to_dict() gives the same shape as
+# Parse_block.parse_block_data.
+
+
+class TxIn:
+    __slots__ = ('_buf', '_offset', '_script_offset', '_script_size', '_witness_offset')
+
+    def __init__(self, buf, offset, script_offset, script_size):
+        self._buf = buf
+        self._offset = offset
+        self._script_offset = script_offset
+        self._script_size = script_size
+        self._witness_offset = None
+
+    @property
+    def outpoint(self):
+        # Raw 36 bytes: previous txid (internal byte order) and little endian index
+        return self._buf[self._offset:self._offset + 36]
+
+    @property
+    def prev_tx_hash_bytes(self):
+        # Internal (little endian) byte order, as stored in the block
+        return self._buf[self._offset:self._offset + 32]
+
+    @property
+    def prev_tx_hash(self):
+        return self.prev_tx_hash_bytes[::-1].hex()
+
+    @property
+    def prev_output_index(self):
+        return U32_BE.unpack_from(self._buf, self._offset + 32)[0]
+
+    @property
+    def script_bytes(self):
+        return self._buf[self._script_offset:self._script_offset + self._script_size]
+
+    @property
+    def sequence(self):
+        return U32_BE.unpack_from(self._buf, self._script_offset + self._script_size)[0]
+
+    @property
+    def sequence_bytes(self):
+        # Raw 4 bytes, as serialized for signature hashes
+        end = self._script_offset + self._script_size
+        return self._buf[end:end + 4]
+
+    @property
+    def witness(self):
+        if self._witness_offset is None:
+            return []
+        return read_witness(memoryview(self._buf), self._witness_offset)
+
+    def to_dict(self):
+        return {
+            'prev_tx_hash': self.prev_tx_hash,
+            'prev_output_index': self.prev_output_index,
+            'input_script_size': self._script_size,
+            'input_script_bytes': self.script_bytes.hex(),
+            'sequence': self.sequence
+        }
+
+
+class TxOut:
+    __slots__ = ('_buf', '_offset', '_script_offset', '_script_size')
+
+    def __init__(self, buf, offset, script_offset, script_size):
+        self._buf = buf
+        self._offset = offset
+        self._script_offset = script_offset
+        self._script_size = script_size
+
+    @property
+    def satoshis(self):
+        return U64_LE.unpack_from(self._buf, self._offset)[0]
+
+    @property
+    def script_bytes(self):
+        return self._buf[self._script_offset:self._script_offset + self._script_size]
+
+    @property
+    def raw(self):
+        # Serialized output: satoshis, script length and script
+        return self._buf[self._offset:self._script_offset + self._script_size]
+
+    @property
+    def script_type(self):
+        return classify_output_script(self.script_bytes)[0]
+
+    @property
+    def address(self):
+        return classify_output_script(self.script_bytes)[1]
+
+    def to_dict(self):
+        script_type, address = classify_output_script(self.script_bytes)
+        return {
+            'satoshis': self.satoshis,
+            'output_script_size': self._script_size,
+            'output_script_bytes': self.script_bytes.hex(),
+            'script_type': script_type,
+            'address': address
+        }
+
+
+class Tx:
+    __slots__ = ('_buf', '_offset', '_end', '_witness_start', 'inputs', 'outputs', '_txid')
+
+    def __init__(self, buf, offset, end, witness_start, inputs, outputs):
+        self._buf = buf
+        self._offset = offset
+        self._end = end
+        self._witness_start = witness_start  # None for legacy transactions
+        self.inputs = inputs
+        self.outputs = outputs
+        self._txid = None
+
+    @property
+    def segwit(self):
+        return self._witness_start is not None
+
+    @property
+    def version(self):
+        return U32_BE.unpack_from(self._buf, self._offset)[0]
+
+    @property
+    def lock_time(self):
+        return U32_LE.unpack_from(self._buf, self._end - 4)[0]
+
+    @property
+    def raw(self):
+        return self._buf[self._offset:self._end]
+
+    @property
+    def offset(self):
+        # Position of the transaction inside its block's data
+        return self._offset
+
+    @property
+    def total_size(self):
+        return self._end - self._offset
+
+    @property
+    def stripped_size(self):
+        if not self.segwit:
+            return self.total_size
+        return self.total_size - (self._end - 4 - self._witness_start) - 2
+
+    @property
+    def txid_bytes(self):
+        if self._txid is None:
+            view = memoryview(self._buf)
+            if self.segwit:
+                first_hash = hashlib.sha256(view[self._offset:self._offset + 4])
+                first_hash.update(view[self._offset + 6:self._witness_start])
+                first_hash.update(view[self._end - 4:self._end])
+                self._txid = hashlib.sha256(first_hash.digest()).digest()
+            else:
+                self._txid = double_sha256(view[self._offset:self._end])
+        return self._txid
+
+    @property
+    def txid(self):
+        return self.txid_bytes[::-1].hex()
+
+    @property
+    def wtxid_bytes(self):
+        return double_sha256(memoryview(self._buf)[self._offset:self._end])
+
+    @property
+    def wtxid(self):
+        return self.wtxid_bytes[::-1].hex()
+
+    def to_dict(self):
+        transaction = {
+            'txid': self.txid,
+            'version': self.version,
+            'txn_inputs': [txin.to_dict() for txin in self.inputs],
+            'txn_outputs': [txout.to_dict() for txout in self.outputs],
+            'lock_time': self.lock_time,
+            'stripped_size': self.stripped_size,
+            'total_size': self.total_size
+        }
+        if self.segwit:
+            transaction['wtxid'] = self.wtxid
+            transaction['witness_offsets'] = [txin._witness_offset for txin in self.inputs]
+        return transaction
+
+
+class Block:
+    __slots__ = ('_buf', 'magic', 'block_number', 'transactions')
+
+    def __init__(self, buf, magic, block_number, transactions):
+        self._buf = buf
+        self.magic = magic
+        self.block_number = block_number
+        self.transactions = transactions
+
+    @property
+    def raw(self):
+        return self._buf
+
+    @property
+    def header_bytes(self):
+        return self._buf[:HEADER_SIZE]
+
+    @property
+    def block_hash(self):
+        return double_sha256(self.header_bytes)[::-1].hex()
+
+    @property
+    def version(self):
+        return HEADER_STRUCT.unpack_from(self._buf, 0)[0]
+
+    @property
+    def prev_block_hash(self):
+        return self._buf[4:36][::-1].hex()
+
+    @property
+    def merkle_root(self):
+        return self._buf[36:68][::-1].hex()
+
+    @property
+    def timestamp(self):
+        return HEADER_STRUCT.unpack_from(self._buf, 0)[3]
+
+    @property
+    def nbits(self):
+        return format(HEADER_STRUCT.unpack_from(self._buf, 0)[4], '08x')
+
+    @property
+    def nonce(self):
+        return HEADER_STRUCT.unpack_from(self._buf, 0)[5]
+
+    @property
+    def block_size(self):
+        return len(self._buf)
+
+    def to_dict(self):
+        transactions = [tx.to_dict() for tx in self.transactions]
+        return {
+            "magic_number": self.magic.hex(),
+            "block_size": self.block_size,
+            "block_header": parse_block_header(self._buf, self.block_number),
+            "transaction_count": len(transactions),
+            "transactions": transactions,
+            "block_number": self.block_number,
+            "txn_input_count": sum(len(tx.inputs) for tx in self.transactions),
+            "txn_output_count": sum(len(tx.outputs) for tx in self.transactions)
+        }
+
+
+def decode_transaction(buf, offset):
+    # Walks one transaction in 'buf' (bytes) and returns a Tx plus the offset of
+    # the next byte. Only offsets are recorded.
+    start = offset
+    offset += 4
+    segwit = buf[offset] == 0 and buf[offset + 1] != 0
+    if segwit:
+        offset += 2
+
+    input_count, offset = read_varint(buf, offset)
+    inputs = []
+    for _ in range(input_count):
+        script_size, script_offset = read_varint(buf, offset + 36)
+        inputs.append(TxIn(buf, offset, script_offset, script_size))
+        offset = script_offset + script_size + 4
+
+    output_count, offset = read_varint(buf, offset)
+    outputs = []
+    for _ in range(output_count):
+        script_size, script_offset = read_varint(buf, offset + 8)
+        outputs.append(TxOut(buf, offset, script_offset, script_size))
+        offset = script_offset + script_size
+
+    witness_start = None
+    if segwit:
+        witness_start = offset
+        for txin in inputs:
+            txin._witness_offset = offset
+            offset = skip_witness(buf, offset)
+
+    offset += 4  # Lock time
+    return Tx(buf, start, offset, witness_start, inputs, outputs), offset
+
+
+def decode_block(block_data, block_number=0, magic=BLOCK_MAGIC):
+    # Object counterpart of Parse_block.parse_block_data. The block bytes are
+    # copied once (so the result does not pin a read-ahead buffer or mmap) and
+    # shared by every object decoded from them.
+    buf = bytes(block_data)
+    tx_count, offset = read_varint(buf, HEADER_SIZE)
+    transactions = []
+    for _ in range(tx_count):
+        transaction, offset = decode_transaction(buf, offset)
+        transactions.append(transaction)
+    return Block(buf, magic, block_number, transactions)
@@ -0,0 +1,246 @@
+import os
+import re
+import mmap
+import struct
+
+from Parse_block import BLOCK_MAGIC, HEADER_SIZE, U32_LE, double_sha256, parse_block_data
+from chain import BlockTree
+
+INDEX_FILE_NAME = 'blocks.idx'
+INDEX_MAGIC = b'BIDX'
+INDEX_VERSION = 1
+
+# Index file layout: magic, version, file count, block count, then one FILE_RECORD
+# per blk file followed by one BLOCK_RECORD per block
+INDEX_HEADER = struct.Struct('<4sIII')
+FILE_RECORD = struct.Struct('<IQ')  # file number, offset where the last scan stopped
+BLOCK_RECORD = struct.Struct('<IQI32s')  # file number, offset of block data, block size, header hash
+
+BLK_FILE_PATTERN = re.compile(r'^blk(\d+)\.dat$')
+
+
+def list_block_files(data_dir):
+    # Returns (file number, path) for every blk*.dat in the directory, in file order
+    files = []
+    for name in os.listdir(data_dir):
+        match = BLK_FILE_PATTERN.match(name)
+        if match:
+            files.append((int(match.group(1)), os.path.join(data_dir, name)))
+    return sorted(files)
+
+
+def scan_block_locations(buf, offset=0):
+    # Walks the magic/size framing of a blk file without decoding transactions.
+    # Returns (offset of block data, block size, header hash) for every block and
+    # the offset right after the last complete block.
+    locations = []
+    end = len(buf)
+    while offset + 8 <= end:
+        if buf[offset] == 0:
+            # Zero padding at the end of a preallocated file, more blocks may be
+            # appended here later so the scan resumes from this offset
+            break
+        if buf[offset:offset + 4] != BLOCK_MAGIC:
+            raise ValueError(f"Invalid magic number at offset {offset}.")
+        block_size, = U32_LE.unpack_from(buf, offset + 4)
+        data_offset = offset + 8
+        if data_offset + block_size > end:
+            break  # Block still being written
+        header_hash = double_sha256(buf[data_offset:data_offset + HEADER_SIZE])
+        locations.append((data_offset, block_size, header_hash))
+        offset = data_offset + block_size
+    return locations, offset
+
+
+class BlockchainReader:
+    # Random access reader over a directory of blk*.dat files.
+    #
+    # Every file is memory mapped and a persistent index of
+    # (file number, offset, size, header hash) is kept next to them, so after the
+    # first scan a block is found by hash or height with a dictionary lookup and
+    # decoded straight from the mapped file by parse_block_data.
+    def __init__(self, data_dir, index_path=None):
+        self.data_dir = data_dir
+        self.index_path = index_path or os.path.join(data_dir, INDEX_FILE_NAME)
+        self._files = {}  # file number -> (file object, mmap)
+        self._scanned = {}  # file number -> offset where the last scan stopped
+        self._entries = []  # (file number, offset, size, header hash) in scan order
+        self._by_hash = {}  # header hash -> position in _entries
+        self._heights = []  # height -> position in _entries
+        self._height_by_position = {}
+        self.tree = BlockTree()
+        self._load_index()
+        self.update()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, block_hash):
+        return self._to_hash_bytes(block_hash) in self._by_hash
+
+    def close(self):
+        for file, mapped in self._files.values():
+            mapped.close()
+            file.close()
+        self._files.clear()
+
+    def update(self):
+        # Scans only the bytes added since the last scan and saves the index if
+        # any new block was found
+        found = False
+        for file_number, path in list_block_files(self.data_dir):
+            buf = self._map_file(file_number, path)
+            if buf is None:
+                continue
+            start = self._scanned.get(file_number, 0)
+            locations, end = scan_block_locations(buf, start)
+            self._scanned[file_number] = end
+            for data_offset, block_size, header_hash in locations:
+                if self._add_entry((file_number, data_offset, block_size, header_hash)):
+                    found = True
+        if found:
+            self._compute_heights()
+            self.save_index()
+        return found
+
+    def get_raw_block(self, block_hash):
+        # Returns a copy so callers never hold a view that keeps the mmap open
+        position = self._by_hash.get(self._to_hash_bytes(block_hash))
+        if position is None:
+            return None
+        return bytes(self._raw_block_at(position))
+
+    def get_block_location(self, block_hash):
+        # (file number, offset of the block data, block size) or None
+        position = self._by_hash.get(self._to_hash_bytes(block_hash))
+        if position is None:
+            return None
+        return self._entries[position][:3]
+
+    def read_bytes(self, file_number, offset, size):
+        return bytes(self._map_file(file_number)[offset:offset + size])
+
+    def get_block(self, block_hash):
+        position = self._by_hash.get(self._to_hash_bytes(block_hash))
+        if position is None:
+            return None
+        return self._parse_entry(position)
+
+    def get_block_by_height(self, height):
+        if not 0 <= height < len(self._heights):
+            return None
+        return self._parse_entry(self._heights[height])
+
+    def get_block_hash(self, height):
+        if not 0 <= height < len(self._heights):
+            return None
+        return self._entries[self._heights[height]][3][::-1].hex()
+
+    @property
+    def height(self):
+        # Height of the most-work tip, -1 when empty
+        return len(self._heights) - 1
+
+    def save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'wb') as index_file:
+            index_file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(self._scanned), len(self._entries)))
+            for file_number, end in sorted(self._scanned.items()):
+                index_file.write(FILE_RECORD.pack(file_number, end))
+            for entry in self._entries:
+                index_file.write(BLOCK_RECORD.pack(*entry))
+        os.replace(tmp_path, self.index_path)
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, 'rb') as index_file:
+            data = index_file.read()
+        if len(data) < INDEX_HEADER.size:
+            print(f"Ignoring truncated block index {self.index_path}.")
+            return
+        magic, version, file_count, block_count = INDEX_HEADER.unpack_from(data, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            print(f"Ignoring incompatible block index {self.index_path}.")
+            return
+        if len(data) != INDEX_HEADER.size + file_count * FILE_RECORD.size + block_count * BLOCK_RECORD.size:
+            print(f"Ignoring truncated block index {self.index_path}.")
+            return
+        try:
+            offset = INDEX_HEADER.size
+            for file_number, end in FILE_RECORD.iter_unpack(data[offset:offset + file_count * FILE_RECORD.size]):
+                self._scanned[file_number] = end
+            offset += file_count * FILE_RECORD.size
+            for entry in BLOCK_RECORD.iter_unpack(data[offset:offset + block_count * BLOCK_RECORD.size]):
+                self._add_entry(entry)
+            self._compute_heights()
+        except (struct.error, ValueError, OSError):
+            # Records pointing at missing files or at bytes that are not a
+            # header: start over, update() rescans the files and saves again
+            print(f"Ignoring corrupt block index {self.index_path}.")
+            self.close()
+            self._scanned.clear()
+            self._entries.clear()
+            self._by_hash.clear()
+            self._heights = []
+            self._height_by_position = {}
+            self.tree = BlockTree()
+
+    def _add_entry(self, entry):
+        header_hash = entry[3]
+        if header_hash in self._by_hash:
+            return False  # Same block stored twice
+        self._by_hash[header_hash] = len(self._entries)
+        self._entries.append(entry)
+        return True
+
+    def _compute_heights(self):
+        # Heights follow the chain with the most work, so stale blocks and
+        # blocks stored out of order end up where they belong
+        tree = BlockTree()
+        for file_number, data_offset, block_size, header_hash in self._entries:
+            buf = self._map_file(file_number)
+            tree.add_header(buf[data_offset:data_offset + HEADER_SIZE])
+        self.tree = tree
+        self._heights = [self._by_hash[block_hash] for block_hash in tree.path()]
+        self._height_by_position = {position: height for height, position in enumerate(self._heights)}
+
+    def _map_file(self, file_number, path=None):
+        if file_number in self._files:
+            file, mapped = self._files[file_number]
+            if path is None or os.path.getsize(path) == len(mapped):
+                return mapped
+            # File grew since it was mapped
+            mapped.close()
+            file.close()
+            del self._files[file_number]
+        if path is None:
+            path = os.path.join(self.data_dir, f'blk{file_number:05d}.dat')
+        if os.path.getsize(path) == 0:
+            return None
+        file = open(path, 'rb')
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._files[file_number] = (file, mapped)
+        return mapped
+
+    def _raw_block_at(self, position):
+        file_number, data_offset, block_size, header_hash = self._entries[position]
+        return memoryview(self._map_file(file_number))[data_offset:data_offset + block_size]
+
+    def _parse_entry(self, position):
+        # Blocks that are not on the indexed chain get block_number -1
+        height = self._height_by_position.get(position, -1)
+        return parse_block_data(self._raw_block_at(position), height)
+
+    @staticmethod
+    def _to_hash_bytes(block_hash):
+        # Accepts the usual big endian hex string or the raw little endian digest
+        if isinstance(block_hash, str):
+            return bytes.fromhex(block_hash)[::-1]
+        return bytes(block_hash)
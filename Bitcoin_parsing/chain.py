@@ -0,0 +1,89 @@
+from Parse_block import U32_LE, double_sha256
+from header_validation import bits_to_target
+
+NULL_HASH = bytes(32)
+
+
+def block_work(bits):
+    # Expected number of hashes needed for a block at this target, the same
+    # measure bitcoind sums to pick the best chain
+    try:
+        target = bits_to_target(bits)
+    except ValueError:
+        return 0
+    return (1 << 256) // (target + 1)
+
+
+class BlockTree:
+    # Links headers by prev_block_hash into a tree and tracks the tip with the
+    # most accumulated work. Headers may arrive in any order, the ones whose
+    # parent is not known yet wait until it shows up. Hashes are raw digests
+    # in internal byte order.
+    def __init__(self):
+        self.nodes = {}  # hash -> (prev hash, height, chain work)
+        self._waiting = {}  # unknown parent hash -> [(hash, work)]
+        self.best_tip = None
+
+    def __contains__(self, block_hash):
+        return block_hash in self.nodes
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def add_header(self, header):
+        # Adds one raw 80 byte header, returns its hash
+        block_hash = double_sha256(header)
+        if block_hash not in self.nodes:
+            self.add(block_hash, bytes(header[4:36]), U32_LE.unpack_from(header, 72)[0])
+        return block_hash
+
+    def add(self, block_hash, prev_hash, bits):
+        work = block_work(bits)
+        if prev_hash != NULL_HASH and prev_hash not in self.nodes:
+            self._waiting.setdefault(prev_hash, []).append((block_hash, work))
+            return
+        pending = [(block_hash, prev_hash, work)]
+        while pending:
+            block_hash, prev_hash, work = pending.pop()
+            if prev_hash == NULL_HASH:
+                height, chain_work = 0, work
+            else:
+                parent_height, parent_work = self.nodes[prev_hash][1:]
+                height, chain_work = parent_height + 1, parent_work + work
+            self.nodes[block_hash] = (prev_hash, height, chain_work)
+            # Strictly more work is needed to replace the tip, so the first block
+            # seen wins a tie, as in bitcoind
+            if self.best_tip is None or chain_work > self.nodes[self.best_tip][2]:
+                self.best_tip = block_hash
+            for child_hash, child_work in self._waiting.pop(block_hash, ()):
+                pending.append((child_hash, block_hash, child_work))
+
+    def height(self, block_hash):
+        node = self.nodes.get(block_hash)
+        return node[1] if node else -1
+
+    def chain_work(self, block_hash):
+        node = self.nodes.get(block_hash)
+        return node[2] if node else 0
+
+    def path(self, tip=None):
+        # Hashes from the genesis block up to 'tip' (default: the best tip)
+        block_hash = self.best_tip if tip is None else tip
+        if block_hash is None:
+            return []
+        path = [None] * (self.nodes[block_hash][1] + 1)
+        for height in range(len(path) - 1, -1, -1):
+            path[height] = block_hash
+            block_hash = self.nodes[block_hash][0]
+        return path
+
+    def fork_point(self, first_hash, second_hash):
+        # Last block both chains share, None when they have no common block
+        while first_hash != second_hash:
+            if first_hash not in self.nodes or second_hash not in self.nodes:
+                return None
+            if self.nodes[first_hash][1] >= self.nodes[second_hash][1]:
+                first_hash = self.nodes[first_hash][0]
+            else:
+                second_hash = self.nodes[second_hash][0]
+        return first_hash
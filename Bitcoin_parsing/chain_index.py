@@ -0,0 +1,150 @@
+import sqlite3
+
+from Parse_block import parse_transaction_at
+from block_objects import decode_block
+from utxo_set import OUTPOINT_INDEX, make_outpoint
+
+BATCH_SIZE = 1000  # Blocks per write transaction while syncing
+
+
+def split_outpoint(outpoint):
+    return outpoint[:32][::-1].hex(), OUTPOINT_INDEX.unpack_from(outpoint, 32)[0]
+
+
+class ChainIndex:
+    # Secondary indexes over the blocks of a block_reader.BlockchainReader,
+    # kept in SQLite tables clustered on their lookup key:
+    #
+    #   txids      txid -> file number, file offset and size of the transaction
+    #   addresses  address -> outpoints paying to it
+    #   spends     outpoint -> txid and input index spending it
+    #
+    # Every row carries the height of its block, so blocks that leave the best
+    # chain are dropped with a range delete. sync_from_reader builds everything
+    # in bulk on the first run and only indexes new blocks afterwards.
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS blocks (height INTEGER PRIMARY KEY, block_hash TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS txids (txid BLOB PRIMARY KEY, file_number INTEGER NOT NULL,
+                offset INTEGER NOT NULL, size INTEGER NOT NULL, height INTEGER NOT NULL) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS addresses (address TEXT NOT NULL, outpoint BLOB NOT NULL,
+                height INTEGER NOT NULL, PRIMARY KEY (address, outpoint)) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS spends (outpoint BLOB PRIMARY KEY, spending_txid BLOB NOT NULL,
+                input_index INTEGER NOT NULL, height INTEGER NOT NULL) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS txids_height ON txids (height);
+            CREATE INDEX IF NOT EXISTS addresses_height ON addresses (height);
+            CREATE INDEX IF NOT EXISTS spends_height ON spends (height);
+        """)
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    @property
+    def height(self):
+        row = self.connection.execute("SELECT MAX(height) FROM blocks").fetchone()
+        return -1 if row[0] is None else row[0]
+
+    def block_hash(self, height):
+        row = self.connection.execute("SELECT block_hash FROM blocks WHERE height = ?", (height,)).fetchone()
+        return row[0] if row else None
+
+    def index_block(self, block, height, file_number, block_offset, block_hash=None):
+        # Adds the rows of one block_objects.Block stored at 'block_offset' in
+        # blk file 'file_number'. Does not commit.
+        txid_rows = []
+        address_rows = []
+        spend_rows = []
+        for tx_index, transaction in enumerate(block.transactions):
+            txid = transaction.txid_bytes
+            txid_rows.append((txid, file_number, block_offset + transaction.offset, transaction.total_size, height))
+            if tx_index:
+                for input_index, txin in enumerate(transaction.inputs):
+                    spend_rows.append((txin.outpoint, txid, input_index, height))
+            for index, txout in enumerate(transaction.outputs):
+                address = txout.address
+                if address is not None:
+                    address_rows.append((address, txid + OUTPOINT_INDEX.pack(index), height))
+        cursor = self.connection.cursor()
+        # Duplicate coinbase txids (BIP30) keep their latest location
+        cursor.executemany("INSERT OR REPLACE INTO txids VALUES (?, ?, ?, ?, ?)", txid_rows)
+        cursor.executemany("INSERT OR REPLACE INTO addresses VALUES (?, ?, ?)", address_rows)
+        cursor.executemany("INSERT OR REPLACE INTO spends VALUES (?, ?, ?, ?)", spend_rows)
+        cursor.execute("INSERT OR REPLACE INTO blocks VALUES (?, ?)", (height, block_hash or block.block_hash))
+
+    def rollback_to(self, height):
+        # Removes every block above 'height'. Does not commit.
+        for table in ('txids', 'addresses', 'spends', 'blocks'):
+            self.connection.execute(f"DELETE FROM {table} WHERE height > ?", (height,))
+
+    def sync_from_reader(self, reader, batch_size=BATCH_SIZE):
+        # Brings the indexes to the reader's most-work tip, first dropping any
+        # blocks that are no longer on it. Returns (removed, indexed) block counts.
+        height = self.height
+        fork_height = height
+        while fork_height >= 0 and self.block_hash(fork_height) != reader.get_block_hash(fork_height):
+            fork_height -= 1
+        removed = height - fork_height
+
+        initial = fork_height < 0
+        if initial:
+            # Nothing to lose on the first build, trade durability for speed
+            self.connection.execute("PRAGMA synchronous=OFF")
+        try:
+            with self.connection:
+                self.rollback_to(fork_height)
+            indexed = 0
+            for height in range(fork_height + 1, reader.height + 1):
+                block_hash = reader.get_block_hash(height)
+                file_number, block_offset, block_size = reader.get_block_location(block_hash)
+                block = decode_block(reader.read_bytes(file_number, block_offset, block_size), height)
+                self.index_block(block, height, file_number, block_offset, block_hash)
+                indexed += 1
+                if indexed % batch_size == 0:
+                    self.connection.commit()
+            self.connection.commit()
+        finally:
+            if initial:
+                self.connection.execute("PRAGMA synchronous=NORMAL")
+        return removed, indexed
+
+    def get_transaction_location(self, txid):
+        # (file number, file offset, size) of a transaction, or None
+        return self.connection.execute("SELECT file_number, offset, size FROM txids WHERE txid = ?",
+                                       (bytes.fromhex(txid)[::-1],)).fetchone()
+
+    def get_transaction(self, txid, reader):
+        # Parses a transaction straight from its location in the blk files
+        location = self.get_transaction_location(txid)
+        if location is None:
+            return None
+        transaction, _ = parse_transaction_at(memoryview(reader.read_bytes(*location)), 0)
+        return transaction
+
+    def get_address_outpoints(self, address):
+        # [(txid, output index)] of every output paying to 'address', spent or not
+        rows = self.connection.execute("SELECT outpoint FROM addresses WHERE address = ?", (address,))
+        return [split_outpoint(outpoint) for outpoint, in rows]
+
+    def get_spending_transaction(self, txid, index):
+        # (spending txid, input index) of an output, or None while it is unspent
+        row = self.connection.execute("SELECT spending_txid, input_index FROM spends WHERE outpoint = ?",
+                                      (make_outpoint(txid, index),)).fetchone()
+        return (row[0][::-1].hex(), row[1]) if row else None
+
+    def get_unspent_outpoints(self, address):
+        rows = self.connection.execute("SELECT addresses.outpoint FROM addresses LEFT JOIN spends "
+                                       "ON spends.outpoint = addresses.outpoint "
+                                       "WHERE addresses.address = ? AND spends.outpoint IS NULL", (address,))
+        return [split_outpoint(outpoint) for outpoint, in rows]
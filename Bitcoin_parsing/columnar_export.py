@@ -0,0 +1,199 @@
+import os
+import argparse
+from datetime import datetime, timezone
+
+from Parse_block import HEADER_STRUCT, U32_LE, double_sha256, iter_raw_blocks
+from block_objects import decode_block
+from script_types import classify_output_script
+from utxo_set import OUTPOINT_INDEX
+
+# pyarrow is only needed for this export, the rest of the parser works without it
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+ROW_GROUP_SIZE = 100000  # Rows buffered per table before a row group is written
+TABLE_NAMES = ('blocks', 'transactions', 'inputs', 'outputs')
+
+
+def table_schemas():
+    # Hashes are stored as fixed width binary in the usual display byte order,
+    # so hex() of a column value matches the JSON output of Parse_block
+    hash_type = pa.binary(32)
+    return {
+        'blocks': pa.schema([
+            ('block_number', pa.uint32()),
+            ('block_hash', hash_type),
+            ('version', pa.uint32()),
+            ('prev_block_hash', hash_type),
+            ('merkle_root', hash_type),
+            ('timestamp', pa.timestamp('s', tz='UTC')),
+            ('bits', pa.uint32()),
+            ('nonce', pa.uint32()),
+            ('block_size', pa.uint32()),
+            ('transaction_count', pa.uint32()),
+        ]),
+        'transactions': pa.schema([
+            ('block_number', pa.uint32()),
+            ('tx_index', pa.uint32()),
+            ('txid', hash_type),
+            ('wtxid', hash_type),  # Null for legacy transactions
+            ('version', pa.uint32()),
+            ('lock_time', pa.uint32()),
+            ('stripped_size', pa.uint32()),
+            ('total_size', pa.uint32()),
+            ('input_count', pa.uint32()),
+            ('output_count', pa.uint32()),
+        ]),
+        'inputs': pa.schema([
+            ('txid', hash_type),
+            ('input_index', pa.uint32()),
+            ('prev_tx_hash', hash_type),
+            ('prev_output_index', pa.uint32()),
+            ('input_script', pa.binary()),
+            ('sequence', pa.uint32()),
+        ]),
+        'outputs': pa.schema([
+            ('txid', hash_type),
+            ('output_index', pa.uint32()),
+            ('satoshis', pa.uint64()),
+            ('output_script', pa.binary()),
+            ('script_type', pa.dictionary(pa.int8(), pa.string())),
+            ('address', pa.string()),
+        ]),
+    }
+
+
+class ColumnarWriter:
+    # Writes parsed blocks as four Parquet tables (blocks, transactions, inputs,
+    # outputs) in 'output_dir'. Rows are collected per column and written as a
+    # row group every 'row_group_size' rows, so memory stays bounded however
+    # many blocks are exported.
+    def __init__(self, output_dir, row_group_size=ROW_GROUP_SIZE, compression='snappy'):
+        if pa is None:
+            raise ImportError("pyarrow is required for the columnar export (pip install pyarrow).")
+        os.makedirs(output_dir, exist_ok=True)
+        self.row_group_size = row_group_size
+        self.schemas = table_schemas()
+        self.writers = {
+            name: pq.ParquetWriter(os.path.join(output_dir, f'{name}.parquet'), schema, compression=compression)
+            for name, schema in self.schemas.items()
+        }
+        self.columns = {name: {field.name: [] for field in schema} for name, schema in self.schemas.items()}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_block(self, block):
+        # 'block' is a block_objects.Block. Version, output index and sequence
+        # are decoded little endian here, unlike the legacy JSON fields, so
+        # inputs.prev_output_index joins with outputs.output_index.
+        version, prev_hash, merkle, timestamp, bits, nonce = HEADER_STRUCT.unpack_from(block.raw, 0)
+        self._append('blocks', (
+            block.block_number,
+            double_sha256(block.header_bytes)[::-1],
+            version,
+            prev_hash[::-1],
+            merkle[::-1],
+            datetime.fromtimestamp(timestamp, timezone.utc),
+            bits,
+            nonce,
+            block.block_size,
+            len(block.transactions),
+        ))
+        for tx_index, transaction in enumerate(block.transactions):
+            txid = transaction.txid_bytes[::-1]
+            self._append('transactions', (
+                block.block_number,
+                tx_index,
+                txid,
+                transaction.wtxid_bytes[::-1] if transaction.segwit else None,
+                U32_LE.unpack_from(block.raw, transaction.offset)[0],
+                transaction.lock_time,
+                transaction.stripped_size,
+                transaction.total_size,
+                len(transaction.inputs),
+                len(transaction.outputs),
+            ))
+            for input_index, txin in enumerate(transaction.inputs):
+                self._append('inputs', (
+                    txid,
+                    input_index,
+                    txin.prev_tx_hash_bytes[::-1],
+                    OUTPOINT_INDEX.unpack_from(txin.outpoint, 32)[0],
+                    txin.script_bytes,
+                    U32_LE.unpack_from(txin.sequence_bytes)[0],
+                ))
+            for output_index, txout in enumerate(transaction.outputs):
+                script = txout.script_bytes
+                script_type, address = classify_output_script(script)
+                self._append('outputs', (
+                    txid,
+                    output_index,
+                    txout.satoshis,
+                    script,
+                    script_type,
+                    address,
+                ))
+
+    def flush(self):
+        for name in TABLE_NAMES:
+            self._flush_table(name)
+
+    def close(self):
+        if not self.writers:
+            return
+        self.flush()
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+    def _append(self, name, row):
+        columns = self.columns[name]
+        for column, value in zip(columns.values(), row):
+            column.append(value)
+        if len(column) >= self.row_group_size:
+            self._flush_table(name)
+
+    def _flush_table(self, name):
+        columns = self.columns[name]
+        if not next(iter(columns.values())):
+            return
+        table = pa.Table.from_pydict(columns, schema=self.schemas[name])
+        self.writers[name].write_table(table)
+        for column in columns.values():
+            column.clear()
+
+
+def export_block_files(file_paths, output_dir, row_group_size=ROW_GROUP_SIZE, number_of_blocks=None):
+    # Streams every block of the given blk files, in order, into the Parquet tables
+    block_number = 0
+    with ColumnarWriter(output_dir, row_group_size) as writer:
+        for file_path in file_paths:
+            for magic, block_data in iter_raw_blocks(file_path):
+                if number_of_blocks is not None and block_number >= number_of_blocks:
+                    return block_number
+                writer.add_block(decode_block(block_data, block_number, magic))
+                block_number += 1
+    return block_number
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export Bitcoin blk files as Parquet tables.")
+    parser.add_argument('block_files', nargs='+', help="blk files to export, in chain order")
+    parser.add_argument('-o', '--output-dir', required=True, help="directory for the .parquet files")
+    parser.add_argument('-n', '--number-of-blocks', type=int, default=0,
+                        help="number of blocks to export, 0 exports every block (default: 0)")
+    parser.add_argument('--row-group-size', type=int, default=ROW_GROUP_SIZE,
+                        help=f"rows per Parquet row group (default: {ROW_GROUP_SIZE})")
+    args = parser.parse_args()
+
+    exported = export_block_files(args.block_files, args.output_dir, args.row_group_size,
+                                  args.number_of_blocks or None)
+    print(f"Exported {exported} blocks to {args.output_dir}")
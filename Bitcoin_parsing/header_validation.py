@@ -0,0 +1,98 @@
+from functools import lru_cache
+
+from Parse_block import HEADER_SIZE, double_sha256, iter_raw_blocks
+
+# Highest target mainnet accepts, the expansion of nbits 1d00ffff
+POW_LIMIT = 0x00000000ffff0000000000000000000000000000000000000000000000000000
+
+
+@lru_cache(maxsize=None)
+def bits_to_target(bits):
+    # Expands the compact nbits encoding into the 256 bit target. Only a few
+    # distinct values exist (one per difficulty period), hence the cache.
+    exponent = bits >> 24
+    mantissa = bits & 0x007fffff
+    if bits & 0x00800000 and mantissa:
+        raise ValueError(f"Negative target in nbits {bits:08x}.")
+    if exponent <= 3:
+        target = mantissa >> (8 * (3 - exponent))
+    else:
+        target = mantissa << (8 * (exponent - 3))
+    if target >> 256:
+        raise ValueError(f"Target in nbits {bits:08x} overflows 256 bits.")
+    return target
+
+
+def check_proof_of_work(header, pow_limit=POW_LIMIT):
+    # Returns (is_valid, error_message) for one raw 80 byte header
+    bits = int.from_bytes(header[72:76], 'little')
+    try:
+        target = bits_to_target(bits)
+    except ValueError as error:
+        return False, str(error)
+    if target == 0 or target > pow_limit:
+        return False, f"Target in nbits {bits:08x} is out of range."
+    header_hash = double_sha256(header)
+    if int.from_bytes(header_hash, 'little') > target:
+        return False, f"Hash {header_hash[::-1].hex()} is above the target of nbits {bits:08x}."
+    return True, None
+
+
+def validate_header(header, prev_hash=None, pow_limit=POW_LIMIT):
+    # Checks proof of work and, when 'prev_hash' (raw, internal byte order) is
+    # given, that the header builds on it. Returns (is_valid, error_message).
+    if len(header) < HEADER_SIZE:
+        return False, "Header shorter than 80 bytes."
+    if prev_hash is not None and header[4:36] != prev_hash:
+        return False, f"Previous block hash {bytes(header[4:36])[::-1].hex()} does not match {prev_hash[::-1].hex()}."
+    return check_proof_of_work(header, pow_limit)
+
+
+def validate_headers(headers, prev_hash=None, pow_limit=POW_LIMIT):
+    # Batch mode: 'headers' is either one buffer of concatenated 80 byte headers
+    # (as sent in a headers message) or an iterable of single headers. Each one
+    # must meet its target and link to the one before it.
+    # Returns a list of (index, error_message) for every header that fails.
+    if isinstance(headers, (bytes, bytearray, memoryview)):
+        buf = memoryview(headers)
+        if len(buf) % HEADER_SIZE:
+            raise ValueError("Header buffer length is not a multiple of 80 bytes.")
+        headers = (buf[start:start + HEADER_SIZE] for start in range(0, len(buf), HEADER_SIZE))
+
+    errors = []
+    for index, header in enumerate(headers):
+        header = bytes(header)
+        is_valid, error_message = validate_header(header, prev_hash, pow_limit)
+        if not is_valid:
+            errors.append((index, error_message))
+        prev_hash = double_sha256(header)
+    return errors
+
+
+def validate_block_file(file_path, pow_limit=POW_LIMIT):
+    # Validates the headers of every block in a blk file, in file order
+    headers = (block_data[:HEADER_SIZE] for magic, block_data in iter_raw_blocks(file_path))
+    return validate_headers(headers, pow_limit=pow_limit)
+
+
+def validate_parsed_blocks(blocks, pow_limit=POW_LIMIT):
+    # Same checks for blocks already decoded by Parse_block, using the hex
+    # block_hash, prev_block_hash and nbits fields of their headers
+    errors = []
+    prev_hash = None
+    for index, block in enumerate(blocks):
+        header = block['block_header']
+        if prev_hash is not None and header['prev_block_hash'] != prev_hash:
+            errors.append((index, f"Previous block hash {header['prev_block_hash']} does not match {prev_hash}."))
+        else:
+            try:
+                target = bits_to_target(int(header['nbits'], 16))
+            except ValueError as error:
+                errors.append((index, str(error)))
+            else:
+                if target == 0 or target > pow_limit:
+                    errors.append((index, f"Target in nbits {header['nbits']} is out of range."))
+                elif int(header['block_hash'], 16) > target:
+                    errors.append((index, f"Hash {header['block_hash']} is above the target of nbits {header['nbits']}."))
+        prev_hash = header['block_hash']
+    return errors
@@ -0,0 +1,114 @@
+import hashlib
+from functools import lru_cache
+
+# Output script templates and mainnet address encodings. classify_output_script
+# is cached on the raw script bytes because the same scripts (exchange and
+# pool addresses) show up over and over again in the chain.
+
+SCRIPT_CACHE_SIZE = 1 << 16
+
+P2PKH_VERSION = b'\x00'
+P2SH_VERSION = b'\x05'
+SEGWIT_HRP = 'bc'
+
+OP_0 = 0x00
+OP_1 = 0x51
+OP_16 = 0x60
+OP_RETURN = 0x6a
+OP_DUP = 0x76
+OP_EQUAL = 0x87
+OP_EQUALVERIFY = 0x88
+OP_HASH160 = 0xa9
+OP_CHECKSIG = 0xac
+OP_CHECKMULTISIG = 0xae
+
+BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+BECH32_CHARSET = 'qpzry9x8gf2tvdw0s3jn54khce6mua7l'
+BECH32_GENERATOR = (0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3)
+BECH32_CONST = 1
+BECH32M_CONST = 0x2bc830a3
+
+
+def hash160(data):
+    return hashlib.new('ripemd160', hashlib.sha256(data).digest()).digest()
+
+
+def base58check_encode(version, payload):
+    data = version + payload
+    data += hashlib.sha256(hashlib.sha256(data).digest()).digest()[:4]
+    number = int.from_bytes(data, 'big')
+    encoded = ''
+    while number:
+        number, remainder = divmod(number, 58)
+        encoded = BASE58_ALPHABET[remainder] + encoded
+    # Every leading zero byte is written as a '1'
+    return '1' * (len(data) - len(data.lstrip(b'\x00'))) + encoded
+
+
+def bech32_polymod(values):
+    checksum = 1
+    for value in values:
+        top = checksum >> 25
+        checksum = (checksum & 0x1ffffff) << 5 ^ value
+        for i in range(5):
+            if (top >> i) & 1:
+                checksum ^= BECH32_GENERATOR[i]
+    return checksum
+
+
+def convert_bits(data, from_bits, to_bits):
+    # Regroups 'data' from 'from_bits' to 'to_bits' wide values, padding the end
+    accumulator = 0
+    bits = 0
+    result = []
+    max_value = (1 << to_bits) - 1
+    for value in data:
+        accumulator = (accumulator << from_bits) | value
+        bits += from_bits
+        while bits >= to_bits:
+            bits -= to_bits
+            result.append((accumulator >> bits) & max_value)
+    if bits:
+        result.append((accumulator << (to_bits - bits)) & max_value)
+    return result
+
+
+def segwit_address(witness_version, program, hrp=SEGWIT_HRP):
+    # BIP173 bech32 for version 0 programs, BIP350 bech32m for later versions
+    data = [witness_version] + convert_bits(program, 8, 5)
+    const = BECH32_CONST if witness_version == 0 else BECH32M_CONST
+    hrp_expanded = [ord(char) >> 5 for char in hrp] + [0] + [ord(char) & 31 for char in hrp]
+    polymod = bech32_polymod(hrp_expanded + data + [0] * 6) ^ const
+    checksum = [(polymod >> 5 * (5 - i)) & 31 for i in range(6)]
+    return hrp + '1' + ''.join(BECH32_CHARSET[value] for value in data + checksum)
+
+
+@lru_cache(maxsize=SCRIPT_CACHE_SIZE)
+def classify_output_script(script):
+    # Matches an output script (bytes) against the standard templates and
+    # returns (script_type, address). address is None when the type has none.
+    # P2PK outputs get the P2PKH address of their public key, like most
+    # block explorers show them.
+    length = len(script)
+    if length == 25 and script[0] == OP_DUP and script[1] == OP_HASH160 and script[2] == 20 \
+            and script[23] == OP_EQUALVERIFY and script[24] == OP_CHECKSIG:
+        return 'p2pkh', base58check_encode(P2PKH_VERSION, script[3:23])
+    if length == 23 and script[0] == OP_HASH160 and script[1] == 20 and script[22] == OP_EQUAL:
+        return 'p2sh', base58check_encode(P2SH_VERSION, script[2:22])
+    if length == 22 and script[0] == OP_0 and script[1] == 20:
+        return 'p2wpkh', segwit_address(0, script[2:])
+    if length == 34 and script[0] == OP_0 and script[1] == 32:
+        return 'p2wsh', segwit_address(0, script[2:])
+    if length == 34 and script[0] == OP_1 and script[1] == 32:
+        return 'p2tr', segwit_address(1, script[2:])
+    if 4 <= length <= 42 and OP_1 <= script[0] <= OP_16 and script[1] == length - 2:
+        return 'witness_unknown', segwit_address(script[0] - OP_1 + 1, script[2:])
+    if (length == 35 and script[0] == 33 and script[1] in (2, 3) or length == 67 and script[0] == 65
+            and script[1] == 4) and script[-1] == OP_CHECKSIG:
+        return 'p2pk', base58check_encode(P2PKH_VERSION, hash160(script[1:-1]))
+    if length and script[0] == OP_RETURN:
+        return 'op_return', None
+    if length >= 3 and script[-1] == OP_CHECKMULTISIG and OP_1 <= script[0] <= OP_16 \
+            and OP_1 <= script[-2] <= OP_16:
+        return 'multisig', None
+    return 'nonstandard', None
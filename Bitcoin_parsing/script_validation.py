@@ -0,0 +1,733 @@
+#!/usr/bin/python3
+
+import sys
+import time
+import hashlib
+import argparse
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+
+from Parse_block import U32_LE, U64_LE, compact_size, double_sha256
+from block_objects import decode_block, decode_transaction
+from block_reader import BlockchainReader
+from script_types import hash160
+from utxo_set import UtxoSet, OUTPOINT_INDEX
+
+# ecdsa is only needed to check signatures, the rest of the parser works without it
+try:
+    from ecdsa import SECP256k1, VerifyingKey
+    from ecdsa.ecdsa import Signature
+except ImportError:
+    VerifyingKey = None
+
+# Script execution and signature checks for the inputs of parsed blocks,
+# against the coins they spend (usually from utxo_set.UtxoSet).
+#
+# eval_script is a small interpreter for the opcodes that standard scripts
+# use: pushes, flow control, stack and hash operations, OP_CHECKSIG and
+# OP_CHECKMULTISIG. P2PK, P2PKH, bare multisig, P2SH, P2WPKH and P2WSH spends
+# (nested in P2SH or not) are checked end to end. Lock time opcodes run as
+# NOPs, and taproot spends or scripts using other opcodes are reported as
+# unchecked rather than as failures.
+#
+# Signature hashes are computed with a SighashCache per transaction, which
+# keeps the serialized outputs and the BIP143 hashPrevouts, hashSequence and
+# hashOutputs, so they are built once instead of once per input. Whole
+# transactions are the unit of work for the process pool: a worker gets the
+# raw transaction and its spent coins and checks every input.
+
+P2SH_HEIGHT = 173805  # First block enforcing BIP16
+SEGWIT_HEIGHT = 481824  # First block enforcing BIP141/BIP143
+JOB_CHUNK_SIZE = 16  # Transactions sent to a worker at a time
+PUBKEY_CACHE_SIZE = 1 << 14
+
+SIGHASH_ALL = 0x01
+SIGHASH_NONE = 0x02
+SIGHASH_SINGLE = 0x03
+SIGHASH_ANYONECANPAY = 0x80
+# Signed instead of a real hash for SIGHASH_SINGLE without a matching output
+SIGHASH_ONE = b'\x01' + bytes(31)
+ZERO_HASH = bytes(32)
+ZERO_SEQUENCE = bytes(4)
+NULL_OUTPUT = b'\xff' * 8 + b'\x00'  # satoshis -1 and an empty script
+
+OP_0 = 0x00
+OP_PUSHDATA1 = 0x4c
+OP_PUSHDATA2 = 0x4d
+OP_PUSHDATA4 = 0x4e
+OP_1NEGATE = 0x4f
+OP_1 = 0x51
+OP_16 = 0x60
+OP_NOP = 0x61
+OP_IF = 0x63
+OP_NOTIF = 0x64
+OP_ELSE = 0x67
+OP_ENDIF = 0x68
+OP_VERIFY = 0x69
+OP_RETURN = 0x6a
+OP_TOALTSTACK = 0x6b
+OP_FROMALTSTACK = 0x6c
+OP_2DROP = 0x6d
+OP_2DUP = 0x6e
+OP_IFDUP = 0x73
+OP_DEPTH = 0x74
+OP_DROP = 0x75
+OP_DUP = 0x76
+OP_NIP = 0x77
+OP_OVER = 0x78
+OP_SWAP = 0x7c
+OP_SIZE = 0x82
+OP_EQUAL = 0x87
+OP_EQUALVERIFY = 0x88
+OP_RIPEMD160 = 0xa6
+OP_SHA1 = 0xa7
+OP_SHA256 = 0xa8
+OP_HASH160 = 0xa9
+OP_HASH256 = 0xaa
+OP_CODESEPARATOR = 0xab
+OP_CHECKSIG = 0xac
+OP_CHECKSIGVERIFY = 0xad
+OP_CHECKMULTISIG = 0xae
+OP_CHECKMULTISIGVERIFY = 0xaf
+OP_NOP1 = 0xb0  # OP_NOP2 and OP_NOP3 are CHECKLOCKTIMEVERIFY and CHECKSEQUENCEVERIFY
+OP_NOP10 = 0xb9
+
+MAX_PUBKEYS_PER_MULTISIG = 20
+
+
+class UnsupportedScript(Exception):
+    # A script this module cannot evaluate (e.g. an opcode outside the
+    # standard set). The input is reported as unchecked, not as invalid.
+    pass
+
+
+def push_data(data):
+    # Smallest push of 'data', as a script would encode it
+    size = len(data)
+    if size < OP_PUSHDATA1:
+        return bytes([size]) + data
+    if size <= 0xff:
+        return bytes([OP_PUSHDATA1, size]) + data
+    if size <= 0xffff:
+        return bytes([OP_PUSHDATA2]) + size.to_bytes(2, 'little') + data
+    return bytes([OP_PUSHDATA4]) + size.to_bytes(4, 'little') + data
+
+
+def iter_script_ops(script):
+    # Yields (opcode, pushed bytes or None, offset after the op)
+    offset = 0
+    size = len(script)
+    while offset < size:
+        opcode = script[offset]
+        offset += 1
+        if opcode > OP_PUSHDATA4:
+            yield opcode, None, offset
+            continue
+        if opcode < OP_PUSHDATA1:
+            length = opcode
+        else:
+            width = {OP_PUSHDATA1: 1, OP_PUSHDATA2: 2, OP_PUSHDATA4: 4}[opcode]
+            if offset + width > size:
+                raise ValueError("Push length past the end of the script.")
+            length = int.from_bytes(script[offset:offset + width], 'little')
+            offset += width
+        if offset + length > size:
+            raise ValueError("Push past the end of the script.")
+        yield opcode, bytes(script[offset:offset + length]), offset + length
+        offset += length
+
+
+def is_push_only(script):
+    try:
+        return all(opcode <= OP_16 for opcode, _, _ in iter_script_ops(script))
+    except ValueError:
+        return False
+
+
+def is_p2sh(script):
+    return len(script) == 23 and script[0] == OP_HASH160 and script[1] == 20 and script[22] == OP_EQUAL
+
+
+def witness_program(script):
+    # Returns (version, program) for a segwit output script, otherwise None
+    if 4 <= len(script) <= 42 and script[1] + 2 == len(script):
+        if script[0] == OP_0:
+            return 0, bytes(script[2:])
+        if OP_1 <= script[0] <= OP_16:
+            return script[0] - OP_1 + 1, bytes(script[2:])
+    return None
+
+
+def find_and_delete(script, data):
+    # Legacy script codes drop every push of the signature being checked
+    target = push_data(data)
+    kept = []
+    start = 0
+    try:
+        for _, _, end in iter_script_ops(script):
+            if script[start:end] != target:
+                kept.append(script[start:end])
+            start = end
+    except ValueError:
+        return script
+    return b''.join(kept)
+
+
+def strip_code_separators(script):
+    # Legacy script codes are signed without their OP_CODESEPARATORs
+    kept = []
+    start = 0
+    try:
+        for opcode, _, end in iter_script_ops(script):
+            if opcode != OP_CODESEPARATOR:
+                kept.append(script[start:end])
+            start = end
+    except ValueError:
+        return script
+    return b''.join(kept)
+
+
+def cast_to_bool(data):
+    for position, byte in enumerate(data):
+        if byte:
+            # Negative zero is false
+            return not (position == len(data) - 1 and byte == 0x80)
+    return False
+
+
+def decode_num(data):
+    # Script numbers are little endian with a sign bit
+    if not data:
+        return 0
+    value = int.from_bytes(data, 'little')
+    if data[-1] & 0x80:
+        return -(value & ~(0x80 << 8 * (len(data) - 1)))
+    return value
+
+
+def encode_num(value):
+    if value == 0:
+        return b''
+    negative = value < 0
+    value = abs(value)
+    data = bytearray()
+    while value:
+        data.append(value & 0xff)
+        value >>= 8
+    if data[-1] & 0x80:
+        data.append(0x80 if negative else 0)
+    elif negative:
+        data[-1] |= 0x80
+    return bytes(data)
+
+
+def parse_der_signature(der):
+    # Returns (r, s). Lenient about length encodings like OpenSSL was before
+    # BIP66, so signatures from early blocks still decode.
+    try:
+        if der[0] != 0x30:
+            raise ValueError("Signature is not a DER sequence.")
+        offset = 2 + (der[1] & 0x7f if der[1] & 0x80 else 0)
+        values = []
+        for _ in range(2):
+            if der[offset] != 0x02:
+                raise ValueError("Signature value is not a DER integer.")
+            length = der[offset + 1]
+            offset += 2
+            if length & 0x80:
+                width = length & 0x7f
+                length = int.from_bytes(der[offset:offset + width], 'big')
+                offset += width
+            if offset + length > len(der):
+                raise ValueError("Signature integer past the end of the signature.")
+            values.append(int.from_bytes(der[offset:offset + length], 'big'))
+            offset += length
+    except IndexError:
+        raise ValueError("Truncated signature.")
+    return values
+
+
+@lru_cache(maxsize=PUBKEY_CACHE_SIZE)
+def load_public_key(pubkey):
+    # Decoding a compressed key costs a square root, and keys are reused a lot
+    try:
+        return VerifyingKey.from_string(pubkey, curve=SECP256k1).pubkey
+    except (ValueError, AssertionError):
+        return None
+
+
+def verify_ecdsa(pubkey, der, digest):
+    if VerifyingKey is None:
+        raise ImportError("Signature checks need the ecdsa package: pip install ecdsa")
+    point = load_public_key(bytes(pubkey))
+    if point is None:
+        return False
+    try:
+        r, s = parse_der_signature(der)
+    except ValueError:
+        return False
+    return point.verifies(int.from_bytes(digest, 'big'), Signature(r, s))
+
+
+class SighashCache:
+    # Signature hashes for the inputs of one block_objects.Tx. The parts shared
+    # by every input are computed on first use and kept.
+    def __init__(self, tx):
+        self.tx = tx
+        self._outputs = None
+        self._hash_prevouts = None
+        self._hash_sequence = None
+        self._hash_outputs = None
+
+    @property
+    def outputs(self):
+        # Output count and serialized outputs, as in the transaction
+        if self._outputs is None:
+            self._outputs = compact_size(len(self.tx.outputs)) + b''.join(txout.raw for txout in self.tx.outputs)
+        return self._outputs
+
+    @property
+    def hash_prevouts(self):
+        if self._hash_prevouts is None:
+            self._hash_prevouts = double_sha256(b''.join(txin.outpoint for txin in self.tx.inputs))
+        return self._hash_prevouts
+
+    @property
+    def hash_sequence(self):
+        if self._hash_sequence is None:
+            self._hash_sequence = double_sha256(b''.join(txin.sequence_bytes for txin in self.tx.inputs))
+        return self._hash_sequence
+
+    @property
+    def hash_outputs(self):
+        if self._hash_outputs is None:
+            self._hash_outputs = double_sha256(self.outputs[len(compact_size(len(self.tx.outputs))):])
+        return self._hash_outputs
+
+    def legacy_sighash(self, index, script_code, hash_type):
+        tx = self.tx
+        base_type = hash_type & 0x1f
+        if base_type == SIGHASH_SINGLE and index >= len(tx.outputs):
+            return SIGHASH_ONE
+        raw = tx.raw
+        if hash_type & SIGHASH_ANYONECANPAY:
+            inputs = [(index, tx.inputs[index])]
+        else:
+            inputs = enumerate(tx.inputs)
+        parts = [raw[:4], compact_size(1 if hash_type & SIGHASH_ANYONECANPAY else len(tx.inputs))]
+        for position, txin in inputs:
+            parts.append(txin.outpoint)
+            if position == index:
+                parts.append(compact_size(len(script_code)) + script_code)
+                parts.append(txin.sequence_bytes)
+            elif base_type in (SIGHASH_NONE, SIGHASH_SINGLE):
+                parts.append(b'\x00' + ZERO_SEQUENCE)
+            else:
+                parts.append(b'\x00' + txin.sequence_bytes)
+
+        if base_type == SIGHASH_NONE:
+            parts.append(b'\x00')
+        elif base_type == SIGHASH_SINGLE:
+            parts.append(compact_size(index + 1) + NULL_OUTPUT * index + tx.outputs[index].raw)
+        else:
+            parts.append(self.outputs)
+        parts.append(raw[-4:])
+        parts.append(U32_LE.pack(hash_type))
+        return double_sha256(b''.join(parts))
+
+    def segwit_sighash(self, index, script_code, amount, hash_type):
+        # BIP143 version 0 witness signature hash
+        tx = self.tx
+        base_type = hash_type & 0x1f
+        anyone_can_pay = hash_type & SIGHASH_ANYONECANPAY
+        single_or_none = base_type in (SIGHASH_SINGLE, SIGHASH_NONE)
+
+        hash_prevouts = ZERO_HASH if anyone_can_pay else self.hash_prevouts
+        hash_sequence = ZERO_HASH if anyone_can_pay or single_or_none else self.hash_sequence
+        if not single_or_none:
+            hash_outputs = self.hash_outputs
+        elif base_type == SIGHASH_SINGLE and index < len(tx.outputs):
+            hash_outputs = double_sha256(tx.outputs[index].raw)
+        else:
+            hash_outputs = ZERO_HASH
+
+        raw = tx.raw
+        txin = tx.inputs[index]
+        return double_sha256(b''.join([
+            raw[:4], hash_prevouts, hash_sequence, txin.outpoint,
+            compact_size(len(script_code)), script_code, U64_LE.pack(amount), txin.sequence_bytes,
+            hash_outputs, raw[-4:], U32_LE.pack(hash_type)
+        ]))
+
+
+def legacy_checker(cache, index):
+    # 'signatures' are all the signatures of the opcode being run, each of
+    # them is removed from the script code before any is checked
+    def check(signature, pubkey, script_code, signatures=None):
+        if not signature:
+            return False
+        for removed in signatures or (signature,):
+            script_code = find_and_delete(script_code, removed)
+        script_code = strip_code_separators(script_code)
+        return verify_ecdsa(pubkey, signature[:-1], cache.legacy_sighash(index, script_code, signature[-1]))
+    return check
+
+
+def witness_checker(cache, index, amount):
+    def check(signature, pubkey, script_code, signatures=None):
+        if not signature:
+            return False
+        return verify_ecdsa(pubkey, signature[:-1], cache.segwit_sighash(index, script_code, amount, signature[-1]))
+    return check
+
+
+def pop(stack):
+    if not stack:
+        raise ValueError("Stack underflow.")
+    return stack.pop()
+
+
+def peek(stack):
+    if not stack:
+        raise ValueError("Stack underflow.")
+    return stack[-1]
+
+
+def eval_script(script, stack, check_signature):
+    # Runs 'script' on 'stack' (a list of bytes, top last). 'check_signature'
+    # is called as (signature, pubkey, script_code) and, for OP_CHECKMULTISIG,
+    # with all of the opcode's signatures as a fourth argument. Raises ValueError when
+    # the script fails and UnsupportedScript for opcodes outside the
+    # standard set.
+    script = bytes(script)
+    alt_stack = []
+    branches = []  # One flag per open OP_IF, True while its branch runs
+    code_start = 0  # Script code starts after the last OP_CODESEPARATOR
+    for opcode, data, end in iter_script_ops(script):
+        executing = all(branches)
+        if opcode in (OP_IF, OP_NOTIF):
+            value = False
+            if executing:
+                value = cast_to_bool(pop(stack)) != (opcode == OP_NOTIF)
+            branches.append(value)
+            continue
+        if opcode == OP_ELSE:
+            if not branches:
+                raise ValueError("OP_ELSE without OP_IF.")
+            branches[-1] = not branches[-1]
+            continue
+        if opcode == OP_ENDIF:
+            if not branches:
+                raise ValueError("OP_ENDIF without OP_IF.")
+            branches.pop()
+            continue
+        if not executing:
+            continue
+
+        if data is not None:
+            stack.append(data)
+        elif opcode == OP_1NEGATE or OP_1 <= opcode <= OP_16:
+            stack.append(encode_num(-1 if opcode == OP_1NEGATE else opcode - OP_1 + 1))
+        elif opcode == OP_NOP or OP_NOP1 <= opcode <= OP_NOP10:
+            pass  # Lock times are not checked
+        elif opcode == OP_VERIFY:
+            if not cast_to_bool(pop(stack)):
+                raise ValueError("OP_VERIFY failed.")
+        elif opcode == OP_RETURN:
+            raise ValueError("OP_RETURN executed.")
+        elif opcode == OP_TOALTSTACK:
+            alt_stack.append(pop(stack))
+        elif opcode == OP_FROMALTSTACK:
+            stack.append(pop(alt_stack))
+        elif opcode == OP_2DROP:
+            pop(stack)
+            pop(stack)
+        elif opcode == OP_2DUP:
+            if len(stack) < 2:
+                raise ValueError("Stack underflow.")
+            stack.extend(stack[-2:])
+        elif opcode == OP_IFDUP:
+            if cast_to_bool(peek(stack)):
+                stack.append(stack[-1])
+        elif opcode == OP_DEPTH:
+            stack.append(encode_num(len(stack)))
+        elif opcode == OP_DROP:
+            pop(stack)
+        elif opcode == OP_DUP:
+            stack.append(peek(stack))
+        elif opcode == OP_NIP:
+            top = pop(stack)
+            pop(stack)
+            stack.append(top)
+        elif opcode == OP_OVER:
+            if len(stack) < 2:
+                raise ValueError("Stack underflow.")
+            stack.append(stack[-2])
+        elif opcode == OP_SWAP:
+            top = pop(stack)
+            second = pop(stack)
+            stack.extend((top, second))
+        elif opcode == OP_SIZE:
+            stack.append(encode_num(len(peek(stack))))
+        elif opcode in (OP_EQUAL, OP_EQUALVERIFY):
+            equal = pop(stack) == pop(stack)
+            if opcode == OP_EQUALVERIFY:
+                if not equal:
+                    raise ValueError("OP_EQUALVERIFY failed.")
+            else:
+                stack.append(b'\x01' if equal else b'')
+        elif opcode == OP_RIPEMD160:
+            stack.append(hashlib.new('ripemd160', pop(stack)).digest())
+        elif opcode == OP_SHA1:
+            stack.append(hashlib.sha1(pop(stack)).digest())
+        elif opcode == OP_SHA256:
+            stack.append(hashlib.sha256(pop(stack)).digest())
+        elif opcode == OP_HASH160:
+            stack.append(hash160(pop(stack)))
+        elif opcode == OP_HASH256:
+            stack.append(double_sha256(pop(stack)))
+        elif opcode == OP_CODESEPARATOR:
+            code_start = end
+        elif opcode in (OP_CHECKSIG, OP_CHECKSIGVERIFY):
+            pubkey = pop(stack)
+            signature = pop(stack)
+            valid = check_signature(signature, pubkey, script[code_start:])
+            if opcode == OP_CHECKSIGVERIFY:
+                if not valid:
+                    raise ValueError("OP_CHECKSIGVERIFY failed.")
+            else:
+                stack.append(b'\x01' if valid else b'')
+        elif opcode in (OP_CHECKMULTISIG, OP_CHECKMULTISIGVERIFY):
+            valid = check_multisig(stack, check_signature, script[code_start:])
+            if opcode == OP_CHECKMULTISIGVERIFY:
+                if not valid:
+                    raise ValueError("OP_CHECKMULTISIGVERIFY failed.")
+            else:
+                stack.append(b'\x01' if valid else b'')
+        else:
+            raise UnsupportedScript(f"Opcode 0x{opcode:02x} is not implemented.")
+
+    if branches:
+        raise ValueError("Unbalanced OP_IF.")
+    return stack
+
+
+def check_multisig(stack, check_signature, script_code):
+    # Stack: dummy, m signatures, m, n public keys, n (top)
+    key_count = decode_num(pop(stack))
+    if not 0 <= key_count <= MAX_PUBKEYS_PER_MULTISIG:
+        raise ValueError("Bad OP_CHECKMULTISIG key count.")
+    pubkeys = [pop(stack) for _ in range(key_count)][::-1]
+    signature_count = decode_num(pop(stack))
+    if not 0 <= signature_count <= key_count:
+        raise ValueError("Bad OP_CHECKMULTISIG signature count.")
+    signatures = [pop(stack) for _ in range(signature_count)][::-1]
+    pop(stack)  # The extra item consumed by the original off by one bug
+
+    # Signatures have to appear in the same order as their keys
+    signature_index = key_index = 0
+    while signature_index < signature_count:
+        if check_signature(signatures[signature_index], pubkeys[key_index], script_code, signatures):
+            signature_index += 1
+        key_index += 1
+        if signature_count - signature_index > key_count - key_index:
+            return False
+    return True
+
+
+def verify_witness(cache, index, amount, version, program, witness):
+    if version == 0:
+        if len(program) == 20:
+            if len(witness) != 2:
+                return False, "P2WPKH witness must have 2 items."
+            script = bytes([OP_DUP, OP_HASH160, 20]) + program + bytes([OP_EQUALVERIFY, OP_CHECKSIG])
+            stack = list(witness)
+        elif len(program) == 32:
+            if not witness:
+                return False, "Empty P2WSH witness."
+            script = witness[-1]
+            if hashlib.sha256(script).digest() != program:
+                return False, "Witness script does not match the program."
+            stack = list(witness[:-1])
+        else:
+            return False, "Version 0 witness program of the wrong length."
+        eval_script(script, stack, witness_checker(cache, index, amount))
+        if len(stack) != 1 or not cast_to_bool(stack[0]):
+            return False, "Witness script did not leave a single true value."
+        return True, None
+    if version == 1 and len(program) == 32:
+        return None, "Taproot spends are not checked."
+    return True, None  # Unused witness versions are anyone can spend
+
+
+def verify_input(cache, index, amount, script_pubkey, height=None):
+    # Checks input 'index' of cache.tx spending 'amount' satoshis locked by
+    # 'script_pubkey'. 'height' selects which soft forks apply, None means all.
+    # Returns (True, None), (False, error) or (None, reason) for spends this
+    # module does not check.
+    try:
+        return _verify_input(cache, index, amount, bytes(script_pubkey), height)
+    except ValueError as error:
+        return False, str(error)
+    except UnsupportedScript as error:
+        return None, str(error)
+
+
+def _verify_input(cache, index, amount, script_pubkey, height):
+    txin = cache.tx.inputs[index]
+    script_sig = bytes(txin.script_bytes)
+    witness = txin.witness
+    p2sh_active = height is None or height >= P2SH_HEIGHT
+    segwit_active = height is None or height >= SEGWIT_HEIGHT
+    checker = legacy_checker(cache, index)
+
+    stack = eval_script(script_sig, [], checker)
+    p2sh_stack = list(stack)
+    eval_script(script_pubkey, stack, checker)
+    if not stack or not cast_to_bool(stack[-1]):
+        return False, "Script evaluated to false."
+
+    program = witness_program(script_pubkey) if segwit_active else None
+    if program:
+        if script_sig:
+            return False, "Native witness spend with a scriptSig."
+        return verify_witness(cache, index, amount, *program, witness)
+
+    if p2sh_active and is_p2sh(script_pubkey):
+        if not is_push_only(script_sig):
+            return False, "P2SH scriptSig is not push only."
+        redeem_script = p2sh_stack.pop()
+        eval_script(redeem_script, p2sh_stack, checker)
+        if not p2sh_stack or not cast_to_bool(p2sh_stack[-1]):
+            return False, "Redeem script evaluated to false."
+        program = witness_program(redeem_script) if segwit_active else None
+        if program:
+            if script_sig != push_data(redeem_script):
+                return False, "Nested witness spend with extra scriptSig data."
+            return verify_witness(cache, index, amount, *program, witness)
+
+    if segwit_active and witness:
+        return False, "Witness on an input that does not spend a witness program."
+    return True, None
+
+
+def verify_transaction(raw_tx, coins, height=None):
+    # 'coins' holds (satoshis, script_pubkey) for every input in order.
+    # Returns (checked, unchecked, errors) with errors as [(input_index, message)].
+    tx, _ = decode_transaction(bytes(raw_tx), 0)
+    cache = SighashCache(tx)
+    checked = unchecked = 0
+    errors = []
+    for index, (amount, script_pubkey) in enumerate(coins):
+        is_valid, message = verify_input(cache, index, amount, script_pubkey, height)
+        if is_valid is None:
+            unchecked += 1
+        else:
+            checked += 1
+            if not is_valid:
+                errors.append((index, message))
+    return checked, unchecked, errors
+
+
+def verify_transaction_job(job):
+    # Process pool entry point: (tx_index, raw_tx, coins, height)
+    tx_index, raw_tx, coins, height = job
+    return (tx_index,) + verify_transaction(raw_tx, coins, height)
+
+
+def collect_transaction_jobs(block, get_coin, height=None):
+    # Pairs every non-coinbase transaction of a block_objects.Block with the
+    # coins it spends. 'get_coin' takes a 36 byte outpoint and returns the
+    # utxo_set.decode_coin tuple or None; outputs created earlier in the same
+    # block are found without it. Returns (jobs, errors).
+    created = {}
+    spent = set()
+    jobs = []
+    errors = []
+    for tx_index, transaction in enumerate(block.transactions):
+        if tx_index:
+            coins = []
+            for input_index, txin in enumerate(transaction.inputs):
+                outpoint = bytes(txin.outpoint)
+                coin = created.pop(outpoint, None)
+                if coin is None and outpoint not in spent:
+                    coin = get_coin(outpoint)
+                if coin is None:
+                    errors.append((tx_index, input_index, "Spends a missing or already spent output."))
+                    continue
+                spent.add(outpoint)
+                coins.append((coin[0], coin[3]))
+            if len(coins) == len(transaction.inputs):
+                jobs.append((tx_index, bytes(transaction.raw), coins, height))
+
+        txid = transaction.txid_bytes
+        for index, txout in enumerate(transaction.outputs):
+            created[txid + OUTPOINT_INDEX.pack(index)] = (txout.satoshis, height, tx_index == 0, txout.script_bytes)
+    return jobs, errors
+
+
+def validate_block_scripts(block, get_coin, height=None, executor=None):
+    # Checks every input script of a block, in 'executor' (a process pool)
+    # when given. Returns a report with the checked and unchecked input counts
+    # and the errors as [(tx_index, input_index, message)].
+    jobs, errors = collect_transaction_jobs(block, get_coin, height)
+    if executor is None:
+        results = map(verify_transaction_job, jobs)
+    else:
+        results = executor.map(verify_transaction_job, jobs, chunksize=JOB_CHUNK_SIZE)
+
+    checked = unchecked = 0
+    for tx_index, tx_checked, tx_unchecked, tx_errors in results:
+        checked += tx_checked
+        unchecked += tx_unchecked
+        errors.extend((tx_index, input_index, message) for input_index, message in tx_errors)
+    errors.sort()
+    return {'height': height, 'block_hash': block.block_hash, 'inputs_checked': checked,
+            'inputs_unchecked': unchecked, 'errors': errors}
+
+
+def validate_chain(reader, utxo_set, max_height=None, workers=None):
+    # Follows the most-work chain of a block_reader.BlockchainReader like
+    # UtxoSet.sync_from_reader, checking each block's scripts against the set
+    # before applying it. Yields one report per block and stops at the first
+    # block with errors, leaving the set at the block before it.
+    utxo_set.disconnect_stale(reader)
+    target = reader.height if max_height is None else min(max_height, reader.height)
+    executor = ProcessPoolExecutor(max_workers=workers) if workers != 1 else None
+    try:
+        for height in range(utxo_set.height + 1, target + 1):
+            block_hash = reader.get_block_hash(height)
+            block = decode_block(reader.get_raw_block(block_hash), height)
+            report = validate_block_scripts(block, utxo_set.get_coin, height, executor)
+            yield report
+            if report['errors']:
+                return
+            utxo_set.apply_block(block, block_hash)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the input scripts and signatures of the chain in a blocks directory.")
+    parser.add_argument('data_dir', help="directory holding the blkNNNNN.dat files")
+    parser.add_argument('--utxo-db', default='utxo.db', help="UTXO set database, created if missing (default: utxo.db)")
+    parser.add_argument('-n', '--max-height', type=int, default=None, help="last height to validate (default: tip)")
+    parser.add_argument('-j', '--workers', type=int, default=0,
+                        help="worker processes, 0 uses one per CPU (default: 0)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    checked = unchecked = blocks = 0
+    failed = False
+    with UtxoSet(args.utxo_db) as utxo_set, BlockchainReader(args.data_dir) as reader:
+        for report in validate_chain(reader, utxo_set, args.max_height, args.workers or None):
+            blocks += 1
+            checked += report['inputs_checked']
+            unchecked += report['inputs_unchecked']
+            for tx_index, input_index, message in report['errors']:
+                failed = True
+                print(f"Block {report['height']} {report['block_hash']} tx {tx_index} input {input_index}: {message}")
+    print(f"{blocks} blocks, {checked} inputs checked, {unchecked} unchecked, {time.perf_counter() - start:.3f}s")
+    if failed:
+        sys.exit(1)
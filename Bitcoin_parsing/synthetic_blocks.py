@@ -0,0 +1,94 @@
+import random
+import struct
+
+from Parse_block import BLOCK_MAGIC, compact_size, double_sha256, merkle_root
+
+# Offline generator of large, valid-looking blocks for tests and benchmarks.
+# Transactions mix legacy and SegWit layouts, standard and oversized scripts
+# and input/output counts of 253 or more, so CompactSize prefixes and witness
+# parsing get exercised. Merkle roots are correct, proof of work is not.
+
+REGTEST_BITS = 0x207fffff
+
+
+def serialize_transaction(inputs, outputs, witnesses=None, version=2, lock_time=0):
+    # inputs: (prev txid bytes, index, script, sequence), outputs: (satoshis, script),
+    # witnesses: one list of items per input, or None for a legacy transaction.
+    # Returns (raw transaction, txid digest).
+    body = compact_size(len(inputs))
+    for prev_hash, index, script, sequence in inputs:
+        body += prev_hash + struct.pack('<I', index) + compact_size(len(script)) + script + struct.pack('<I', sequence)
+    body += compact_size(len(outputs))
+    for satoshis, script in outputs:
+        body += struct.pack('<Q', satoshis) + compact_size(len(script)) + script
+    head = struct.pack('<I', version)
+    tail = struct.pack('<I', lock_time)
+    txid = double_sha256(head + body + tail)
+    if witnesses is None:
+        return head + body + tail, txid
+    witness_data = b''.join(compact_size(len(stack)) + b''.join(compact_size(len(item)) + item for item in stack)
+                            for stack in witnesses)
+    return head + b'\x00\x01' + body + witness_data + tail, txid
+
+
+def random_output_script(rng, large_script_ratio):
+    kind = rng.random()
+    if kind < large_script_ratio:
+        return bytes([0x6a]) + rng.randbytes(rng.randint(300, 10000))
+    if kind < 0.4:
+        return b'\x00\x14' + rng.randbytes(20)
+    if kind < 0.7:
+        return b'\x76\xa9\x14' + rng.randbytes(20) + b'\x88\xac'
+    if kind < 0.85:
+        return b'\xa9\x14' + rng.randbytes(20) + b'\x87'
+    return b'\x51\x20' + rng.randbytes(32)
+
+
+def random_transaction(rng, segwit_ratio=0.5, large_count_ratio=0.01, large_script_ratio=0.01):
+    many = rng.random() < large_count_ratio
+    input_count = rng.randint(253, 400) if many else rng.randint(1, 3)
+    output_count = rng.randint(253, 400) if many else rng.randint(1, 3)
+    segwit = rng.random() < segwit_ratio
+    inputs = []
+    for _ in range(input_count):
+        if segwit:
+            script = b''
+        elif rng.random() < large_script_ratio:
+            script = rng.randbytes(rng.randint(300, 10000))
+        else:
+            script = rng.randbytes(rng.randint(105, 107))  # Signature and public key pushes
+        inputs.append((rng.randbytes(32), rng.randint(0, 5), script, 0xffffffff))
+    outputs = [(rng.randint(546, 10 ** 10), random_output_script(rng, large_script_ratio)) for _ in range(output_count)]
+    witnesses = [[rng.randbytes(72), rng.randbytes(33)] for _ in range(input_count)] if segwit else None
+    return serialize_transaction(inputs, outputs, witnesses)
+
+
+def build_block(prev_hash, transaction_count, rng, timestamp=1700000000, **transaction_options):
+    # Returns (block bytes without magic and size, header hash digest)
+    coinbase, coinbase_txid = serialize_transaction(
+        [(bytes(32), 0xffffffff, rng.randbytes(40), 0xffffffff)],
+        [(625000000, b'\x00\x14' + rng.randbytes(20))])
+    transactions = [coinbase]
+    txids = [coinbase_txid]
+    for _ in range(transaction_count - 1):
+        raw, txid = random_transaction(rng, **transaction_options)
+        transactions.append(raw)
+        txids.append(txid)
+    header = struct.pack('<I32s32sIII', 0x20000000, prev_hash, merkle_root(txids), timestamp, REGTEST_BITS,
+                         rng.getrandbits(32))
+    return header + compact_size(len(transactions)) + b''.join(transactions), double_sha256(header)
+
+
+def write_block_file(path, block_count, transactions_per_block, seed=0, padding=0, **transaction_options):
+    # Writes a blk file of chained synthetic blocks, returns its size in bytes
+    rng = random.Random(seed)
+    prev_hash = bytes(32)
+    size = 0
+    with open(path, 'wb') as block_file:
+        for height in range(block_count):
+            block_data, prev_hash = build_block(prev_hash, transactions_per_block, rng, 1700000000 + 600 * height,
+                                                **transaction_options)
+            block_file.write(BLOCK_MAGIC + struct.pack('<I', len(block_data)) + block_data)
+            size += 8 + len(block_data)
+        block_file.write(bytes(padding))
+    return size + padding
@@ -0,0 +1,52 @@
+import pytest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Parse_block import iter_block_headers, iter_blocks
+from benchmark import MODES, compare_results, measure_mode, run_benchmarks
+from synthetic_blocks import write_block_file
+
+
+@pytest.fixture(scope='module')
+def block_file(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('synthetic') / 'blk00000.dat')
+    write_block_file(path, 3, 300, seed=7, padding=4096, large_count_ratio=0.02, large_script_ratio=0.02)
+    return path
+
+
+def test_synthetic_blocks_parse(block_file):
+    blocks = list(iter_blocks(block_file, verify_merkle=True))
+    assert len(blocks) == 3
+    assert all(block['transaction_count'] == 300 for block in blocks)
+    transactions = [tx for block in blocks for tx in block['transactions']]
+    assert any('wtxid' in tx for tx in transactions)
+    assert any(len(tx['txn_inputs']) >= 253 for tx in transactions)
+    assert any(output['output_script_size'] >= 253 for tx in transactions for output in tx['txn_outputs'])
+    # Blocks are chained
+    assert blocks[1]['block_header']['prev_block_hash'] == blocks[0]['block_header']['block_hash']
+
+
+def test_synthetic_headers_only(block_file):
+    assert [header['transaction_count'] for header in iter_block_headers(block_file)] == [300, 300, 300]
+
+
+@pytest.mark.parametrize("mode", sorted(set(MODES) - {'parallel'}))
+def test_measure_mode(block_file, mode):
+    result = measure_mode(mode, block_file, workers=1)
+    assert result['blocks'] == 3
+    assert result['blocks_per_sec'] > 0
+    assert result['mb_per_sec'] > 0
+
+
+def test_run_benchmarks(block_file):
+    results = run_benchmarks(block_file, ['headers_only', 'parallel'], workers=2)
+    assert set(results['results']) == {'headers_only', 'parallel'}
+    assert results['file_size'] == os.path.getsize(block_file)
+
+
+def test_compare_results():
+    baseline = {'results': {'iter_blocks': {'blocks_per_sec': 100.0}, 'headers_only': {'blocks_per_sec': 0.0}}}
+    current = {'results': {'iter_blocks': {'blocks_per_sec': 80.0}, 'headers_only': {'blocks_per_sec': 5.0},
+                           'ndjson': {'blocks_per_sec': 1.0}}}
+    assert compare_results(current, baseline, tolerance=0.25) == []
+    assert len(compare_results(current, baseline, tolerance=0.1)) == 1
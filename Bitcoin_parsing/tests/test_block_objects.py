@@ -0,0 +1,50 @@
+import pytest
+import os
+import sys
+import struct
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Parse_block import iter_raw_blocks, parse_block_data
+from block_objects import decode_block, decode_transaction
+
+DATA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_to_dict_matches_parse_block_data():
+    for block_number, (magic, block_data) in enumerate(iter_raw_blocks(os.path.join(DATA_DIR, 'blk00000-f10.blk'))):
+        assert decode_block(block_data, block_number, magic).to_dict() == parse_block_data(block_data, block_number, magic)
+
+
+def test_lazy_fields():
+    magic, block_data = next(iter_raw_blocks(os.path.join(DATA_DIR, 'blk00000-b0.blk')))
+    block = decode_block(block_data)
+    assert block.block_hash == "000000000019d6689c085ae165831e934ff763ae46a2a6c172b3f1b60a8ce26f"
+    assert block.timestamp == 1231006505
+    assert block.nbits == "1d00ffff"
+    transaction = block.transactions[0]
+    assert transaction.txid == block.merkle_root
+    assert transaction.outputs[0].satoshis == 5000000000
+    assert transaction.inputs[0].prev_output_index == 0xffffffff
+    assert transaction.inputs[0].witness == []
+    assert len(transaction.outputs[0].script_bytes) == 67
+
+
+def test_segwit_transaction():
+    # Version, marker/flag, one input, one output, a two item witness, lock time
+    raw = (struct.pack('<I', 2) + b'\x00\x01' + b'\x01' + bytes(32) + struct.pack('<I', 1) + b'\x00'
+           + b'\xff' * 4 + b'\x01' + struct.pack('<Q', 7) + b'\x00' + b'\x02\x01\xaa\x02\xbb\xcc'
+           + struct.pack('<I', 0))
+    transaction, offset = decode_transaction(raw, 0)
+    assert offset == len(raw)
+    assert transaction.segwit
+    assert transaction.stripped_size == len(raw) - 8
+    assert transaction.inputs[0].witness == [b'\xaa', b'\xbb\xcc']
+    assert transaction.to_dict()['witness_offsets'] == [transaction.inputs[0]._witness_offset]
+
+
+def test_objects_have_no_instance_dict():
+    magic, block_data = next(iter_raw_blocks(os.path.join(DATA_DIR, 'blk00000-b0.blk')))
+    block = decode_block(block_data)
+    transaction = block.transactions[0]
+    for obj in (block, transaction, transaction.inputs[0], transaction.outputs[0]):
+        with pytest.raises(AttributeError):
+            obj.extra = 1
@@ -0,0 +1,104 @@
+import pytest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from block_reader import (BlockchainReader, INDEX_FILE_NAME, INDEX_HEADER, FILE_RECORD, BLOCK_RECORD,
+                          list_block_files)
+
+DATA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GENESIS_HASH = "000000000019d6689c085ae165831e934ff763ae46a2a6c172b3f1b60a8ce26f"
+BLOCK_9_HASH = "000000008d9dc510f23c2657fc4f67bea30078cc05a90eb89e84cc475c080805"
+
+
+def read_fixture(name):
+    with open(os.path.join(DATA_DIR, name), 'rb') as file:
+        return file.read()
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    raw = read_fixture('blk00000-f10.blk')
+    (tmp_path / 'blk00000.dat').write_bytes(raw + b'\x00' * 64)
+    return tmp_path
+
+
+def test_list_block_files(data_dir):
+    (data_dir / 'rev00000.dat').write_bytes(b'')
+    (data_dir / 'blk00002.dat').write_bytes(b'')
+    assert [number for number, path in list_block_files(str(data_dir))] == [0, 2]
+
+
+def test_lookup_by_hash_and_height(data_dir):
+    with BlockchainReader(str(data_dir)) as reader:
+        assert len(reader) == 10
+        assert reader.height == 9
+        assert reader.get_block_hash(0) == GENESIS_HASH
+        assert reader.get_block_hash(9) == BLOCK_9_HASH
+        assert BLOCK_9_HASH in reader
+        assert reader.get_block(BLOCK_9_HASH)['block_number'] == 9
+        assert reader.get_block_by_height(0)['block_header']['nonce'] == 2083236893
+        assert reader.get_block_by_height(10) is None
+        assert reader.get_block("00" * 32) is None
+
+
+def test_index_is_persisted(data_dir):
+    BlockchainReader(str(data_dir)).close()
+    assert (data_dir / INDEX_FILE_NAME).exists()
+
+    with BlockchainReader(str(data_dir)) as reader:
+        assert len(reader) == 10
+        # Nothing new on disk, so nothing is rescanned
+        assert reader.update() is False
+        assert reader.get_block_hash(9) == BLOCK_9_HASH
+
+
+def missing_file_record(data):
+    # Points the first block record at a blk file that does not exist
+    offset = INDEX_HEADER.size + FILE_RECORD.size
+    entry = BLOCK_RECORD.unpack_from(data, offset)
+    return data[:offset] + BLOCK_RECORD.pack(7, *entry[1:]) + data[offset + BLOCK_RECORD.size:]
+
+
+@pytest.mark.parametrize("damage", [
+    lambda data: data[:5],
+    lambda data: data[:-10],
+    missing_file_record,
+])
+def test_damaged_index_is_rebuilt(data_dir, damage):
+    BlockchainReader(str(data_dir)).close()
+    index_path = data_dir / INDEX_FILE_NAME
+    index_path.write_bytes(damage(index_path.read_bytes()))
+
+    with BlockchainReader(str(data_dir)) as reader:
+        assert len(reader) == 10
+        assert reader.get_block_hash(9) == BLOCK_9_HASH
+    with BlockchainReader(str(data_dir)) as reader:
+        # The rebuilt index was saved
+        assert reader.update() is False
+        assert len(reader) == 10
+
+
+def test_update_picks_up_new_files(data_dir):
+    with BlockchainReader(str(data_dir)) as reader:
+        (data_dir / 'blk00001.dat').write_bytes(read_fixture('blk00000-b0.blk'))
+        # The genesis block again, already indexed so it is not added twice
+        assert reader.update() is False
+        assert len(reader) == 10
+
+
+def test_get_raw_block(data_dir):
+    with BlockchainReader(str(data_dir)) as reader:
+        raw = reader.get_raw_block(GENESIS_HASH)
+        assert isinstance(raw, bytes)
+        assert raw == read_fixture('blk00000-b0.blk')[8:]
+
+
+def test_update_scans_appended_blocks(tmp_path):
+    raw = read_fixture('blk00000-f10.blk')
+    genesis_length = len(read_fixture('blk00000-b0.blk'))
+    (tmp_path / 'blk00000.dat').write_bytes(raw[:genesis_length])
+    with BlockchainReader(str(tmp_path)) as reader:
+        assert reader.height == 0
+        (tmp_path / 'blk00000.dat').write_bytes(raw)
+        assert reader.update() is True
+        assert reader.height == 9
@@ -0,0 +1,61 @@
+import pytest
+import os
+import sys
+import struct
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Parse_block import double_sha256, iter_raw_blocks
+from chain import BlockTree, block_work
+
+DATA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def fixture_headers():
+    return [bytes(block_data[:80]) for magic, block_data in iter_raw_blocks(os.path.join(DATA_DIR, 'blk00000-f10.blk'))]
+
+
+def child_header(parent_header, nonce, bits=0x1d00ffff):
+    return struct.pack('<I', 1) + double_sha256(parent_header) + bytes(32) + struct.pack('<III', 0, bits, nonce)
+
+
+def test_block_work():
+    assert block_work(0x1d00ffff) == 0x100010001
+    assert block_work(0x1b0404cb) > block_work(0x1d00ffff)
+
+
+def test_out_of_order_headers():
+    headers = fixture_headers()
+    tree = BlockTree()
+    for header in reversed(headers):
+        tree.add_header(header)
+    assert len(tree) == 10
+    assert tree.best_tip == double_sha256(headers[9])
+    assert tree.path() == [double_sha256(header) for header in headers]
+    assert tree.height(double_sha256(headers[4])) == 4
+
+
+def test_most_work_fork_wins():
+    headers = fixture_headers()
+    tree = BlockTree()
+    for header in headers:
+        tree.add_header(header)
+    # Same length fork: the first tip seen stays
+    stale = child_header(headers[8], 1)
+    tree.add_header(stale)
+    assert tree.best_tip == double_sha256(headers[9])
+    # One more block makes the fork heavier
+    longer = child_header(stale, 2)
+    tree.add_header(longer)
+    assert tree.best_tip == double_sha256(longer)
+    assert tree.fork_point(double_sha256(headers[9]), tree.best_tip) == double_sha256(headers[8])
+
+
+def test_less_blocks_more_work():
+    headers = fixture_headers()
+    tree = BlockTree()
+    for header in headers:
+        tree.add_header(header)
+    # A single harder block at height 9 outweighs the original block 9
+    heavy = child_header(headers[8], 3, bits=0x1c00ffff)
+    tree.add_header(heavy)
+    assert tree.best_tip == double_sha256(heavy)
+    assert len(tree.path()) == 10
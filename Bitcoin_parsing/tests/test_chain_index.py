@@ -0,0 +1,86 @@
+import pytest
+import os
+import sys
+import struct
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Parse_block import BLOCK_MAGIC, compact_size, double_sha256, iter_blocks, merkle_root
+from block_reader import BlockchainReader
+from chain_index import ChainIndex
+from synthetic_blocks import serialize_transaction
+
+DATA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GENESIS_ADDRESS = "1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa"
+P2WPKH_SCRIPT = b'\x00\x14' + bytes(range(20))
+
+
+def build_block(prev_hash, spends, tag):
+    # Coinbase tagged with 'tag' plus one transaction spending 'spends' to a P2WPKH output
+    coinbase, coinbase_txid = serialize_transaction([(bytes(32), 0xffffffff, tag, 0xffffffff)], [(50, P2WPKH_SCRIPT)])
+    transactions, txids = [coinbase], [coinbase_txid]
+    if spends:
+        inputs = [(bytes.fromhex(txid)[::-1], index, b'', 0xffffffff) for txid, index in spends]
+        raw, txid = serialize_transaction(inputs, [(1000, P2WPKH_SCRIPT)])
+        transactions.append(raw)
+        txids.append(txid)
+    header = struct.pack('<I32s32sIII', 1, bytes.fromhex(prev_hash)[::-1], merkle_root(txids), 0, 0x1d00ffff, 0)
+    block_data = header + compact_size(len(transactions)) + b''.join(transactions)
+    return BLOCK_MAGIC + struct.pack('<I', len(block_data)) + block_data, double_sha256(header)[::-1].hex(), txids
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    blocks_dir = tmp_path / 'blocks'
+    blocks_dir.mkdir()
+    with open(os.path.join(DATA_DIR, 'blk00000-f10.blk'), 'rb') as file:
+        (blocks_dir / 'blk00000.dat').write_bytes(file.read())
+    return blocks_dir
+
+
+def test_lookups(tmp_path, data_dir):
+    blocks = list(iter_blocks(str(data_dir / 'blk00000.dat')))
+    with BlockchainReader(str(data_dir)) as reader, ChainIndex(str(tmp_path / 'index.db')) as index:
+        assert index.sync_from_reader(reader) == (0, 10)
+        assert index.sync_from_reader(reader) == (0, 0)
+        assert index.height == 9
+
+        txid = blocks[5]['transactions'][0]['txid']
+        assert index.get_transaction(txid, reader) == blocks[5]['transactions'][0]
+        assert index.get_transaction("11" * 32, reader) is None
+        assert index.get_address_outpoints(GENESIS_ADDRESS) == [(blocks[0]['transactions'][0]['txid'], 0)]
+
+        spent_txid = blocks[1]['transactions'][0]['txid']
+        assert index.get_spending_transaction(spent_txid, 0) is None
+
+        # A block spending block 1's coinbase is indexed incrementally
+        raw, block_hash, txids = build_block(blocks[9]['block_header']['block_hash'], [(spent_txid, 0)], b'a')
+        (data_dir / 'blk00001.dat').write_bytes(raw)
+        reader.update()
+        assert index.sync_from_reader(reader) == (0, 1)
+        spending_txid = txids[1][::-1].hex()
+        assert index.get_spending_transaction(spent_txid, 0) == (spending_txid, 0)
+        address = blocks[1]['transactions'][0]['txn_outputs'][0]['address']
+        assert index.get_unspent_outpoints(address) == []
+        assert index.get_transaction(spending_txid, reader)['txid'] == spending_txid
+
+
+def test_reorg_drops_stale_rows(tmp_path, data_dir):
+    blocks = list(iter_blocks(str(data_dir / 'blk00000.dat')))
+    spent_txid = blocks[1]['transactions'][0]['txid']
+    with BlockchainReader(str(data_dir)) as reader, ChainIndex(str(tmp_path / 'index.db')) as index:
+        stale, stale_hash, stale_txids = build_block(blocks[9]['block_header']['block_hash'], [(spent_txid, 0)], b's')
+        (data_dir / 'blk00001.dat').write_bytes(stale)
+        reader.update()
+        index.sync_from_reader(reader)
+        assert index.get_spending_transaction(spent_txid, 0) is not None
+
+        # Two blocks on top of block 9 replace the stale block 10
+        first, first_hash, first_txids = build_block(blocks[9]['block_header']['block_hash'], [], b'f')
+        second, second_hash, second_txids = build_block(first_hash, [], b'g')
+        (data_dir / 'blk00002.dat').write_bytes(first + second)
+        reader.update()
+
+        assert index.sync_from_reader(reader) == (1, 2)
+        assert index.block_hash(10) == first_hash
+        assert index.get_spending_transaction(spent_txid, 0) is None
+        assert index.get_transaction_location(stale_txids[0][::-1].hex()) is None
+        assert index.get_transaction_location(second_txids[0][::-1].hex()) is not None
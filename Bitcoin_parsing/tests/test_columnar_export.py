@@ -0,0 +1,72 @@
+import pytest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import struct
+from Parse_block import BLOCK_MAGIC, iter_blocks
+from columnar_export import export_block_files
+from synthetic_blocks import serialize_transaction
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+DATA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BLOCK_FILE = os.path.join(DATA_DIR, 'blk00000-f10.blk')
+
+
+@pytest.fixture
+def exported(tmp_path):
+    assert export_block_files([BLOCK_FILE], str(tmp_path), row_group_size=3) == 10
+    return tmp_path
+
+
+def test_tables_match_parsed_blocks(exported):
+    blocks = list(iter_blocks(BLOCK_FILE))
+    block_table = pq.read_table(exported / 'blocks.parquet').to_pylist()
+    assert [row['block_hash'].hex() for row in block_table] == [block['block_header']['block_hash'] for block in blocks]
+    assert [row['prev_block_hash'].hex() for row in block_table] == [block['block_header']['prev_block_hash'] for block in blocks]
+
+    transactions = pq.read_table(exported / 'transactions.parquet').to_pylist()
+    assert [row['txid'].hex() for row in transactions] == [tx['txid'] for block in blocks for tx in block['transactions']]
+    assert all(row['wtxid'] is None for row in transactions)
+
+    outputs = pq.read_table(exported / 'outputs.parquet').to_pylist()
+    assert outputs[0]['satoshis'] == 5000000000
+    assert outputs[0]['output_script'].hex() == blocks[0]['transactions'][0]['txn_outputs'][0]['output_script_bytes']
+
+
+def test_typed_columns_and_row_groups(exported):
+    outputs = pq.ParquetFile(exported / 'outputs.parquet')
+    assert outputs.schema_arrow.field('satoshis').type == pa.uint64()
+    assert outputs.schema_arrow.field('txid').type == pa.binary(32)
+    # 10 rows written 3 at a time
+    assert outputs.metadata.num_row_groups == 4
+    # Column projection only reads what is asked for
+    assert pq.read_table(exported / 'inputs.parquet', columns=['sequence']).num_columns == 1
+
+
+def test_number_of_blocks(tmp_path):
+    assert export_block_files([BLOCK_FILE], str(tmp_path), number_of_blocks=4) == 4
+    assert pq.read_table(tmp_path / 'blocks.parquet').num_rows == 4
+
+
+def test_little_endian_indexes_join(tmp_path):
+    # A version 2 transaction spending output 4 of another one in the block
+    funding, funding_txid = serialize_transaction([(bytes(32), 0xffffffff, b'\x01\x01', 0xffffffff)],
+                                                  [(1000, b'\x51')] * 5)
+    spend, _ = serialize_transaction([(funding_txid, 4, b'', 0xfffffffd)], [(900, b'\x51')], version=2)
+    block = bytes(80) + b'\x02' + funding + spend
+    block_file = tmp_path / 'blk00000.dat'
+    block_file.write_bytes(BLOCK_MAGIC + struct.pack('<I', len(block)) + block)
+
+    export_block_files([str(block_file)], str(tmp_path / 'out'))
+    transactions = pq.read_table(tmp_path / 'out' / 'transactions.parquet').to_pylist()
+    inputs = pq.read_table(tmp_path / 'out' / 'inputs.parquet').to_pylist()
+    outputs = pq.read_table(tmp_path / 'out' / 'outputs.parquet').to_pylist()
+
+    assert [row['version'] for row in transactions] == [2, 2]
+    assert inputs[1]['prev_output_index'] == 4
+    assert inputs[1]['sequence'] == 0xfffffffd
+    spent = [row for row in outputs
+             if row['txid'] == inputs[1]['prev_tx_hash'] and row['output_index'] == inputs[1]['prev_output_index']]
+    assert len(spent) == 1
@@ -0,0 +1,70 @@
+import pytest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Parse_block import iter_blocks, iter_raw_blocks
+from header_validation import (POW_LIMIT, bits_to_target, check_proof_of_work, validate_block_file,
+                               validate_header, validate_headers, validate_parsed_blocks)
+
+DATA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BLOCK_FILE = os.path.join(DATA_DIR, 'blk00000-f10.blk')
+
+
+@pytest.fixture
+def headers():
+    return [bytes(block_data[:80]) for magic, block_data in iter_raw_blocks(BLOCK_FILE)]
+
+
+@pytest.mark.parametrize("bits, target", [
+    (0x1d00ffff, POW_LIMIT),
+    (0x1b0404cb, 0x0404cb << (8 * (0x1b - 3))),
+    (0x03123456, 0x123456),
+    (0x02123456, 0x1234),
+    (0x01003456, 0),
+])
+def test_bits_to_target(bits, target):
+    assert bits_to_target(bits) == target
+
+
+@pytest.mark.parametrize("bits", [0x04923456, 0xff123456])
+def test_bits_to_target_invalid(bits):
+    with pytest.raises(ValueError):
+        bits_to_target(bits)
+
+
+def test_check_proof_of_work(headers):
+    assert check_proof_of_work(headers[0]) == (True, None)
+    bad_nonce = headers[0][:76] + b'\x00\x00\x00\x00'
+    is_valid, error_message = check_proof_of_work(bad_nonce)
+    assert not is_valid
+    assert "above the target" in error_message
+
+
+def test_validate_header_prev_hash(headers):
+    is_valid, error_message = validate_header(headers[2], prev_hash=bytes(32))
+    assert not is_valid
+    assert "Previous block hash" in error_message
+
+
+def test_validate_headers_batch(headers):
+    assert validate_headers(headers) == []
+    assert validate_headers(b''.join(headers)) == []
+    # Dropping a header breaks the link of the one after it
+    errors = validate_headers(headers[:4] + headers[5:])
+    assert [index for index, error_message in errors] == [4]
+
+
+def test_validate_headers_bad_buffer(headers):
+    with pytest.raises(ValueError):
+        validate_headers(b''.join(headers)[:-1])
+
+
+def test_validate_block_file():
+    assert validate_block_file(BLOCK_FILE) == []
+
+
+def test_validate_parsed_blocks():
+    blocks = list(iter_blocks(BLOCK_FILE))
+    assert validate_parsed_blocks(blocks) == []
+    blocks[6]['block_header']['prev_block_hash'] = "00" * 32
+    assert [index for index, error_message in validate_parsed_blocks(blocks)] == [6]
@@ -0,0 +1,354 @@
+import pytest
+import os
+import sys
+import io
+import json
+import struct
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Parse_block
+from Parse_block import parse_block, parse_block_data, parse_transaction, parse_transaction_at
+
+DATA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_fixture(name):
+    with open(os.path.join(DATA_DIR, name)) as json_file:
+        return json.load(json_file)
+
+
+def read_first_block(name):
+    with open(os.path.join(DATA_DIR, name), 'rb') as file:
+        file.read(4)
+        block_size = struct.unpack('<I', file.read(4))[0]
+        return file.read(block_size)
+
+
+def test_parse_block_genesis(monkeypatch):
+    monkeypatch.setattr(Parse_block, 'number_of_blocks_to_parse', 1, raising=False)
+    assert parse_block(os.path.join(DATA_DIR, 'blk00000-b0.blk')) == load_fixture('blk00000-b0.blk.json')
+
+
+def test_parse_block_first_blocks(monkeypatch):
+    monkeypatch.setattr(Parse_block, 'number_of_blocks_to_parse', 2, raising=False)
+    assert parse_block(os.path.join(DATA_DIR, 'blk00000-f10.blk')) == load_fixture('blk00000-f10.blk.json')
+
+
+def test_parse_block_data_multiple_transactions():
+    block_data = read_first_block('blk00000-b0.blk')
+    coinbase = block_data[81:]
+    # Same coinbase three times in one block
+    block_data = block_data[:80] + bytes([3]) + coinbase * 3
+
+    block = parse_block_data(block_data)
+
+    assert block['transaction_count'] == 3
+    assert block['block_size'] == len(block_data)
+    assert block['transactions'][0] == block['transactions'][2]
+    assert block['txn_output_count'] == 3
+
+
+def test_parse_transaction_at_returns_next_offset():
+    block_data = read_first_block('blk00000-b0.blk')
+    transaction, offset = parse_transaction_at(memoryview(block_data), 81)
+    assert offset == len(block_data)
+    assert transaction['txn_outputs'][0]['satoshis'] == 5000000000
+
+
+def test_parse_transaction_file_wrapper():
+    block_data = read_first_block('blk00000-b0.blk')
+    file = io.BytesIO(block_data[81:] + b'trailing')
+    transaction = parse_transaction(file)
+    assert transaction['lock_time'] == 0
+    assert file.read() == b'trailing'
+
+
+@pytest.mark.parametrize("read_size", [1, 7, 100])
+def test_parse_transaction_grows_its_buffer(monkeypatch, read_size):
+    monkeypatch.setattr(Parse_block, 'TRANSACTION_READ_SIZE', read_size)
+    block_data = read_first_block('blk00000-b0.blk')
+    file = io.BytesIO(block_data[81:] + b'trailing' * 1000)
+    assert parse_transaction(file) == parse_transaction_at(memoryview(block_data), 81)[0]
+    assert file.tell() == len(block_data) - 81
+    with pytest.raises(ValueError):
+        parse_transaction(io.BytesIO(block_data[81:-1]))
+
+
+def test_parse_transaction_retries_do_not_classify_truncated_scripts(monkeypatch):
+    # The first read ends inside the output script of the genesis coinbase
+    monkeypatch.setattr(Parse_block, 'TRANSACTION_READ_SIZE', 150)
+    block_data = read_first_block('blk00000-b0.blk')
+    Parse_block.classify_output_script.cache_clear()
+    parse_transaction(io.BytesIO(block_data[81:]))
+    # Only the complete output script of the genesis coinbase was classified
+    assert Parse_block.classify_output_script.cache_info().currsize == 1
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 300, Parse_block.READ_CHUNK_SIZE])
+def test_iter_blocks_chunk_sizes(chunk_size):
+    blocks = list(Parse_block.iter_blocks(os.path.join(DATA_DIR, 'blk00000-f10.blk'), chunk_size))
+    assert len(blocks) == 10
+    assert [block['block_number'] for block in blocks] == list(range(10))
+    assert blocks[:2] == load_fixture('blk00000-f10.blk.json')['blocks']
+
+
+def test_iter_blocks_skips_padding(tmp_path):
+    with open(os.path.join(DATA_DIR, 'blk00000-b0.blk'), 'rb') as file:
+        raw = file.read()
+    path = tmp_path / 'blk00001.dat'
+    path.write_bytes(raw + raw + b'\x00' * 5000)
+    assert len(list(Parse_block.iter_blocks(str(path), 64))) == 2
+
+
+def test_iter_blocks_stops_early():
+    blocks = Parse_block.iter_blocks(os.path.join(DATA_DIR, 'blk00000-f10.blk'))
+    assert next(blocks)['block_number'] == 0
+    blocks.close()
+
+
+def test_parse_block_invalid_magic(tmp_path):
+    path = tmp_path / 'bad.blk'
+    path.write_bytes(b'\x01\x02\x03\x04' + b'\x00' * 10)
+    assert parse_block(str(path)) is None
+
+
+def test_parse_block_number_of_blocks():
+    parsed = parse_block(os.path.join(DATA_DIR, 'blk00000-f10.blk'), 3)
+    assert len(parsed['blocks']) == 3
+
+
+def test_scan_block_offsets():
+    locations = Parse_block.scan_block_offsets(os.path.join(DATA_DIR, 'blk00000-f10.blk'))
+    assert len(locations) == 10
+    assert locations[0] == (8, 285)
+
+
+@pytest.mark.parametrize("workers, chunk_size", [(1, 64), (2, 1), (2, 3)])
+def test_parse_block_files_order(workers, chunk_size):
+    paths = [os.path.join(DATA_DIR, 'blk00000-b0.blk'), os.path.join(DATA_DIR, 'blk00000-f10.blk')]
+    parsed = Parse_block.parse_block_files(paths, workers=workers, chunk_size=chunk_size)
+    blocks = parsed['blocks']
+    assert len(blocks) == 11
+    assert [block['block_number'] for block in blocks] == list(range(11))
+    assert [block['block_header']['nonce'] for block in blocks[1:]] == \
+        [block['block_header']['nonce'] for block in Parse_block.iter_blocks(paths[1])]
+
+
+def test_iter_blocks_parallel_bounds_chunks_in_flight(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    submitted = []
+
+    class RecordingExecutor(ThreadPoolExecutor):
+        def submit(self, function, *args):
+            submitted.append(args)
+            return super().submit(function, *args)
+
+    monkeypatch.setattr(Parse_block, 'ProcessPoolExecutor', RecordingExecutor)
+    blocks = Parse_block.iter_blocks_parallel([os.path.join(DATA_DIR, 'blk00000-f10.blk')], workers=1, chunk_size=1)
+    assert next(blocks)['block_number'] == 0
+    # Two chunks per worker are submitted before the first one is yielded
+    assert len(submitted) == 2
+    assert [block['block_number'] for block in blocks] == list(range(1, 10))
+    assert len(submitted) == 10
+
+
+def test_parse_block_files_number_of_blocks():
+    paths = [os.path.join(DATA_DIR, 'blk00000-b0.blk'), os.path.join(DATA_DIR, 'blk00000-f10.blk')]
+    assert len(Parse_block.parse_block_files(paths, 4, workers=1)['blocks']) == 4
+    assert len(Parse_block.parse_block_files(paths, 4, workers=2, chunk_size=2)['blocks']) == 4
+
+
+def test_iter_block_headers_matches_full_parse():
+    path = os.path.join(DATA_DIR, 'blk00000-f10.blk')
+    headers = list(Parse_block.iter_block_headers(path))
+    blocks = list(Parse_block.iter_blocks(path))
+    assert len(headers) == len(blocks) == 10
+    for header, block in zip(headers, blocks):
+        assert 'transactions' not in header
+        assert header['block_header'] == block['block_header']
+        assert header['transaction_count'] == block['transaction_count']
+        assert header['block_size'] == block['block_size']
+
+
+def test_iter_block_headers_skips_padding(tmp_path):
+    with open(os.path.join(DATA_DIR, 'blk00000-b0.blk'), 'rb') as file:
+        raw = file.read()
+    path = tmp_path / 'blk00001.dat'
+    path.write_bytes(raw + raw + b'\x00' * 100)
+    assert [header['block_number'] for header in Parse_block.iter_block_headers(str(path))] == [0, 1]
+
+
+@pytest.mark.parametrize("body, message", [(b'', "no transaction count"), (b'\xfd', "truncated transaction count")])
+def test_iter_block_headers_rejects_missing_count(tmp_path, body, message):
+    block_data = read_first_block('blk00000-b0.blk')[:80] + body
+    path = tmp_path / 'blk00001.dat'
+    path.write_bytes(b'\xf9\xbe\xb4\xd9' + struct.pack('<I', len(block_data)) + block_data)
+    with pytest.raises(ValueError, match=f"Block 0 has (a )?{message}"):
+        list(Parse_block.iter_block_headers(str(path)))
+
+
+def test_parse_block_headers_only():
+    parsed = parse_block(os.path.join(DATA_DIR, 'blk00000-f10.blk'), 2, headers_only=True)
+    assert [block['block_number'] for block in parsed['blocks']] == [0, 1]
+    paths = [os.path.join(DATA_DIR, 'blk00000-b0.blk'), os.path.join(DATA_DIR, 'blk00000-f10.blk')]
+    parsed = Parse_block.parse_block_files(paths, workers=4, headers_only=True)
+    assert len(parsed['blocks']) == 11
+
+
+@pytest.mark.parametrize("encoded, value", [
+    (b'\x00', 0),
+    (b'\xfc', 252),
+    (b'\xfd\xfd\x00', 253),
+    (b'\xfd\x2c\x01', 300),
+    (b'\xfe\x00\x00\x01\x00', 65536),
+    (b'\xff\x00\x00\x00\x00\x01\x00\x00\x00', 1 << 32),
+])
+def test_compact_size(encoded, value):
+    assert Parse_block.read_varint(memoryview(b'\xaa' + encoded + b'\xbb'), 1) == (value, 1 + len(encoded))
+    file = io.BytesIO(encoded + b'\xbb')
+    assert Parse_block.parse_varint(file) == (value, len(encoded))
+    assert file.read() == b'\xbb'
+
+
+def test_parse_transaction_large_counts():
+    script = bytes(range(256)) + bytes(44)  # 300 byte script
+    output = struct.pack('<Q', 1000) + b'\xfd' + struct.pack('<H', len(script)) + script
+    transaction = (struct.pack('>I', 1) + b'\x01' + bytes(32) + struct.pack('>I', 0) + b'\x00'
+                   + struct.pack('>I', 0xffffffff) + b'\xfd' + struct.pack('<H', 300) + output * 300
+                   + struct.pack('<I', 0))
+
+    parsed, offset = parse_transaction_at(memoryview(transaction), 0)
+
+    assert offset == len(transaction)
+    assert len(parsed['txn_outputs']) == 300
+    assert parsed['txn_outputs'][299]['output_script_size'] == 300
+    assert parsed['txn_outputs'][299]['output_script_bytes'] == script.hex()
+
+
+def build_segwit_transaction(witnesses):
+    # Version, marker/flag, one input per witness stack, one output, witnesses, lock time
+    body = b''.join(bytes([i]) * 32 + struct.pack('<I', i) + b'\x00' + b'\xff' * 4 for i in range(len(witnesses)))
+    output = struct.pack('<Q', 5000) + b'\x16\x00\x14' + bytes(20)
+    witness_data = b''
+    for stack in witnesses:
+        witness_data += bytes([len(stack)]) + b''.join(bytes([len(item)]) + item for item in stack)
+    legacy = struct.pack('<I', 2) + bytes([len(witnesses)]) + body + b'\x01' + output
+    return (legacy[:4] + b'\x00\x01' + legacy[4:] + witness_data + struct.pack('<I', 0),
+            len(legacy) + 4)
+
+
+def test_parse_segwit_transaction():
+    witnesses = [[b'\x30' * 71, b'\x02' * 33], [], [b'\x51']]
+    raw, stripped_size = build_segwit_transaction(witnesses)
+    buf = memoryview(b'\xee' * 5 + raw)
+
+    transaction, offset = parse_transaction_at(buf, 5)
+
+    assert offset == len(buf)
+    assert len(transaction['txn_inputs']) == 3
+    assert transaction['txn_inputs'][2]['prev_tx_hash'] == (b'\x02' * 32).hex()
+    assert transaction['txn_outputs'][0]['satoshis'] == 5000
+    assert transaction['stripped_size'] == stripped_size
+    assert transaction['total_size'] == len(raw)
+    assert [Parse_block.read_witness(buf, witness_offset) for witness_offset in transaction['witness_offsets']] == witnesses
+
+
+def test_parse_legacy_transaction_sizes():
+    block_data = read_first_block('blk00000-b0.blk')
+    transaction, offset = parse_transaction_at(memoryview(block_data), 81)
+    assert transaction['stripped_size'] == transaction['total_size'] == 204
+    assert 'witness_offsets' not in transaction
+
+
+def test_block_hash_and_txid():
+    block = parse_block_data(read_first_block('blk00000-b0.blk'))
+    assert block['block_header']['block_hash'] == "000000000019d6689c085ae165831e934ff763ae46a2a6c172b3f1b60a8ce26f"
+    # The only transaction's txid is the merkle root
+    assert block['transactions'][0]['txid'] == block['block_header']['merkle_root']
+    assert 'wtxid' not in block['transactions'][0]
+
+
+def test_segwit_txid_and_wtxid():
+    raw, stripped_size = build_segwit_transaction([[b'\x30' * 71, b'\x02' * 33]])
+    stripped = raw[:4] + raw[6:stripped_size - 2] + raw[-4:]
+
+    transaction, offset = parse_transaction_at(memoryview(raw), 0)
+
+    assert len(stripped) == stripped_size
+    assert transaction['txid'] == Parse_block.double_sha256(stripped)[::-1].hex()
+    assert transaction['wtxid'] == Parse_block.double_sha256(raw)[::-1].hex()
+    # Reparsing the stripped form gives the same txid
+    assert parse_transaction_at(memoryview(stripped), 0)[0]['txid'] == transaction['txid']
+
+
+def reference_merkle_root(digests):
+    level = list(digests)
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [Parse_block.double_sha256(level[i] + level[i + 1]) for i in range(0, len(level), 2)]
+    return level[0]
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 4, 5, 7, 8, 13, 4000])
+def test_merkle_root(count):
+    digests = [Parse_block.double_sha256(struct.pack('<I', i)) for i in range(count)]
+    assert Parse_block.merkle_root(digests) == reference_merkle_root(digests)
+
+
+def test_verify_merkle_roots():
+    blocks = list(Parse_block.iter_blocks(os.path.join(DATA_DIR, 'blk00000-f10.blk'), verify_merkle=True))
+    assert Parse_block.verify_merkle_roots(blocks) == []
+
+    blocks[3]['transactions'][0]['txid'] = "00" * 32
+    assert Parse_block.verify_merkle_roots(blocks) == [blocks[3]]
+
+
+def test_parse_block_verify_merkle_mismatch(tmp_path):
+    raw = bytearray(open(os.path.join(DATA_DIR, 'blk00000-b0.blk'), 'rb').read())
+    raw[8 + 36] ^= 0xff  # Corrupt the merkle root in the header
+    path = tmp_path / 'bad_merkle.blk'
+    path.write_bytes(bytes(raw))
+    assert parse_block(str(path)) is not None
+    assert parse_block(str(path), verify_merkle=True) is None
+    assert Parse_block.parse_block_files([str(path)], workers=2, verify_merkle=True) is None
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_write_ndjson_per_block(tmp_path, monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(Parse_block, 'orjson', None)
+    path = os.path.join(DATA_DIR, 'blk00000-f10.blk')
+    output = tmp_path / 'blocks.ndjson'
+
+    assert Parse_block.write_ndjson(Parse_block.iter_blocks(path), str(output)) == 10
+
+    lines = output.read_bytes().splitlines()
+    assert len(lines) == 10
+    assert b'\n' not in lines[0] and b': ' not in lines[0]
+    assert [json.loads(line) for line in lines] == list(Parse_block.iter_blocks(path))
+
+
+def test_write_ndjson_per_transaction(tmp_path):
+    path = os.path.join(DATA_DIR, 'blk00000-f10.blk')
+    output = tmp_path / 'transactions.ndjson'
+
+    assert Parse_block.write_ndjson(Parse_block.iter_blocks(path), str(output), per_transaction=True) == 10
+
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert records[4]['block_number'] == 4
+    assert records[0]['block_hash'] == "000000000019d6689c085ae165831e934ff763ae46a2a6c172b3f1b60a8ce26f"
+    assert records[0]['txid'] == "4a5e1e4baab89f3a32518a88c31bc87f618f76673e2cc77ab2127b7afdeda33b"
+
+
+def test_iter_block_files_is_lazy():
+    paths = [os.path.join(DATA_DIR, 'blk00000-b0.blk'), os.path.join(DATA_DIR, 'blk00000-f10.blk')]
+    blocks = Parse_block.iter_block_files(paths, number_of_blocks=3)
+    assert next(blocks)['block_number'] == 0
+    assert [block['block_number'] for block in blocks] == [1, 2]
+
+
+def test_outputs_are_classified():
+    block = parse_block_data(read_first_block('blk00000-b0.blk'))
+    output = block['transactions'][0]['txn_outputs'][0]
+    assert output['script_type'] == 'p2pk'
+    assert output['address'] == "1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa"
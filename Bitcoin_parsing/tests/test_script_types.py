@@ -0,0 +1,44 @@
+import pytest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from script_types import base58check_encode, classify_output_script, hash160
+
+GENESIS_PUBKEY = "04678afdb0fe5548271967f1a67130b7105cd6a828e03909a67962e0ea1f61deb649f6bc3f4cef38c4f35504e51ec112de5c384df7ba0b8d578a4c702b6bf11d5f"
+
+
+@pytest.mark.parametrize("script, script_type, address", [
+    ("41" + GENESIS_PUBKEY + "ac", 'p2pk', "1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa"),
+    ("76a91462e907b15cbf27d5425399ebf6f0fb50ebb88f1888ac", 'p2pkh', "1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa"),
+    ("0014751e76e8199196d454941c45d1b3a323f1433bd6", 'p2wpkh', "bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4"),
+    ("00201863143c14c5166804bd19203356da136c985678cd4d27a1b8c6329604903262", 'p2wsh',
+     "bc1qrp33g0q5c5txsp9arysrx4k6zdkfs4nce4xj0gdcccefvpysxf3qccfmv3"),
+    ("512079be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798", 'p2tr',
+     "bc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vqzk5jj0"),
+    ("6a0b68656c6c6f20776f726c64", 'op_return', None),
+    ("5121" + "02" + "11" * 32 + "21" + "03" + "22" * 32 + "52ae", 'multisig', None),
+    ("ac", 'nonstandard', None),
+    ("", 'nonstandard', None),
+])
+def test_classify_output_script(script, script_type, address):
+    assert classify_output_script(bytes.fromhex(script)) == (script_type, address)
+
+
+def test_p2sh_address():
+    script_hash = hash160(b'\x51')
+    script_type, address = classify_output_script(b'\xa9\x14' + script_hash + b'\x87')
+    assert script_type == 'p2sh'
+    assert address == base58check_encode(b'\x05', script_hash)
+    assert address.startswith('3')
+
+
+def test_base58check_leading_zeros():
+    assert base58check_encode(b'\x00', bytes(20)) == "1111111111111111111114oLvT2"
+
+
+def test_classification_is_cached():
+    script = bytes.fromhex("76a91462e907b15cbf27d5425399ebf6f0fb50ebb88f1888ac")
+    classify_output_script(script)
+    hits = classify_output_script.cache_info().hits
+    classify_output_script(bytes(script))
+    assert classify_output_script.cache_info().hits == hits + 1
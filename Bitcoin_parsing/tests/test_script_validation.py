@@ -0,0 +1,262 @@
+import pytest
+import os
+import sys
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Parse_block import iter_raw_blocks
+from block_objects import decode_block, decode_transaction
+from script_types import hash160
+from synthetic_blocks import serialize_transaction
+from script_validation import (SighashCache, eval_script, verify_transaction, validate_block_scripts, push_data,
+                               find_and_delete, UnsupportedScript, SIGHASH_ALL, SIGHASH_SINGLE,
+                               SIGHASH_ANYONECANPAY, SIGHASH_ONE)
+
+ecdsa = pytest.importorskip('ecdsa')
+from ecdsa.util import sigencode_der_canonize
+
+DATA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Block 170: the first transaction between two people, spending the P2PK
+# coinbase output of block 9
+BLOCK_170_TX = bytes.fromhex(
+    "0100000001c997a5e56e104102fa209c6a852dd90660a20b2d9c352423edce25857fcd3704000000004847304402204e45e16932b8"
+    "af514961a1d3a1a25fdf3f4f7732e9d624c6c61548ab5fb8cd410220181522ec8eca07de4860a4acdd12909d831cc56cbbac462208"
+    "2221a8768d1d0901ffffffff0200ca9a3b00000000434104ae1a62fe09c5f51b13905f07f06b99a2f7159b2225f374cd378d71302f"
+    "a28414e7aab37397f554a7df5f142c21c1b7303b8a0626f1baded5c72a704f7e6cd84cac00286bee0000000043410411db93e1dcdb"
+    "8a016b49840f8c53bc1eb68a382e97b1482ecad7b148a6909a5cb2e0eaddfb84ccf9744464f82e160bfa9b8b64f9d4c03f999b8643"
+    "f656b412a3ac00000000")
+
+# Native P2WPKH example from BIP143
+BIP143_UNSIGNED_TX = bytes.fromhex(
+    "0100000002fff7f7881a8099afa6940d42d1e7f6362bec38171ea3edf433541db4e4ad969f0000000000eeffffffef51e1b804cc89"
+    "d182d279655c3aa89e815b1b309fe287d9b2b55d57b90ec68a0100000000ffffffff02202cb206000000001976a9148280b37df378"
+    "db99f66f85c95a783a76ac7a6d5988ac9093510d000000001976a9143bde42dbee7e4dbe6a21b2d50ce2f0167faa815988ac11000000")
+BIP143_SIGHASH = 'c37af31116d1b27caf68aae9e3ac82f1477929014d5b917657d0eb49478cb670'
+
+KEYS = [ecdsa.SigningKey.from_secret_exponent(secret, curve=ecdsa.SECP256k1) for secret in (1001, 1002, 1003)]
+PUBKEYS = [key.get_verifying_key().to_string('compressed') for key in KEYS]
+PREV_TXID = hashlib.sha256(b'funding').digest()
+OUTPUT = (90000, b'\x00\x14' + bytes(20))
+
+
+def p2pkh_script(pubkey):
+    return b'\x76\xa9\x14' + hash160(pubkey) + b'\x88\xac'
+
+
+def p2sh_script(redeem_script):
+    return b'\xa9\x14' + hash160(redeem_script) + b'\x87'
+
+
+def sign(key, digest, hash_type=SIGHASH_ALL):
+    return key.sign_digest(digest, sigencode=sigencode_der_canonize) + bytes([hash_type])
+
+
+def legacy_spend(script_sig_for, script_code, key_count=1, prev_txid=PREV_TXID):
+    # Builds a one input transaction whose scriptSig is script_sig_for(signatures)
+    unsigned, _ = serialize_transaction([(prev_txid, 0, b'', 0xffffffff)], [OUTPUT])
+    digest = SighashCache(decode_transaction(unsigned, 0)[0]).legacy_sighash(0, script_code, SIGHASH_ALL)
+    signatures = [sign(key, digest) for key in KEYS[:key_count]]
+    raw, _ = serialize_transaction([(prev_txid, 0, script_sig_for(signatures), 0xffffffff)], [OUTPUT])
+    return raw
+
+
+def witness_spend(witness_for, script_code, amount, script_sig=b''):
+    unsigned, _ = serialize_transaction([(PREV_TXID, 0, script_sig, 0xffffffff)], [OUTPUT])
+    digest = SighashCache(decode_transaction(unsigned, 0)[0]).segwit_sighash(0, script_code, amount, SIGHASH_ALL)
+    raw, _ = serialize_transaction([(PREV_TXID, 0, script_sig, 0xffffffff)], [OUTPUT],
+                                   [witness_for(sign(KEYS[0], digest))])
+    return raw
+
+
+def block_9_output():
+    blocks = [decode_block(block_data, block_number)
+              for block_number, (_, block_data) in enumerate(iter_raw_blocks(os.path.join(DATA_DIR, 'blk00000-f10.blk')))]
+    txout = blocks[9].transactions[0].outputs[0]
+    return txout.satoshis, txout.script_bytes
+
+
+def test_block_170_signature():
+    assert verify_transaction(BLOCK_170_TX, [block_9_output()], 170) == (1, 0, [])
+
+
+def test_block_170_tampered_output_fails():
+    tampered = BLOCK_170_TX.replace(bytes.fromhex('00ca9a3b'), bytes.fromhex('00ca9a3c'))
+    checked, unchecked, errors = verify_transaction(tampered, [block_9_output()], 170)
+    assert checked == 1
+    assert errors == [(0, "Script evaluated to false.")]
+
+
+def test_bip143_sighash():
+    tx, _ = decode_transaction(BIP143_UNSIGNED_TX, 0)
+    program = bytes.fromhex('1d0f172a0ecb48aee1be1f2687d2963ae33f71a1')
+    digest = SighashCache(tx).segwit_sighash(1, b'\x76\xa9\x14' + program + b'\x88\xac', 600000000, SIGHASH_ALL)
+    assert digest.hex() == BIP143_SIGHASH
+
+
+def test_sighash_cache_reuses_midstates():
+    tx, _ = decode_transaction(BIP143_UNSIGNED_TX, 0)
+    cache = SighashCache(tx)
+    cache.segwit_sighash(0, b'\x51', 1, SIGHASH_ALL)
+    hash_prevouts = cache.hash_prevouts
+    cache.segwit_sighash(1, b'\x51', 1, SIGHASH_ALL)
+    assert cache.hash_prevouts is hash_prevouts
+
+
+def test_sighash_single_without_output_signs_one():
+    tx, _ = decode_transaction(BIP143_UNSIGNED_TX, 0)
+    tx.outputs.pop()
+    cache = SighashCache(tx)
+    assert cache.legacy_sighash(1, b'', SIGHASH_SINGLE) == SIGHASH_ONE
+    assert cache.legacy_sighash(1, b'', SIGHASH_SINGLE | SIGHASH_ANYONECANPAY) == SIGHASH_ONE
+
+
+def test_p2pkh_spend():
+    script_pubkey = p2pkh_script(PUBKEYS[0])
+    raw = legacy_spend(lambda signatures: push_data(signatures[0]) + push_data(PUBKEYS[0]), script_pubkey)
+    assert verify_transaction(raw, [(100000, script_pubkey)]) == (1, 0, [])
+
+
+def test_code_separator_is_not_signed():
+    # <pubkey> OP_CHECKSIG OP_CODESEPARATOR: the separator after the
+    # signature check is part of the script code but is removed before signing
+    script_pubkey = push_data(PUBKEYS[0]) + b'\xac\xab'
+    raw = legacy_spend(lambda signatures: push_data(signatures[0]), script_pubkey[:-1])
+    assert verify_transaction(raw, [(100000, script_pubkey)]) == (1, 0, [])
+
+
+def test_p2pkh_spend_wrong_key():
+    script_pubkey = p2pkh_script(PUBKEYS[1])
+    raw = legacy_spend(lambda signatures: push_data(signatures[0]) + push_data(PUBKEYS[1]), script_pubkey)
+    assert verify_transaction(raw, [(100000, script_pubkey)])[2] == [(0, "Script evaluated to false.")]
+
+
+def test_p2sh_multisig_spend():
+    redeem_script = b'\x52' + b''.join(push_data(pubkey) for pubkey in PUBKEYS) + b'\x53\xae'
+    raw = legacy_spend(lambda signatures: b'\x00' + b''.join(push_data(signature) for signature in signatures)
+                       + push_data(redeem_script), redeem_script, key_count=2)
+    assert verify_transaction(raw, [(100000, p2sh_script(redeem_script))]) == (1, 0, [])
+
+
+def test_multisig_signatures_out_of_order_fail():
+    redeem_script = b'\x52' + b''.join(push_data(pubkey) for pubkey in PUBKEYS) + b'\x53\xae'
+    raw = legacy_spend(lambda signatures: b'\x00' + b''.join(push_data(signature) for signature in signatures[::-1])
+                       + push_data(redeem_script), redeem_script, key_count=2)
+    assert verify_transaction(raw, [(100000, p2sh_script(redeem_script))])[2] == [(0, "Redeem script evaluated to false.")]
+
+
+def test_multisig_removes_every_signature_from_the_script_code():
+    # The scriptPubKey pushes both signatures itself; the script code they
+    # sign is the one left once both pushes are removed
+    multisig_script = b'\x52' + b''.join(push_data(pubkey) for pubkey in PUBKEYS[:2]) + b'\x52\xae'
+    signed_code = b'\x6d' + multisig_script  # OP_2DROP drops the two pushes again
+    pushed = []
+
+    def script_sig_for(signatures):
+        pushed[:] = signatures
+        return b'\x00' + b''.join(push_data(signature) for signature in signatures)
+
+    raw = legacy_spend(script_sig_for, signed_code, key_count=2)
+    script_pubkey = b''.join(push_data(signature) for signature in pushed) + signed_code
+    assert verify_transaction(raw, [(100000, script_pubkey)]) == (1, 0, [])
+
+
+def test_p2wpkh_spend():
+    program = hash160(PUBKEYS[0])
+    raw = witness_spend(lambda signature: [signature, PUBKEYS[0]], p2pkh_script(PUBKEYS[0]), 100000)
+    assert verify_transaction(raw, [(100000, b'\x00\x14' + program)]) == (1, 0, [])
+    # The amount is committed to, a different one breaks the signature
+    assert verify_transaction(raw, [(100001, b'\x00\x14' + program)])[2] != []
+
+
+def test_p2sh_p2wpkh_spend():
+    redeem_script = b'\x00\x14' + hash160(PUBKEYS[0])
+    raw = witness_spend(lambda signature: [signature, PUBKEYS[0]], p2pkh_script(PUBKEYS[0]), 5000,
+                        script_sig=push_data(redeem_script))
+    assert verify_transaction(raw, [(5000, p2sh_script(redeem_script))]) == (1, 0, [])
+
+
+def test_p2wsh_spend():
+    witness_script = push_data(PUBKEYS[0]) + b'\xac'
+    script_pubkey = b'\x00\x20' + hashlib.sha256(witness_script).digest()
+    raw = witness_spend(lambda signature: [signature, witness_script], witness_script, 7000)
+    assert verify_transaction(raw, [(7000, script_pubkey)]) == (1, 0, [])
+
+
+def test_taproot_spend_is_unchecked():
+    raw, _ = serialize_transaction([(PREV_TXID, 0, b'', 0xffffffff)], [OUTPUT], [[bytes(64)]])
+    assert verify_transaction(raw, [(1000, b'\x51\x20' + b'\x01' * 32)]) == (0, 1, [])
+
+
+def test_witness_rules_before_activation():
+    # Before segwit a witness program is an ordinary script that anyone can spend
+    raw, _ = serialize_transaction([(PREV_TXID, 0, b'', 0xffffffff)], [OUTPUT])
+    assert verify_transaction(raw, [(1000, b'\x00\x14' + b'\x01' * 20)], height=400000) == (1, 0, [])
+    assert verify_transaction(raw, [(1000, b'\x00\x14' + b'\x01' * 20)])[2] == [(0, "P2WPKH witness must have 2 items.")]
+
+
+def test_eval_script_flow_control():
+    # 1 IF 2 ELSE 3 ENDIF
+    assert eval_script(b'\x51\x63\x52\x67\x53\x68', [], None) == [b'\x02']
+    assert eval_script(b'\x00\x63\x52\x67\x53\x68', [], None) == [b'\x03']
+    with pytest.raises(ValueError):
+        eval_script(b'\x51\x63\x52', [], None)
+
+
+def test_eval_script_failures():
+    with pytest.raises(ValueError):
+        eval_script(b'\x6a', [], None)  # OP_RETURN
+    with pytest.raises(ValueError):
+        eval_script(b'\x76', [], None)  # OP_DUP on an empty stack
+    with pytest.raises(ValueError):
+        eval_script(b'\x05\x01', [], None)  # Push past the end
+    with pytest.raises(UnsupportedScript):
+        eval_script(b'\x51\x51\x93', [], None)  # OP_ADD
+
+
+def test_find_and_delete():
+    signature = b'\x30' * 71
+    assert find_and_delete(push_data(signature) + b'\xac', signature) == b'\xac'
+
+
+def build_test_block(transactions):
+    coinbase, _ = serialize_transaction([(bytes(32), 0xffffffff, b'\x01\x01', 0xffffffff)], [OUTPUT])
+    return decode_block(bytes(80) + bytes([len(transactions) + 1]) + coinbase + b''.join(transactions))
+
+
+def test_validate_block_scripts_in_block_spend():
+    script_pubkey = p2pkh_script(PUBKEYS[0])
+    funding, funding_txid = serialize_transaction([(PREV_TXID, 0, b'\x51', 0xffffffff)], [(100000, script_pubkey)])
+    unsigned, _ = serialize_transaction([(funding_txid, 0, b'', 0xffffffff)], [OUTPUT])
+    digest = SighashCache(decode_transaction(unsigned, 0)[0]).legacy_sighash(0, script_pubkey, SIGHASH_ALL)
+    spend, _ = serialize_transaction([(funding_txid, 0, push_data(sign(KEYS[0], digest)) + push_data(PUBKEYS[0]),
+                                       0xffffffff)], [OUTPUT])
+    block = build_test_block([funding, spend])
+
+    coins = {PREV_TXID + bytes(4): (100000, 0, False, b'\x51')}
+    report = validate_block_scripts(block, coins.get, height=1)
+    assert report['inputs_checked'] == 2
+    assert report['errors'] == []
+
+    report = validate_block_scripts(block, {}.get, height=1)
+    assert report['errors'] == [(1, 0, "Spends a missing or already spent output.")]
+
+
+def test_validate_block_scripts_process_pool():
+    script_pubkey = p2pkh_script(PUBKEYS[0])
+    transactions = []
+    coins = {}
+    for index in range(20):
+        prev_txid = hashlib.sha256(bytes([index])).digest()
+        coins[prev_txid + bytes(4)] = (100000, 0, False, script_pubkey)
+        transactions.append(legacy_spend(lambda signatures: push_data(signatures[0]) + push_data(PUBKEYS[0]),
+                                         script_pubkey, prev_txid=prev_txid))
+    # A signature made for another outpoint
+    transactions.append(transactions[0].replace(hashlib.sha256(bytes([0])).digest(), PREV_TXID))
+    coins[PREV_TXID + bytes(4)] = (100000, 0, False, script_pubkey)
+    block = build_test_block(transactions)
+
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        report = validate_block_scripts(block, coins.get, executor=executor)
+    assert report['inputs_checked'] == 21
+    assert report['errors'] == [(21, 0, "Script evaluated to false.")]
@@ -0,0 +1,236 @@
+import pytest
+import os
+import sys
+import struct
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Parse_block import iter_raw_blocks
+from block_objects import decode_block
+from utxo_set import UtxoSet, make_outpoint
+
+DATA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+P2PK_SCRIPT = b'\x21\x02' + bytes(32) + b'\xac'
+
+
+def fixture_blocks():
+    return [decode_block(block_data, block_number, magic)
+            for block_number, (magic, block_data) in enumerate(iter_raw_blocks(os.path.join(DATA_DIR, 'blk00000-f10.blk')))]
+
+
+def build_transaction(spends, outputs):
+    # spends: list of (txid hex, index), outputs: list of (satoshis, script)
+    raw = struct.pack('<I', 1) + bytes([len(spends)])
+    for txid, index in spends:
+        raw += make_outpoint(txid, index) + b'\x00' + b'\xff' * 4
+    raw += bytes([len(outputs)])
+    for satoshis, script in outputs:
+        raw += struct.pack('<Q', satoshis) + bytes([len(script)]) + script
+    return raw + struct.pack('<I', 0)
+
+
+def build_block(prev_hash, transactions, tag=b''):
+    # 'tag' goes into the coinbase so sibling blocks get distinct coinbase txids
+    coinbase = build_transaction([('00' * 32, 0xffffffff)], [(50, P2PK_SCRIPT)])
+    coinbase = coinbase[:41] + bytes([len(tag)]) + tag + coinbase[42:]
+    header = struct.pack('<I', 1) + bytes.fromhex(prev_hash)[::-1] + bytes(32) + struct.pack('<III', 0, 0x1d00ffff, 0)
+    body = bytes([len(transactions) + 1]) + coinbase + b''.join(transactions)
+    return decode_block(header + body)
+
+
+def block_file_bytes(blocks):
+    return b''.join(b'\xf9\xbe\xb4\xd9' + struct.pack('<I', block.block_size) + block.raw for block in blocks)
+
+
+def test_apply_fixture_blocks(tmp_path):
+    blocks = fixture_blocks()
+    with UtxoSet(str(tmp_path / 'utxo.db')) as utxos:
+        for block in blocks:
+            assert utxos.apply_block(block) == []
+        assert utxos.height == 9
+        assert utxos.count() == 10
+        coinbase_txid = blocks[3].transactions[0].txid
+        satoshis, height, is_coinbase, script = utxos.get(coinbase_txid, 0)
+        assert (satoshis, height, is_coinbase) == (5000000000, 3, True)
+        assert utxos.get(coinbase_txid, 1) is None
+
+
+def test_spend_and_undo_record(tmp_path):
+    blocks = fixture_blocks()
+    with UtxoSet(str(tmp_path / 'utxo.db')) as utxos:
+        for block in blocks:
+            utxos.apply_block(block)
+        spent_txid = blocks[1].transactions[0].txid
+        spend = build_transaction([(spent_txid, 0)], [(1000, P2PK_SCRIPT), (10, b'\x6a\x01\x00')])
+        block = build_block(blocks[9].block_hash, [spend])
+
+        undo = utxos.apply_block(block)
+
+        assert [outpoint for outpoint, coin in undo] == [make_outpoint(spent_txid, 0)]
+        assert utxos.get(spent_txid, 0) is None
+        spend_txid = block.transactions[1].txid
+        assert utxos.get(spend_txid, 0)[0] == 1000
+        # OP_RETURN outputs are never stored
+        assert utxos.get(spend_txid, 1) is None
+        assert utxos.count() == 11
+
+
+def test_disconnect_block_with_in_block_spend(tmp_path):
+    # tx2 spends tx1:0 in the same block, the rollback must not bring tx1:0 back
+    blocks = fixture_blocks()
+    with UtxoSet(str(tmp_path / 'utxo.db')) as utxos:
+        for block in blocks:
+            utxos.apply_block(block)
+        spent_txid = blocks[1].transactions[0].txid
+        tx1 = build_transaction([(spent_txid, 0)], [(1000, P2PK_SCRIPT)])
+        tx1_txid = decode_block(build_block(blocks[9].block_hash, [tx1]).raw).transactions[1].txid
+        tx2 = build_transaction([(tx1_txid, 0)], [(900, P2PK_SCRIPT)])
+        block = build_block(blocks[9].block_hash, [tx1, tx2])
+
+        utxos.apply_block(block)
+        assert utxos.count() == 11  # New coinbase and tx2:0, minus the spent coinbase
+        utxos.disconnect_block(block)
+
+        assert utxos.count() == 10
+        assert utxos.get(tx1_txid, 0) is None
+        assert utxos.get(block.transactions[2].txid, 0) is None
+        assert utxos.get(spent_txid, 0) is not None
+
+
+def test_missing_output(tmp_path):
+    with UtxoSet(str(tmp_path / 'utxo.db')) as utxos:
+        utxos.apply_block(fixture_blocks()[0])
+        block = build_block('00' * 32, [build_transaction([('11' * 32, 0)], [(1, P2PK_SCRIPT)])])
+        with pytest.raises(ValueError):
+            utxos.apply_block(block)
+
+
+def test_rejected_block_leaves_no_changes(tmp_path):
+    # tx1 spends a real coin, tx2 a missing one: nothing of the block may stay,
+    # not even after the checkpoint done by close()
+    blocks = fixture_blocks()
+    path = str(tmp_path / 'utxo.db')
+    with UtxoSet(path) as utxos:
+        for block in blocks:
+            utxos.apply_block(block)
+        spent_txid = blocks[1].transactions[0].txid
+        tx1 = build_transaction([(spent_txid, 0)], [(1000, P2PK_SCRIPT)])
+        tx2 = build_transaction([('11' * 32, 0)], [(1, P2PK_SCRIPT)])
+        block = build_block(blocks[9].block_hash, [tx1, tx2])
+        with pytest.raises(ValueError):
+            utxos.apply_block(block)
+        assert utxos.height == 9
+        assert utxos.count() == 10
+        assert utxos.get(spent_txid, 0) is not None
+        assert utxos.get(block.transactions[0].txid, 0) is None
+
+    with UtxoSet(path) as utxos:
+        assert utxos.height == 9
+        assert utxos.count() == 10
+        assert utxos.get(spent_txid, 0) is not None
+
+
+def test_checkpoint_and_resume(tmp_path):
+    blocks = fixture_blocks()
+    path = str(tmp_path / 'utxo.db')
+    utxos = UtxoSet(path, checkpoint_interval=4)
+    for block in blocks[:6]:
+        utxos.apply_block(block)
+    # Simulate a crash: only the checkpoint after block 3 reached the disk
+    utxos.connection.close()
+
+    with UtxoSet(path) as utxos:
+        assert utxos.height == 3
+        assert utxos.tip_hash == blocks[3].block_hash
+        assert utxos.count() == 4
+        for block in blocks[4:]:
+            utxos.apply_block(block)
+    with UtxoSet(path) as utxos:
+        assert utxos.height == 9
+        assert utxos.count() == 10
+
+
+def test_memory_budget_spills_to_disk(tmp_path):
+    blocks = fixture_blocks()
+    with UtxoSet(str(tmp_path / 'utxo.db'), memory_budget=1) as utxos:
+        utxos.apply_block(blocks[0])
+        assert utxos._added == {}
+        assert utxos.connection.execute("SELECT COUNT(*) FROM utxos").fetchone()[0] == 1
+        assert utxos.get(blocks[0].transactions[0].txid, 0) is not None
+
+
+def test_sync_from_reader(tmp_path):
+    from block_reader import BlockchainReader
+    data_dir = tmp_path / 'blocks'
+    data_dir.mkdir()
+    with open(os.path.join(DATA_DIR, 'blk00000-f10.blk'), 'rb') as file:
+        (data_dir / 'blk00000.dat').write_bytes(file.read())
+    with BlockchainReader(str(data_dir)) as reader, UtxoSet(str(tmp_path / 'utxo.db')) as utxos:
+        assert utxos.sync_from_reader(reader, max_height=4) == (0, 5)
+        assert utxos.sync_from_reader(reader) == (0, 5)
+        assert utxos.tip_hash == reader.get_block_hash(9)
+
+
+@pytest.mark.parametrize("checkpoint_interval", [1, 1000])
+def test_reorg_through_reader(tmp_path, checkpoint_interval):
+    from block_reader import BlockchainReader
+    blocks = fixture_blocks()
+    data_dir = tmp_path / 'blocks'
+    data_dir.mkdir()
+    (data_dir / 'blk00000.dat').write_bytes(block_file_bytes(blocks))
+
+    with BlockchainReader(str(data_dir)) as reader, \
+            UtxoSet(str(tmp_path / 'utxo.db'), checkpoint_interval=checkpoint_interval) as utxos:
+        utxos.sync_from_reader(reader)
+        spent_txid = blocks[1].transactions[0].txid
+
+        # Two block fork from block 8, replacing block 9 and spending block 1's coinbase
+        fork_1 = build_block(blocks[8].block_hash, [build_transaction([(spent_txid, 0)], [(7, P2PK_SCRIPT)])], b'x1')
+        fork_2 = build_block(fork_1.block_hash, [], b'x2')
+        (data_dir / 'blk00001.dat').write_bytes(block_file_bytes([fork_1, fork_2]))
+        reader.update()
+        assert reader.get_block_hash(9) == fork_1.block_hash
+
+        assert utxos.sync_from_reader(reader) == (1, 2)
+        assert utxos.tip_hash == fork_2.block_hash
+        assert utxos.get(blocks[9].transactions[0].txid, 0) is None
+        assert utxos.get(spent_txid, 0) is None
+        assert utxos.get(fork_1.transactions[1].txid, 0)[0] == 7
+
+        # The original block 9 comes back with three more blocks on top
+        extension = [build_block(blocks[9].block_hash, [], b'y1')]
+        extension.append(build_block(extension[-1].block_hash, [], b'y2'))
+        extension.append(build_block(extension[-1].block_hash, [], b'y3'))
+        (data_dir / 'blk00002.dat').write_bytes(block_file_bytes(extension))
+        reader.update()
+
+        assert utxos.sync_from_reader(reader) == (2, 4)
+        assert utxos.height == 12
+        assert utxos.get(spent_txid, 0)[0] == 5000000000
+        assert utxos.get(fork_1.transactions[1].txid, 0) is None
+        assert utxos.get(fork_2.transactions[0].txid, 0) is None
+        assert utxos.count() == 13
+
+
+def test_disconnect_needs_tip(tmp_path):
+    blocks = fixture_blocks()
+    with UtxoSet(str(tmp_path / 'utxo.db')) as utxos:
+        utxos.apply_block(blocks[0])
+        utxos.apply_block(blocks[1])
+        with pytest.raises(ValueError):
+            utxos.disconnect_block(blocks[0])
+        utxos.disconnect_block(blocks[1])
+        assert utxos.tip_hash == blocks[0].block_hash
+        assert utxos.count() == 1
+
+
+def test_undo_records_are_pruned(tmp_path):
+    blocks = fixture_blocks()
+    with UtxoSet(str(tmp_path / 'utxo.db'), undo_depth=2) as utxos:
+        for block in blocks:
+            utxos.apply_block(block)
+        utxos.checkpoint()
+        heights = [row[0] for row in utxos.connection.execute("SELECT height FROM undo ORDER BY height")]
+        assert heights == [7, 8, 9]
+        for block in reversed(blocks[7:]):
+            utxos.disconnect_block(block)
+        with pytest.raises(ValueError):
+            utxos.disconnect_block(blocks[6])
@@ -0,0 +1,83 @@
+import pytest
+import os
+import sys
+import io
+import json
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Parse_block
+from verify_block import iter_json_array, validate_file, validate_files
+
+DATA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BLOCK_FILE = os.path.join(DATA_DIR, 'blk00000-f10.blk')
+
+
+@pytest.fixture
+def blocks():
+    return list(Parse_block.iter_blocks(BLOCK_FILE))
+
+
+def write_json(path, blocks):
+    with open(path, 'w') as json_file:
+        json.dump({"blocks": blocks}, json_file, indent=2)
+    return str(path)
+
+
+def test_fixture_outputs_are_valid():
+    for name in ('blk00000-b0.blk.json', 'blk00000-f10.blk.json'):
+        report = validate_file(os.path.join(DATA_DIR, name))
+        assert report['error_count'] == 0, report['errors']
+        assert report['records'] >= 1
+
+
+@pytest.mark.parametrize("chunk_size", [1, 17, 4096])
+def test_iter_json_array_streams(blocks, chunk_size):
+    document = json.dumps({"height": 10, "blocks": blocks, "trailer": True}, indent=2)
+    assert list(iter_json_array(io.StringIO(document), chunk_size=chunk_size)) == blocks
+
+
+def test_iter_json_array_missing_key():
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO('{"other": []}')))
+
+
+def test_ndjson_outputs(tmp_path, blocks):
+    per_block = str(tmp_path / 'blocks.ndjson')
+    per_transaction = str(tmp_path / 'transactions.ndjson')
+    Parse_block.write_ndjson(blocks, per_block)
+    Parse_block.write_ndjson(blocks, per_transaction, per_transaction=True)
+    assert validate_file(per_block)['error_count'] == 0
+    assert validate_file(per_transaction)['records'] == 10
+
+
+def test_headers_only_output(tmp_path):
+    path = write_json(tmp_path / 'headers.json', list(Parse_block.iter_block_headers(BLOCK_FILE)))
+    assert validate_file(path)['error_count'] == 0
+
+
+def test_detects_inconsistencies(tmp_path, blocks):
+    blocks[1]['transaction_count'] = 2
+    blocks[2]['block_size'] += 1
+    blocks[3]['transactions'][0]['txn_outputs'][0]['output_script_size'] = 1
+    blocks[4]['block_header']['nonce'] = "1"
+    blocks[6]['block_header']['prev_block_hash'] = "00" * 32
+    report = validate_file(write_json(tmp_path / 'bad.json', blocks))
+    assert report['error_count'] == 5
+    assert [error.split(':')[0] for error in report['errors']] == [
+        "block 1", "block 2", "block 3 transaction 0 output 0", "block 4 header", "block 6"]
+
+
+def test_unreadable_file(tmp_path):
+    path = tmp_path / 'truncated.json'
+    path.write_text('{"blocks": [{"magic_number": ')
+    report = validate_file(str(path))
+    assert report['error_count'] == 1
+    assert report['errors'][0].startswith("unreadable")
+
+
+def test_validate_directory_in_parallel(tmp_path, blocks):
+    write_json(tmp_path / 'a.json', blocks)
+    Parse_block.write_ndjson(blocks, str(tmp_path / 'b.ndjson'))
+    (tmp_path / 'notes.txt').write_text("ignored")
+    reports = validate_files([str(tmp_path)], workers=2)
+    assert [os.path.basename(report['path']) for report in reports] == ['a.json', 'b.ndjson']
+    assert all(report['error_count'] == 0 and report['seconds'] >= 0 for report in reports)
@@ -0,0 +1,294 @@
+import sqlite3
+import struct
+
+from block_objects import decode_block
+
+DEFAULT_MEMORY_BUDGET = 256 << 20  # Bytes of unflushed outputs kept in memory
+CHECKPOINT_INTERVAL = 1000  # Blocks between checkpoints
+UNDO_DEPTH = 288  # Undo records kept below the tip, more than any real reorg
+ENTRY_OVERHEAD = 150  # Rough per entry cost of a dict slot and two bytes objects
+
+OUTPOINT_INDEX = struct.Struct('<I')
+# satoshis, height of the creating block, coinbase flag, followed by the script
+COIN_STRUCT = struct.Struct('<QIB')
+
+UNDO_ENTRY = struct.Struct('<36sI')  # outpoint, coin length, followed by the coin
+OP_RETURN = 0x6a
+
+
+def make_outpoint(txid, index):
+    # 36 byte key: txid in internal byte order and the little endian output index.
+    # 'txid' is either the usual hex string or the raw internal digest.
+    if isinstance(txid, str):
+        txid = bytes.fromhex(txid)[::-1]
+    return txid + OUTPOINT_INDEX.pack(index)
+
+
+def encode_undo(undo):
+    return b''.join(UNDO_ENTRY.pack(outpoint, len(coin)) + coin for outpoint, coin in undo)
+
+
+def decode_undo(data):
+    undo = []
+    offset = 0
+    while offset < len(data):
+        outpoint, coin_size = UNDO_ENTRY.unpack_from(data, offset)
+        offset += UNDO_ENTRY.size
+        undo.append((outpoint, data[offset:offset + coin_size]))
+        offset += coin_size
+    return undo
+
+
+def decode_coin(value):
+    # Returns (satoshis, height, is_coinbase, script) for a stored value
+    satoshis, height, is_coinbase = COIN_STRUCT.unpack_from(value, 0)
+    return satoshis, height, bool(is_coinbase), value[COIN_STRUCT.size:]
+
+
+class UtxoSet:
+    # Live set of unspent outputs built by applying blocks in chain order.
+    #
+    # Outputs created since the last flush live in a dict keyed by the 36 byte
+    # outpoint, so outputs spent soon after they are created never reach the
+    # disk. Once the estimated size of that dict passes 'memory_budget', or
+    # every 'checkpoint_interval' blocks, it is written to a SQLite table in the
+    # same transaction as the height and hash of the last applied block. The
+    # file therefore always holds a consistent set, and a restart resumes at
+    # 'height + 1'.
+    #
+    # Each applied block also leaves an undo record (the coins it spent), kept
+    # for the last 'undo_depth' blocks so disconnect_block can roll the tip
+    # back during a reorg without reparsing anything.
+    def __init__(self, db_path, memory_budget=DEFAULT_MEMORY_BUDGET, checkpoint_interval=CHECKPOINT_INTERVAL,
+                 undo_depth=UNDO_DEPTH):
+        self.db_path = db_path
+        self.memory_budget = memory_budget
+        self.checkpoint_interval = checkpoint_interval
+        self.undo_depth = undo_depth
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS utxos (outpoint BLOB PRIMARY KEY, coin BLOB NOT NULL) WITHOUT ROWID")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value BLOB)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS undo (block_hash TEXT PRIMARY KEY, height INTEGER NOT NULL, "
+                                "prev_hash TEXT, data BLOB NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS undo_height ON undo (height)")
+        self.connection.commit()
+
+        self._added = {}  # outpoint -> coin, not yet on disk
+        self._spent = set()  # outpoints on disk spent since the last flush
+        self._undo = {}  # block hash -> (height, prev hash, undo record) not yet on disk
+        self._disconnected = set()  # block hashes whose stored undo record is obsolete
+        self._cache_bytes = 0
+        self._blocks_since_checkpoint = 0
+        self.height = -1
+        self.tip_hash = None
+        self._load_state()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __contains__(self, outpoint):
+        return self._lookup(outpoint) is not None
+
+    def close(self):
+        if self.connection is None:
+            return
+        self.checkpoint()
+        self.connection.close()
+        self.connection = None
+
+    def get(self, txid, index):
+        # Returns (satoshis, height, is_coinbase, script) or None when spent or unknown
+        return self.get_coin(make_outpoint(txid, index))
+
+    def get_coin(self, outpoint):
+        # Same as get, keyed by the raw 36 byte outpoint of a TxIn
+        coin = self._lookup(bytes(outpoint))
+        return decode_coin(coin) if coin is not None else None
+
+    def count(self):
+        # Flushes first, since spent outpoints may or may not already be on disk
+        self.checkpoint()
+        return self.connection.execute("SELECT COUNT(*) FROM utxos").fetchone()[0]
+
+    def apply_block(self, block, block_hash=None):
+        # Applies a block_objects.Block on top of the current tip. Returns the
+        # undo record: the (outpoint, coin) pairs the block spent, in order.
+        # The block's changes are staged and only replayed on the set once
+        # every input has been found, so a rejected block leaves nothing behind
+        # for the next checkpoint to write.
+        height = self.height + 1
+        undo = []
+        changes = []  # (outpoint, coin to add or None to spend), in block order
+        block_added = {}  # outpoint -> coin created by this block and still unspent
+        block_spent = set()  # outpoints spent by this block
+        for tx_index, transaction in enumerate(block.transactions):
+            if tx_index:
+                for txin in transaction.inputs:
+                    outpoint = txin.outpoint
+                    if outpoint in block_added:
+                        coin = block_added.pop(outpoint)
+                    elif outpoint in block_spent:
+                        coin = None
+                    else:
+                        coin = self._lookup(outpoint)
+                    if coin is None:
+                        raise ValueError(f"Block {height} spends missing output {outpoint[:32][::-1].hex()}:"
+                                         f"{OUTPOINT_INDEX.unpack_from(outpoint, 32)[0]}.")
+                    block_spent.add(outpoint)
+                    changes.append((outpoint, None))
+                    undo.append((outpoint, coin))
+
+            txid = transaction.txid_bytes
+            is_coinbase = 1 if tx_index == 0 else 0
+            for index, txout in enumerate(transaction.outputs):
+                script = txout.script_bytes
+                if script[:1] == bytes([OP_RETURN]):
+                    continue  # Provably unspendable, never stored
+                outpoint = txid + OUTPOINT_INDEX.pack(index)
+                coin = COIN_STRUCT.pack(txout.satoshis, height, is_coinbase) + script
+                block_added[outpoint] = coin
+                block_spent.discard(outpoint)
+                changes.append((outpoint, coin))
+
+        for outpoint, coin in changes:
+            if coin is None:
+                self._spend(outpoint)
+            else:
+                self._add(outpoint, coin)
+
+        block_hash = block_hash or block.block_hash
+        self._undo[block_hash] = (height, self.tip_hash, encode_undo(undo))
+        self._disconnected.discard(block_hash)
+        self.height = height
+        self.tip_hash = block_hash
+        self._blocks_since_checkpoint += 1
+        if self._cache_bytes > self.memory_budget or self._blocks_since_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+        return undo
+
+    def disconnect_block(self, block):
+        # Rolls back the tip block (a block_objects.Block): removes the outputs
+        # it created and restores the coins it spent from its undo record.
+        # Returns the undo record.
+        block_hash = block.block_hash
+        if block_hash != self.tip_hash:
+            raise ValueError(f"Block {block_hash} is not the current tip {self.tip_hash}.")
+        height, prev_hash, data = self._load_undo(block_hash)
+
+        # Transaction by transaction from the last one, like bitcoind: remove
+        # its outputs, then restore the coins its own inputs spent. An output
+        # created and spent inside the block is thereby restored and removed
+        # again in the right order, instead of being left in the set.
+        undo = decode_undo(data)
+        position = len(undo)
+        for tx_index in range(len(block.transactions) - 1, -1, -1):
+            transaction = block.transactions[tx_index]
+            txid = transaction.txid_bytes
+            for index, txout in enumerate(transaction.outputs):
+                if txout.script_bytes[:1] != bytes([OP_RETURN]):
+                    self._spend(txid + OUTPOINT_INDEX.pack(index))
+            if tx_index:
+                for _ in transaction.inputs:
+                    position -= 1
+                    outpoint, coin = undo[position]
+                    self._add(outpoint, coin)
+
+        self._undo.pop(block_hash, None)
+        self._disconnected.add(block_hash)
+        self.height = height - 1
+        self.tip_hash = prev_hash
+        return undo
+
+    def apply_raw_block(self, block_data):
+        return self.apply_block(decode_block(block_data, self.height + 1))
+
+    def sync_from_reader(self, reader, max_height=None):
+        # Follows the most-work chain of a block_reader.BlockchainReader. When
+        # the current tip is no longer on that chain the stale blocks are
+        # disconnected first, then every block above the fork is applied, up to
+        # 'max_height' or the reader's tip. Returns (disconnected, applied).
+        disconnected = self.disconnect_stale(reader)
+        target = reader.height if max_height is None else min(max_height, reader.height)
+        applied = 0
+        for height in range(self.height + 1, target + 1):
+            block_hash = reader.get_block_hash(height)
+            self.apply_block(decode_block(reader.get_raw_block(block_hash), height), block_hash)
+            applied += 1
+        return disconnected, applied
+
+    def disconnect_stale(self, reader):
+        # Disconnects tip blocks until the tip is on the reader's most-work
+        # chain, returns how many were rolled back
+        disconnected = 0
+        while self.height >= 0 and reader.get_block_hash(self.height) != self.tip_hash:
+            self.disconnect_block(decode_block(reader.get_raw_block(self.tip_hash), self.height))
+            disconnected += 1
+        return disconnected
+
+    def checkpoint(self):
+        # Writes the in-memory changes and the current tip in one transaction
+        with self.connection:
+            self.connection.executemany("DELETE FROM utxos WHERE outpoint = ?", ((outpoint,) for outpoint in self._spent))
+            self.connection.executemany("INSERT OR REPLACE INTO utxos VALUES (?, ?)", self._added.items())
+            self.connection.executemany("INSERT OR REPLACE INTO state VALUES (?, ?)", [
+                ('height', self.height),
+                ('tip_hash', self.tip_hash),
+            ])
+            self.connection.executemany("DELETE FROM undo WHERE block_hash = ?",
+                                        ((block_hash,) for block_hash in self._disconnected))
+            self.connection.executemany("INSERT OR REPLACE INTO undo VALUES (?, ?, ?, ?)", (
+                (block_hash, height, prev_hash, data) for block_hash, (height, prev_hash, data) in self._undo.items()
+            ))
+            self.connection.execute("DELETE FROM undo WHERE height < ?", (self.height - self.undo_depth,))
+        self._added.clear()
+        self._spent.clear()
+        self._undo.clear()
+        self._disconnected.clear()
+        self._cache_bytes = 0
+        self._blocks_since_checkpoint = 0
+
+    def _load_state(self):
+        state = dict(self.connection.execute("SELECT key, value FROM state"))
+        self.height = state.get('height', -1)
+        self.tip_hash = state.get('tip_hash')
+
+    def _load_undo(self, block_hash):
+        if block_hash in self._undo:
+            return self._undo[block_hash]
+        row = self.connection.execute("SELECT height, prev_hash, data FROM undo WHERE block_hash = ?",
+                                      (block_hash,)).fetchone()
+        if row is None or block_hash in self._disconnected:
+            raise ValueError(f"No undo record for block {block_hash}, it is deeper than {self.undo_depth} blocks.")
+        return row
+
+    def _lookup(self, outpoint):
+        coin = self._added.get(outpoint)
+        if coin is not None or outpoint in self._spent:
+            return coin
+        row = self.connection.execute("SELECT coin FROM utxos WHERE outpoint = ?", (outpoint,)).fetchone()
+        return row[0] if row else None
+
+    def _add(self, outpoint, coin):
+        # A txid seen twice (the BIP30 duplicate coinbases) simply overwrites
+        self._spent.discard(outpoint)
+        self._added[outpoint] = coin
+        self._cache_bytes += len(coin) + ENTRY_OVERHEAD
+
+    def _spend(self, outpoint):
+        coin = self._added.pop(outpoint, None)
+        if coin is not None:
+            self._cache_bytes -= len(coin) + ENTRY_OVERHEAD
+            # Usually created and spent before reaching the disk, in which case
+            # the DELETE at the next checkpoint is a no-op. It matters when the
+            # coin had replaced a stored one with the same outpoint.
+            self._spent.add(outpoint)
+            return coin
+        coin = self._lookup(outpoint)
+        if coin is not None:
+            self._spent.add(outpoint)
+        return coin
@@ -1,101 +1,308 @@
 #!/usr/bin/python3
 
-import sys, json
-
-# This checks that the JSON produced by a BTC parsing program matches what is
-# expected in this assignment.  After you run your parser on the genesis
-# block file (blk00000-b0.blk), run this program on the output (which should
-# be blk00000-b0.blk.json) on the output.  The one and only command line
-# parameter is the JSON file to read in.  This program will help verify that
-# you are reporting everything properly.
-
-# Load the JSON file
-with open(sys.argv[1]) as json_file:
-    json_data = json.load(json_file)
-
-# Print the entire JSON data for inspection
-print(json.dumps(json_data, indent=2))
-
-
-# the required command-line parameter is the file name
-assert(len(sys.argv)==2)
-
-json = json.load(open(sys.argv[1]))
-
-# checking the block list
-assert('blocks' in json) # needs to be present
-assert(isinstance(json['blocks'],list)) # needs to be a list
-assert(len(json['blocks']) >= 1) # only one block is listed, but you are allowed an empty "trailing" block
-
-# checking the height
-assert('height' in json) # needs to be present
-assert(isinstance(json['height'],int)) # needs to be an int
-assert(json['height']==1)
-
-# get the first (and only) block
-block = json['blocks'][0]
-
-# block data: check that the keys are present, are the right types, and have
-# the right values
-header = {
-	"height": 0,
-	"version": 1,
-	"previous_hash": "0000000000000000000000000000000000000000000000000000000000000000",
-	"merkle_hash": "4a5e1e4baab89f3a32518a88c31bc87f618f76673e2cc77ab2127b7afdeda33b",
-	"timestamp": 1231006505,
-	"nbits": "1d00ffff",
-	"nonce": 2083236893,
-	"txn_count": 1,
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+# Checks the output of Parse_block.py before it is loaded anywhere else. Files
+# are streamed one block (or one transaction line) at a time, so their size
+# does not matter: both the {"blocks": [...]} JSON document and the NDJSON
+# output (per block or per transaction) are accepted. Every block is checked
+# for field types, counts against list lengths, sizes against the sum of its
+# transactions and the prev_block_hash link to the block before it.
+# Directories are expanded to the .json/.ndjson files in them and files are
+# checked in parallel, each with its own result line and timing.
+
+READ_CHUNK_SIZE = 1 << 20
+MAX_ERRORS = 20  # Errors kept per file
+MAX_SATOSHIS = 21000000 * 100000000
+
+HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+HEX_PATTERN = re.compile(r'^(?:[0-9a-f]{2})*$')
+NBITS_PATTERN = re.compile(r'^[0-9a-f]{8}$')
+
+HEADER_FIELDS = {
+    "block_hash": str,
+    "version": int,
+    "prev_block_hash": str,
+    "merkle_root": str,
+    "timestamp_readable": str,
+    "nbits": str,
+    "nonce": int,
+    "block_number": int,
 }
-for k,v in header.items():
-	assert(k in block)
-	assert(isinstance(block[k],type(header[k])))
-	assert(header[k]==block[k])
-
-# check that the transactions is present
-assert('transactions' in block)
-assert(isinstance(block['transactions'],list))
-assert(len(block['transactions'])==1)
-txn = block['transactions'][0]
-
-# check everything other than the txn_inputs and txn_outputs
-txn_data = {
-	"version": 1,
-	"txn_in_count": 1,
-	"txn_out_count": 1,
-	"lock_time": 0
+BLOCK_FIELDS = {
+    "magic_number": str,
+    "block_size": int,
+    "block_header": dict,
+    "transaction_count": int,
+    "block_number": int,
 }
-for k,v in txn_data.items():
-	assert(k in txn)
-	assert(isinstance(txn[k],type(txn_data[k])))
-	assert(txn_data[k]==txn[k])
-
-# check the txn inputs
-assert('txn_inputs' in txn)
-assert(len(txn['txn_inputs'])==1)
-txninput = txn['txn_inputs'][0]
-txn_in_data = {
-	"txn_hash": "0000000000000000000000000000000000000000000000000000000000000000",
-	"index": 4294967295,
-	"input_script_size": 77,
-	"input_script_bytes": "04ffff001d0104455468652054696d65732030332f4a616e2f32303039204368616e63656c6c6f72206f6e206272696e6b206f66207365636f6e64206261696c6f757420666f722062616e6b73",
-	"sequence": 4294967295
+TRANSACTION_FIELDS = {
+    "txid": str,
+    "version": int,
+    "txn_inputs": list,
+    "txn_outputs": list,
+    "lock_time": int,
+    "stripped_size": int,
+    "total_size": int,
 }
-for k,v in txn_in_data.items():
-	assert(k in txninput)
-	assert(isinstance(txninput[k],type(txn_in_data[k])))
-	assert(txn_in_data[k]==txninput[k])
-
-# check the txn outputs
-assert('txn_outputs' in txn)
-assert(len(txn['txn_outputs'])==1)
-txnoutput = txn['txn_outputs'][0]
-txn_out_data = {
-	"satoshis": 5000000000,
-	"output_script_size": 67,
-	"output_script_bytes": "4104678afdb0fe5548271967f1a67130b7105cd6a828e03909a67962e0ea1f61deb649f6bc3f4cef38c4f35504e51ec112de5c384df7ba0b8d578a4c702b6bf11d5fac"
+INPUT_FIELDS = {
+    "prev_tx_hash": str,
+    "prev_output_index": int,
+    "input_script_size": int,
+    "input_script_bytes": str,
+    "sequence": int,
 }
-for k,v in txn_out_data.items():
-	assert(k in txnoutput)
-	assert(isinstance(txnoutput[k],type(txn_out_data[k])))
-	assert(txn_out_data[k]==txnoutput[k])
\ No newline at end of file
+OUTPUT_FIELDS = {
+    "satoshis": int,
+    "output_script_size": int,
+    "output_script_bytes": str,
+    "script_type": str,
+}
+
+
+def compact_size_length(value):
+    if value < 0xfd:
+        return 1
+    if value <= 0xffff:
+        return 3
+    if value <= 0xffffffff:
+        return 5
+    return 9
+
+
+def check_fields(obj, fields, where, errors):
+    # Returns False when a field is missing or has the wrong type. bool is a
+    # subclass of int, so it is rejected explicitly.
+    if not isinstance(obj, dict):
+        errors.append(f"{where}: expected an object")
+        return False
+    valid = True
+    for key, expected_type in fields.items():
+        value = obj.get(key)
+        if key not in obj:
+            errors.append(f"{where}: missing '{key}'")
+            valid = False
+        elif not isinstance(value, expected_type) or (expected_type is int and isinstance(value, bool)):
+            errors.append(f"{where}: '{key}' should be {expected_type.__name__}, got {type(value).__name__}")
+            valid = False
+    return valid
+
+
+def validate_transaction(transaction, where, errors):
+    if not check_fields(transaction, TRANSACTION_FIELDS, where, errors):
+        return
+    if not HASH_PATTERN.match(transaction['txid']):
+        errors.append(f"{where}: txid is not a 64 digit hex hash")
+    if transaction['stripped_size'] > transaction['total_size']:
+        errors.append(f"{where}: stripped_size is larger than total_size")
+    if 'witness_offsets' in transaction and len(transaction['witness_offsets']) != len(transaction['txn_inputs']):
+        errors.append(f"{where}: {len(transaction['witness_offsets'])} witness offsets for "
+                      f"{len(transaction['txn_inputs'])} inputs")
+    for index, txin in enumerate(transaction['txn_inputs']):
+        input_where = f"{where} input {index}"
+        if not check_fields(txin, INPUT_FIELDS, input_where, errors):
+            continue
+        if not HASH_PATTERN.match(txin['prev_tx_hash']):
+            errors.append(f"{input_where}: prev_tx_hash is not a 64 digit hex hash")
+        if not HEX_PATTERN.match(txin['input_script_bytes']) \
+                or len(txin['input_script_bytes']) != 2 * txin['input_script_size']:
+            errors.append(f"{input_where}: input_script_bytes does not match input_script_size")
+    for index, txout in enumerate(transaction['txn_outputs']):
+        output_where = f"{where} output {index}"
+        if not check_fields(txout, OUTPUT_FIELDS, output_where, errors):
+            continue
+        if not 0 <= txout['satoshis'] <= MAX_SATOSHIS:
+            errors.append(f"{output_where}: satoshis out of range")
+        if not HEX_PATTERN.match(txout['output_script_bytes']) \
+                or len(txout['output_script_bytes']) != 2 * txout['output_script_size']:
+            errors.append(f"{output_where}: output_script_bytes does not match output_script_size")
+
+
+def validate_block(block, where, errors):
+    if not check_fields(block, BLOCK_FIELDS, where, errors):
+        return
+    header = block['block_header']
+    if not check_fields(header, HEADER_FIELDS, f"{where} header", errors):
+        return
+    if block['magic_number'] != "f9beb4d9":
+        errors.append(f"{where}: unexpected magic number {block['magic_number']}")
+    for key in ("block_hash", "prev_block_hash", "merkle_root"):
+        if not HASH_PATTERN.match(header[key]):
+            errors.append(f"{where}: {key} is not a 64 digit hex hash")
+    if not NBITS_PATTERN.match(header['nbits']):
+        errors.append(f"{where}: nbits is not 8 hex digits")
+    if header['block_number'] != block['block_number']:
+        errors.append(f"{where}: header block_number {header['block_number']} differs from {block['block_number']}")
+
+    # Header-only output has no transaction list
+    if 'transactions' not in block:
+        return
+    transactions = block['transactions']
+    if not isinstance(transactions, list):
+        errors.append(f"{where}: 'transactions' should be list")
+        return
+    if block['transaction_count'] != len(transactions):
+        errors.append(f"{where}: transaction_count {block['transaction_count']} but {len(transactions)} transactions")
+    for index, transaction in enumerate(transactions):
+        validate_transaction(transaction, f"{where} transaction {index}", errors)
+    if not all(isinstance(tx, dict) and isinstance(tx.get('txn_inputs'), list)
+               and isinstance(tx.get('txn_outputs'), list) and isinstance(tx.get('total_size'), int)
+               for tx in transactions):
+        return
+    if block.get('txn_input_count') != sum(len(tx['txn_inputs']) for tx in transactions):
+        errors.append(f"{where}: txn_input_count does not match the inputs listed")
+    if block.get('txn_output_count') != sum(len(tx['txn_outputs']) for tx in transactions):
+        errors.append(f"{where}: txn_output_count does not match the outputs listed")
+    expected_size = 80 + compact_size_length(len(transactions)) + sum(tx['total_size'] for tx in transactions)
+    if block['block_size'] != expected_size:
+        errors.append(f"{where}: block_size {block['block_size']} but header and transactions add up to {expected_size}")
+
+
+def iter_json_array(file, key='blocks', chunk_size=READ_CHUNK_SIZE):
+    # Yields the elements of the top level '"key": [...]' array of a JSON
+    # document one by one, decoding each as soon as it is complete in the buffer
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+
+    def read_more():
+        nonlocal buffer, eof
+        chunk = file.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer += chunk
+
+    array_start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    while True:
+        match = array_start.search(buffer)
+        if match:
+            buffer = buffer[match.end():]
+            break
+        if eof:
+            raise ValueError(f"No '{key}' array found")
+        read_more()
+
+    pos = 0
+    while True:
+        # Skip whitespace and separators between elements
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            read_more()
+        if pos >= len(buffer):
+            raise ValueError(f"Unterminated '{key}' array")
+        if buffer[pos] == ']':
+            return
+        try:
+            element, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # Element not complete yet, drop what was consumed and read on
+            buffer = buffer[pos:]
+            pos = 0
+            read_more()
+            continue
+        yield element
+        pos = end
+        if pos > chunk_size:
+            buffer = buffer[pos:]
+            pos = 0
+
+
+def iter_records(path):
+    # Yields (line or position, record) from an NDJSON or JSON output file
+    with open(path) as file:
+        if path.endswith('.ndjson'):
+            for line_number, line in enumerate(file, 1):
+                if line.strip():
+                    yield line_number, json.loads(line)
+        else:
+            yield from enumerate(iter_json_array(file))
+
+
+def validate_file(path, max_errors=MAX_ERRORS):
+    # Returns a per file report: path, record count, error count, the first
+    # 'max_errors' errors and the time it took
+    start = time.perf_counter()
+    errors = []
+    error_count = 0
+    records = 0
+    prev_hash = None
+    prev_number = None
+    try:
+        for position, record in iter_records(path):
+            records += 1
+            record_errors = []
+            if isinstance(record, dict) and 'txid' in record and 'block_header' not in record:
+                # Per transaction NDJSON line
+                validate_transaction(record, f"line {position}", record_errors)
+            else:
+                where = f"line {position}" if path.endswith('.ndjson') else f"block {position}"
+                validate_block(record, where, record_errors)
+                if not record_errors:
+                    header = record['block_header']
+                    if prev_number is not None and record['block_number'] == prev_number + 1 \
+                            and header['prev_block_hash'] != prev_hash:
+                        record_errors.append(f"{where}: prev_block_hash does not match block {prev_number}")
+                    prev_hash, prev_number = header['block_hash'], record['block_number']
+            error_count += len(record_errors)
+            errors.extend(record_errors[:max_errors - len(errors)])
+    except (ValueError, OSError) as error:
+        error_count += 1
+        errors.append(f"unreadable: {error}")
+    return {
+        'path': path,
+        'records': records,
+        'error_count': error_count,
+        'errors': errors[:max_errors],
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def collect_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if name.endswith(('.json', '.ndjson'))))
+        else:
+            files.append(path)
+    return files
+
+
+def validate_files(paths, workers=None, max_errors=MAX_ERRORS):
+    # Validates files (directories are expanded) in a process pool, reports in input order
+    files = collect_files(paths)
+    if workers == 1 or len(files) <= 1:
+        return [validate_file(path, max_errors) for path in files]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(validate_file, files, [max_errors] * len(files)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate Parse_block.py JSON/NDJSON output files.")
+    parser.add_argument('paths', nargs='+', help="output files or directories of them")
+    parser.add_argument('-j', '--workers', type=int, default=0,
+                        help="worker processes, 0 uses one per CPU (default: 0)")
+    parser.add_argument('--max-errors', type=int, default=MAX_ERRORS,
+                        help=f"errors printed per file (default: {MAX_ERRORS})")
+    args = parser.parse_args()
+
+    reports = validate_files(args.paths, args.workers or None, args.max_errors)
+    for report in reports:
+        status = "OK" if report['error_count'] == 0 else "FAIL"
+        print(f"{status:4} {report['path']}: {report['records']} records, {report['error_count']} errors, "
+              f"{report['seconds']:.3f}s")
+        for error in report['errors']:
+            print("     ", error)
+    if not reports or any(report['error_count'] for report in reports):
+        sys.exit(1)
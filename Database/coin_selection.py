@@ -0,0 +1,193 @@
+import random
+from bisect import bisect_left, insort
+from models import Utxo
+
+# Automatic selection of the utxos that pay for a transfer. A strategy gets the
+# available utxos of the source wallet sorted by amount (largest first) and the
+# amount to cover, and returns the utxos to spend or None when it cannot cover
+# it. select_coins sorts once and dispatches by name; register_strategy adds
+# new ones. Only 'interactive' asks anything of the user.
+
+BNB_MAX_TRIES = 100000  # Search steps before branch and bound gives up
+KNAPSACK_ITERATIONS = 1000  # Random subsets tried by the knapsack strategy
+AMOUNT_EPSILON = 1e-9  # Amounts are floats, so equality is checked with a tolerance
+
+
+def largest_first(sorted_utxos, target):
+    # Fewest inputs: spend the biggest utxos until the amount is covered
+    selected_utxos = []
+    total = 0.0
+    for utxo in sorted_utxos:
+        if total >= target - AMOUNT_EPSILON:
+            break
+        selected_utxos.append(utxo)
+        total += utxo.amount
+    return selected_utxos if total >= target - AMOUNT_EPSILON else None
+
+
+def branch_and_bound(sorted_utxos, target, cost_of_change=0.0, max_tries=BNB_MAX_TRIES):
+    # Depth first search for a set of utxos worth between target and
+    # target + cost_of_change, so the transfer needs no change output. Each
+    # step either includes the next utxo or, when the current branch can no
+    # longer match, backtracks to the last included one and excludes it.
+    amounts = [utxo.amount for utxo in sorted_utxos]
+    available = sum(amounts)  # Sum of the utxos not decided yet
+    if available < target - AMOUNT_EPSILON:
+        return None
+
+    included = []  # One flag per decided utxo, in order
+    value = 0.0
+    best = None
+    best_waste = None
+    for _ in range(max_tries):
+        backtrack = False
+        if value + available < target - AMOUNT_EPSILON or value > target + cost_of_change + AMOUNT_EPSILON:
+            backtrack = True
+        elif value >= target - AMOUNT_EPSILON:
+            waste = value - target
+            if best is None or waste < best_waste:
+                best = list(included)
+                best_waste = waste
+                if best_waste <= AMOUNT_EPSILON:
+                    break
+            backtrack = True
+
+        if backtrack:
+            while included and not included[-1]:
+                included.pop()
+                available += amounts[len(included)]
+            if not included:
+                break  # Every combination has been tried
+            included[-1] = False
+            value -= amounts[len(included) - 1]
+        else:
+            amount = amounts[len(included)]
+            available -= amount
+            value += amount
+            included.append(True)
+
+    if best is None:
+        return None
+    return [utxo for utxo, is_included in zip(sorted_utxos, best) if is_included]
+
+
+def approximate_best_subset(utxos, total, target, iterations, rng):
+    # Random subsets of 'utxos' (worth 'total' together), keeping the smallest
+    # one that still reaches the target
+    amounts = [utxo.amount for utxo in utxos]
+    best_included = [True] * len(utxos)
+    best_total = total
+    for _ in range(iterations):
+        if best_total - target <= AMOUNT_EPSILON:
+            break
+        included = [False] * len(utxos)
+        subset_total = 0.0
+        reached_target = False
+        # First pass includes utxos at random, the second adds the rest
+        for first_pass in (True, False):
+            if reached_target:
+                break
+            for position, amount in enumerate(amounts):
+                if (rng.random() < 0.5) if first_pass else not included[position]:
+                    subset_total += amount
+                    included[position] = True
+                    if subset_total >= target - AMOUNT_EPSILON:
+                        reached_target = True
+                        if subset_total < best_total:
+                            best_total = subset_total
+                            best_included = list(included)
+                        subset_total -= amount
+                        included[position] = False
+    return [utxo for utxo, is_included in zip(utxos, best_included) if is_included], best_total
+
+
+def knapsack(sorted_utxos, target, iterations=KNAPSACK_ITERATIONS, rng=None):
+    # Smallest change: an exact utxo if there is one, otherwise the closest
+    # random subset of the smaller utxos or the single smallest larger utxo,
+    # whichever overshoots less
+    rng = rng or random.Random()
+    smaller_utxos = []
+    lowest_larger = None
+    for utxo in sorted_utxos:
+        if abs(utxo.amount - target) <= AMOUNT_EPSILON:
+            return [utxo]
+        if utxo.amount < target:
+            smaller_utxos.append(utxo)
+        else:
+            lowest_larger = utxo  # Sorted largest first, so the last one is the lowest
+
+    total_smaller = sum(utxo.amount for utxo in smaller_utxos)
+    if abs(total_smaller - target) <= AMOUNT_EPSILON:
+        return smaller_utxos
+    if total_smaller < target:
+        return [lowest_larger] if lowest_larger is not None else None
+
+    best_utxos, best_total = approximate_best_subset(smaller_utxos, total_smaller, target, iterations, rng)
+    if lowest_larger is not None and lowest_larger.amount <= best_total:
+        return [lowest_larger]
+    return best_utxos
+
+
+def automatic(sorted_utxos, target):
+    # An exact match when one exists, otherwise the knapsack result
+    return branch_and_bound(sorted_utxos, target) or knapsack(sorted_utxos, target)
+
+
+def interactive(sorted_utxos, target):
+    # The original prompt, for use at a terminal
+    selected_utxos, total_selected_amount = Utxo.show_utxos_and_select(sorted_utxos, target)
+    return selected_utxos if total_selected_amount >= target - AMOUNT_EPSILON else None
+
+
+STRATEGIES = {
+    'auto': automatic,
+    'largest_first': largest_first,
+    'branch_and_bound': branch_and_bound,
+    'knapsack': knapsack,
+    'interactive': interactive,
+}
+
+
+def register_strategy(name, strategy):
+    STRATEGIES[name] = strategy
+
+
+def sort_key(utxo):
+    # Largest first, the order every strategy expects
+    return -utxo.amount
+
+
+def sort_utxos(utxos):
+    return sorted(utxos, key=sort_key)
+
+
+def remove_utxos(sorted_utxos, spent_utxos):
+    # Takes spent utxos out of a list kept in sort_utxos order
+    for utxo in spent_utxos:
+        position = bisect_left(sorted_utxos, sort_key(utxo), key=sort_key)
+        while sorted_utxos[position] is not utxo:
+            position += 1  # Skips other utxos of the same amount
+        del sorted_utxos[position]
+
+
+def insert_utxo(sorted_utxos, utxo):
+    # Adds a new utxo (e.g. change) to a list kept in sort_utxos order
+    insort(sorted_utxos, utxo, key=sort_key)
+
+
+def select_coins(available_utxos, target, strategy='auto', presorted=False):
+    # Returns (selected utxos, their total). 'strategy' is a name from
+    # STRATEGIES or a function with the same signature. Raises ValueError when
+    # nothing gets selected. presorted=True skips the sort for a list already
+    # in sort_utxos order.
+    select = strategy if callable(strategy) else STRATEGIES.get(strategy)
+    if select is None:
+        raise ValueError(f"Unknown coin selection strategy: {strategy}")
+    sorted_utxos = available_utxos if presorted else sort_utxos(available_utxos)
+    selected_utxos = select(sorted_utxos, target)
+    if selected_utxos is None:
+        total_available = sum(utxo.amount for utxo in sorted_utxos)
+        if total_available < target - AMOUNT_EPSILON:
+            raise ValueError(f"Insufficient funds: {total_available} available, {target} needed")
+        raise ValueError(f"No selection of UTXOs covers {target}")
+    return selected_utxos, sum(utxo.amount for utxo in selected_utxos)
@@ -21,7 +21,12 @@ class KeyPair:
  
     # Generating address
     def create_address(self):
-        public_key_bytes = self.public_key.to_string()
+        return KeyPair.public_key_to_address(self.public_key)
+
+    # Address of any verifying key, e.g. to check that a key owns a wallet
+    @staticmethod
+    def public_key_to_address(public_key):
+        public_key_bytes = public_key.to_string()
         sha256_hash = hashlib.sha256(public_key_bytes).digest()
         ripemd160_hash = hashlib.new('ripemd160', sha256_hash).digest()
         address = base58.b58encode(ripemd160_hash)
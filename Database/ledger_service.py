@@ -0,0 +1,69 @@
+import asyncio
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+import models
+from models import Wallet
+from wallet_manager import WalletManager
+
+MAX_WORKERS = 8  # Threads, and so at most this many pooled connections in use
+
+
+#ASYNCIO FRONT END FOR THE LEDGER
+class LedgerService:
+    # WalletManager calls run in a thread pool, each thread on its own session
+    # from models.session, so the event loop never blocks on the database.
+    # Reads run concurrently; writes go through one lock so that transfers
+    # from the same wallet never select the same UTXOs. Keys are passed in,
+    # nothing prompts.
+    def __init__(self, database_url=None, max_workers=MAX_WORKERS, echo=False, **pool_options):
+        if database_url:
+            models.configure_database(database_url, echo=echo, **pool_options)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._write_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    @staticmethod
+    def _call(function, *args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        except Exception:
+            models.session.rollback()
+            raise
+        finally:
+            # Closes the thread's session and returns its connection to the pool
+            models.session.remove()
+
+    async def _read(self, function, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(self._call, function, *args, **kwargs))
+
+    async def _write(self, function, *args, **kwargs):
+        async with self._write_lock:
+            return await self._read(function, *args, **kwargs)
+
+    async def balance(self, address):
+        return await self._read(WalletManager.balance, address)
+
+    async def balances(self, addresses):
+        return await self._read(WalletManager.balances, addresses)
+
+    async def create_wallet(self, address):
+        # Returns the id of the new wallet
+        return await self._write(lambda: Wallet(address).id)
+
+    async def create_money(self, authorized_address, destination_address, public_key, amount, private_key):
+        return await self._write(WalletManager.create_money, authorized_address, destination_address, public_key,
+                                 amount, private_key=private_key)
+
+    async def transfer_batch(self, transfer_details_list, private_keys, strategy='auto'):
+        # Returns (is_valid, error_message) like WalletManager.transfer_batch
+        return await self._write(WalletManager.transfer_batch, transfer_details_list, private_keys, strategy)
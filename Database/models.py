@@ -1,5 +1,8 @@
-from sqlalchemy import create_engine,Integer, Column, String, Float, ForeignKey, JSON, Boolean
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from sqlalchemy import create_engine,Integer, Column, String, Float, ForeignKey, JSON, Boolean, Index, func, inspect, text, event
+from sqlalchemy.orm import declarative_base, relationship, sessionmaker, scoped_session
+import os
+import threading
+import json
 import inquirer
 import ecdsa
 
@@ -13,6 +16,8 @@ class Wallet(Base):
     id = Column(Integer, primary_key=True)
     address = Column(String, unique=True, nullable=False)
     authorize_address_to_create_money = Column(Boolean, default=False)
+    #balance is the sum of the unspent utxos of the wallet, kept up to date whenever utxos are created or spent
+    balance = Column(Float, nullable=False, default=0.0, server_default='0')
     utxos = relationship('Utxo', back_populates='wallet')
    
     def __init__(self, address=None):
@@ -46,6 +51,22 @@ class Wallet(Base):
         # Fetch a wallet based on the provided address
         return session.query(Wallet).filter_by(address=address).first()
 
+    @staticmethod
+    def adjust_balance(wallet_id, amount):
+        # Add 'amount' (negative when spending) to the stored balance, in the
+        # same database transaction as the utxo change that causes it
+        session.query(Wallet).filter(Wallet.id == wallet_id).update({Wallet.balance: Wallet.balance + amount})
+
+    @staticmethod
+    def fetch_balances(addresses, batch_size=500):
+        # Stored balances of many wallets, one query per batch of addresses.
+        # Addresses without a wallet are left out.
+        balances = {}
+        for start in range(0, len(addresses), batch_size):
+            batch = addresses[start:start + batch_size]
+            balances.update(session.query(Wallet.address, Wallet.balance).filter(Wallet.address.in_(batch)).all())
+        return balances
+
 
 # Defining the UTXO model
 class Utxo(Base):
@@ -57,14 +78,22 @@ class Utxo(Base):
     wallet = relationship('Wallet', back_populates='utxos')# can access wallets associated with the utxo
     transaction_id = Column(Integer, ForeignKey('transactions.id'))#Represent the transaction during which the utxo is created
     #transaction represent transaction data associated with the utxo id
-    transaction = relationship('Transaction', back_populates='utxos')#can access transactions associated with the utxo
+    transaction = relationship('Transaction', back_populates='utxos', foreign_keys=[transaction_id])#can access transactions associated with the utxo
+    spent_by_transaction_id = Column(Integer, ForeignKey('transactions.id'), index=True)#Represent the transaction that used the utxo as input, None while unspent
+    spent_by_transaction = relationship('Transaction', back_populates='spent_utxos', foreign_keys=[spent_by_transaction_id])
+    #Unspent utxos of a wallet are read straight from this index
+    __table_args__ = (Index('ix_utxos_wallet_unspent', 'wallet_id', 'spent_by_transaction_id'),)
     
     @staticmethod
-    def create_utxo(wallet_id, transaction_id, amount):
+    def create_utxo(wallet_id, transaction_id, amount, commit=True):
         # Insert a row into the 'utxos' table
         utxo = Utxo(wallet_id=wallet_id, transaction_id=transaction_id, amount=amount)
         session.add(utxo)
-        session.commit()
+        Wallet.adjust_balance(wallet_id, amount)
+        if commit:
+            session.commit()
+        else:
+            session.flush()
         print(f"UTXO inserted: Wallet ID - {wallet_id}, Amount - {amount}")
         return utxo
     
@@ -75,9 +104,15 @@ class Utxo(Base):
     
     @staticmethod
     def fetch_available_utxos(source_wallet):
-        #Fetching all the utxos associated will the wallet
-        source_utxos = Utxo.fetch_utxos_by_wallet(source_wallet.id)
-        return [utxo for utxo in source_utxos if not Transaction.is_utxo_spent(utxo.id)]
+        #Fetching the unspent utxos associated with the wallet
+        return session.query(Utxo).filter(Utxo.wallet_id == source_wallet.id,
+                                          Utxo.spent_by_transaction_id.is_(None)).all()
+
+    @staticmethod
+    def fetch_wallet_balance(wallet_id):
+        #Sum of the unspent utxos of a wallet in one indexed query
+        return session.query(func.coalesce(func.sum(Utxo.amount), 0.0)).filter(
+            Utxo.wallet_id == wallet_id, Utxo.spent_by_transaction_id.is_(None)).scalar()
 
     @staticmethod
     def calculate_total_balance(utxos):
@@ -139,7 +174,7 @@ class Utxo(Base):
         cls._add_used_utxo(utxo for utxo in filtered_utxos if utxo.id in selected_utxos_ids)
 
         # Corrected line to create utxos_dict
-        utxos_dict = {utxo_id: utxo for utxo_id, utxo in zip(selected_utxos_ids, filtered_utxos)}
+        utxos_dict = {str(utxo.id): utxo for utxo in filtered_utxos}
         
         #utxos selected by the users to cover the transfer amount
         selected_utxos = [utxos_dict[utxo_id] for utxo_id in selected_utxos_ids]
@@ -162,10 +197,12 @@ class Transaction(Base):
     signatures = Column(JSON, nullable=False)
     create_money = Column(Boolean, nullable=False)
     #Here utxos represent all the utxos associated with transaction id
-    utxos = relationship('Utxo', back_populates='transaction')# can access utxos associated with the transaction
+    utxos = relationship('Utxo', back_populates='transaction', foreign_keys='Utxo.transaction_id')# can access utxos associated with the transaction
+    #spent_utxos represent the utxos used as inputs by the transaction
+    spent_utxos = relationship('Utxo', back_populates='spent_by_transaction', foreign_keys='Utxo.spent_by_transaction_id')
 
     @staticmethod
-    def create_transaction(inputs, outputs, signatures, create_money):
+    def create_transaction(inputs, outputs, signatures, create_money, commit=True):
         # Extract Utxo IDs from the list of Utxo objects
         input_ids = [utxo.id for utxo in inputs]
 
@@ -177,9 +214,33 @@ class Transaction(Base):
             create_money=create_money,
         )
         session.add(transaction)
-        session.commit()
+        if inputs:
+            session.flush()  # Assigns transaction.id
+        # Marking the inputs as spent by this transaction. The update only
+        # matches unspent rows, so a UTXO spent meanwhile by another process
+        # (or session) is caught here instead of being spent and debited twice.
+        for utxo in inputs:
+            marked = session.query(Utxo).filter(Utxo.id == utxo.id, Utxo.spent_by_transaction_id.is_(None)).update(
+                {Utxo.spent_by_transaction_id: transaction.id})
+            if marked != 1:
+                raise ValueError(f"UTXO {utxo.id} is already spent")
+            Wallet.adjust_balance(utxo.wallet_id, -utxo.amount)
+        if commit:
+            session.commit()
+        else:
+            session.flush()  # Assigns transaction.id for the utxos created next
         print(f'Transaction inserted')
         return transaction
+
+    @staticmethod
+    def transaction_data_bytes(input_ids, outputs, create_money):
+        # The bytes that get signed for a transaction
+        transaction_data = {
+            "inputs": input_ids,
+            "outputs": outputs,
+            "create_money": create_money
+        }
+        return str(transaction_data).encode('utf-8')
     
     @classmethod
     def verify_create_money_inputs(cls, authorized_address, destination_address, amount):
@@ -218,8 +279,8 @@ class Transaction(Base):
     
     @staticmethod
     def is_utxo_spent(utxo_id):
-        # Check if a UTXO is spent by looking at transactions' inputs
-        return session.query(Transaction).filter(Transaction.inputs.contains([utxo_id])).count() > 0
+        # Check if a UTXO is spent by looking up the transaction that used it as input
+        return session.query(Utxo.spent_by_transaction_id).filter(Utxo.id == utxo_id).scalar() is not None
     
     #The following code verifies the source addresses and transfer details list
     @classmethod
@@ -241,12 +302,98 @@ class Transaction(Base):
         return True, None
     
 
-# Creating an SQLite database
-engine = create_engine('sqlite:///wallet.db', echo=True)
-
-# Create the tables in the database
-Base.metadata.create_all(bind=engine)
-
-# Create a session to interact with the database
-Session = sessionmaker(bind=engine)
-session = Session()
\ No newline at end of file
+def migrate_spent_tracking(engine):
+    # wallet.db files created before utxos.spent_by_transaction_id existed get
+    # the column and its indexes, then it is filled from the JSON inputs of the
+    # existing transactions. Does nothing on an up to date database.
+    columns = [column['name'] for column in inspect(engine).get_columns('utxos')]
+    if 'spent_by_transaction_id' in columns:
+        return
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE utxos ADD COLUMN spent_by_transaction_id INTEGER REFERENCES transactions (id)"))
+        for index in Utxo.__table__.indexes:
+            index.create(connection, checkfirst=True)
+        spends = [
+            {'transaction_id': transaction_id, 'utxo_id': utxo_id}
+            for transaction_id, inputs in connection.execute(text("SELECT id, inputs FROM transactions"))
+            for utxo_id in json.loads(inputs or 'null') or []
+        ]
+        if spends:
+            connection.execute(text("UPDATE utxos SET spent_by_transaction_id = :transaction_id WHERE id = :utxo_id"), spends)
+    print(f"Migrated utxos table: {len(spends)} spent UTXOs recorded")
+
+
+def migrate_wallet_balances(engine):
+    # Adds wallets.balance to older wallet.db files and fills it from the
+    # unspent utxos. Needs spent_by_transaction_id, so it runs after
+    # migrate_spent_tracking.
+    columns = [column['name'] for column in inspect(engine).get_columns('wallets')]
+    if 'balance' in columns:
+        return
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE wallets ADD COLUMN balance FLOAT NOT NULL DEFAULT 0"))
+        connection.execute(text("UPDATE wallets SET balance = (SELECT COALESCE(SUM(amount), 0) FROM utxos "
+                                "WHERE utxos.wallet_id = wallets.id AND utxos.spent_by_transaction_id IS NULL)"))
+    print("Migrated wallets table: balances filled from unspent UTXOs")
+
+
+#Database used when nothing else is configured, WALLET_DATABASE_URL points it elsewhere (e.g. a PostgreSQL server)
+DATABASE_URL = 'sqlite:///wallet.db'
+SQLITE_BUSY_TIMEOUT = 5000  # Milliseconds a writer waits for another one to finish
+
+
+def create_database_engine(url, echo=False, **pool_options):
+    # pool_options (pool_size, max_overflow, pool_timeout, ...) are passed to
+    # create_engine. SQLite files are switched to WAL so readers do not block
+    # the writer, and wait for locks instead of failing right away.
+    engine = create_engine(url, echo=echo, **pool_options)
+    if engine.dialect.name == 'sqlite':
+        @event.listens_for(engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+            cursor.close()
+    return engine
+
+
+def migrate_database(engine):
+    # Brings a wallet.db created by an older version up to date. Each step
+    # checks the schema first, so this does nothing on a current database.
+    migrate_spent_tracking(engine)
+    migrate_wallet_balances(engine)
+
+
+def configure_database(url=None, echo=False, **pool_options):
+    # (Re)binds the module to a database: creates the missing tables,
+    # migrates an older schema and points every session handed out by
+    # 'session' at the new engine. The engine it replaces is disposed.
+    global engine
+    previous_engine = engine
+    engine = create_database_engine(url or os.environ.get('WALLET_DATABASE_URL', DATABASE_URL), echo=echo,
+                                    **pool_options)
+    Base.metadata.create_all(bind=engine)
+    migrate_database(engine)
+    session.remove()
+    Session.configure(bind=engine)
+    if previous_engine is not None:
+        previous_engine.dispose()
+    return engine
+
+
+def create_session():
+    # The default database is only opened when the first session is needed,
+    # not when the module is imported
+    with _configure_lock:
+        if engine is None:
+            configure_database(echo=True)
+    return Session()
+
+
+# Sessions to interact with the database. 'session' gives each thread its own
+# session, so the model methods can run from several threads at once; call
+# session.remove() when a thread is done to return its connection to the pool.
+Session = sessionmaker()
+session = scoped_session(create_session)
+engine = None  # Set by configure_database
+_configure_lock = threading.Lock()  # Threads starting together configure it once
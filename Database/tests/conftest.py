@@ -0,0 +1,40 @@
+import pytest
+import os
+import sys
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import models
+
+
+@pytest.fixture(autouse=True)
+def default_database(monkeypatch):
+    # models opens WALLET_DATABASE_URL on first use; the tests never reach
+    # wallet.db, an in-memory database stands in for it
+    monkeypatch.setenv('WALLET_DATABASE_URL', 'sqlite://')
+
+
+@pytest.fixture
+def db_session(mocker, tmp_path):
+    # A real session on an empty database in place of the module level one
+    engine = create_engine(f"sqlite:///{tmp_path / 'wallet.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    mocker.patch('models.session', session)
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def restore_database():
+    # For tests that rebind models to another database: the engine it had is
+    # put back afterwards and the test's engine disposed
+    previous_engine = models.engine
+    yield
+    test_engine = models.engine
+    models.session.remove()
+    models.Session.configure(bind=previous_engine)
+    models.engine = previous_engine
+    if test_engine is not None and test_engine is not previous_engine:
+        test_engine.dispose()
@@ -0,0 +1,92 @@
+import pytest
+import os
+import sys
+import random
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models import Utxo
+from coin_selection import (select_coins, register_strategy, largest_first, branch_and_bound, knapsack,
+                            sort_utxos, remove_utxos, insert_utxo, STRATEGIES)
+
+
+def make_utxos(*amounts):
+    return [SimpleNamespace(id=index + 1, amount=amount) for index, amount in enumerate(amounts)]
+
+
+def amounts(utxos):
+    return sorted(utxo.amount for utxo in utxos)
+
+
+def test_largest_first():
+    selected, total = select_coins(make_utxos(1.0, 7.0, 3.0, 5.0), 9.0, 'largest_first')
+    assert amounts(selected) == [5.0, 7.0]
+    assert total == 12.0
+
+
+def test_branch_and_bound_finds_exact_match():
+    selected, total = select_coins(make_utxos(1.0, 7.0, 3.0, 5.0, 2.5), 9.0, 'branch_and_bound')
+    assert total == 9.0
+    assert amounts(selected) == [1.0, 3.0, 5.0]
+
+
+def test_branch_and_bound_without_exact_match():
+    utxos = sorted(make_utxos(4.0, 7.0), key=lambda utxo: utxo.amount, reverse=True)
+    assert branch_and_bound(utxos, 5.0) is None
+    assert amounts(branch_and_bound(utxos, 5.0, cost_of_change=2.0)) == [7.0]
+    with pytest.raises(ValueError, match="No selection of UTXOs covers 5.0"):
+        select_coins(utxos, 5.0, 'branch_and_bound')
+
+
+def test_knapsack_prefers_smallest_overshoot():
+    utxos = sorted(make_utxos(100.0, 2.0, 3.0, 4.5), key=lambda utxo: utxo.amount, reverse=True)
+    assert amounts(knapsack(utxos, 5.0, rng=random.Random(1))) == [2.0, 3.0]
+    assert amounts(knapsack(utxos, 9.0, rng=random.Random(1))) == [2.0, 3.0, 4.5]
+    # The smaller utxos do not reach the target, the lowest larger one is used
+    assert amounts(knapsack(utxos, 10.0, rng=random.Random(1))) == [100.0]
+
+
+def test_auto_falls_back_to_knapsack():
+    # No exact match for 8, 6 + 3 overshoots less than 10
+    selected, total = select_coins(make_utxos(10.0, 6.0, 3.0), 8.0)
+    assert amounts(selected) == [3.0, 6.0]
+
+
+def test_insufficient_funds():
+    for strategy in ('auto', 'largest_first', 'branch_and_bound', 'knapsack'):
+        with pytest.raises(ValueError, match="Insufficient funds: 3.0 available, 5.0 needed"):
+            select_coins(make_utxos(1.0, 2.0), 5.0, strategy)
+
+
+def test_unknown_and_custom_strategies(monkeypatch):
+    with pytest.raises(ValueError, match="Unknown coin selection strategy"):
+        select_coins(make_utxos(1.0), 1.0, 'missing')
+
+    monkeypatch.setitem(STRATEGIES, 'smallest_first', None)
+    register_strategy('smallest_first', lambda sorted_utxos, target: largest_first(sorted_utxos[::-1], target))
+    selected, total = select_coins(make_utxos(5.0, 1.0, 2.0), 3.0, 'smallest_first')
+    assert amounts(selected) == [1.0, 2.0]
+    selected, total = select_coins(make_utxos(5.0, 1.0), 1.0, lambda sorted_utxos, target: sorted_utxos[:1])
+    assert total == 5.0
+
+
+def test_interactive_strategy(mocker):
+    utxos = make_utxos(1.0, 4.0)
+    prompt = mocker.patch.object(Utxo, 'show_utxos_and_select', return_value=([utxos[1]], 4.0))
+
+    assert select_coins(utxos, 3.0, 'interactive') == ([utxos[1]], 4.0)
+    prompt.assert_called_once()
+    prompt.return_value = ([utxos[0]], 1.0)
+    with pytest.raises(ValueError):
+        select_coins(utxos, 3.0, 'interactive')
+
+
+def test_sorted_list_updates():
+    utxos = make_utxos(3.0, 5.0, 3.0, 1.0)
+    sorted_utxos = sort_utxos(utxos)
+    remove_utxos(sorted_utxos, [utxos[2], utxos[1]])
+    assert [utxo.id for utxo in sorted_utxos] == [1, 4]
+    change = SimpleNamespace(id=5, amount=2.0)
+    insert_utxo(sorted_utxos, change)
+    assert [utxo.id for utxo in sorted_utxos] == [1, 5, 4]
+    selected, total = select_coins(sorted_utxos, 2.0, 'largest_first', presorted=True)
+    assert selected == [utxos[0]]
@@ -0,0 +1,57 @@
+import pytest
+import os
+import sys
+import asyncio
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import models
+from keys import KeyPair
+from ledger_service import LedgerService
+
+
+@pytest.fixture
+def database_url(tmp_path, restore_database):
+    return f"sqlite:///{tmp_path / 'wallet.db'}"
+
+
+def run_service(database_url, scenario):
+    async def main():
+        async with LedgerService(database_url, max_workers=4) as service:
+            return await scenario(service)
+    return asyncio.run(main())
+
+
+async def fund_wallets(service, amount):
+    # A sender holding 'amount' and an empty receiver
+    sender, receiver = KeyPair(), KeyPair()
+    for keypair in (sender, receiver):
+        await service.create_wallet(keypair.create_address())
+    await service.create_money(sender.create_address(), sender.create_address(), sender.public_key, amount,
+                               sender.private_key)
+    return sender, receiver
+
+
+def test_concurrent_reads(database_url):
+    async def scenario(service):
+        sender, receiver = await fund_wallets(service, 100.0)
+        addresses = [sender.create_address(), receiver.create_address()]
+        balances = await asyncio.gather(*(service.balance(addresses[index % 2]) for index in range(50)))
+        return balances, await service.balances(addresses + ['missing'])
+
+    balances, by_address = run_service(database_url, scenario)
+    assert balances == [100.0, 0.0] * 25
+    assert sorted(by_address.values()) == [0.0, 0.0, 100.0]
+
+
+def test_writes_are_serialized(database_url):
+    # Two batches each spend 60 of the same 100, only one of them can succeed
+    async def scenario(service):
+        sender, receiver = await fund_wallets(service, 100.0)
+        transfers = [{'source_address': sender.create_address(), 'destination_address': receiver.create_address(),
+                      'amount': 60.0}]
+        keys = {sender.create_address(): sender.private_key}
+        results = await asyncio.gather(service.transfer_batch(transfers, keys), service.transfer_batch(transfers, keys))
+        return results, await service.balance(sender.create_address()), await service.balance(receiver.create_address())
+
+    results, sender_balance, receiver_balance = run_service(database_url, scenario)
+    assert sorted(is_valid for is_valid, _ in results) == [False, True]
+    assert (sender_balance, receiver_balance) == (40.0, 60.0)
@@ -2,8 +2,10 @@ import pytest
 import os
 import sys
 from pytest_mock import mocker
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import declarative_base
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import models
 from models import Wallet, Utxo, Transaction
 from ecdsa import SigningKey, SECP256k1
 
@@ -83,6 +85,8 @@ def test_create_transaction(mocker):
     
     # Simulate the behavior of Utxo.create_utxo to return these mock objects
     mock_session.query().get.side_effect = [utxo1, utxo2, utxo3]
+    # Each input is still unspent, so marking it updates one row
+    mock_session.query().filter().update.return_value = 1
 
     # Test creating a transaction with UTXO objects as inputs
     inputs = [utxo1, utxo2, utxo3]  # UTXO objects instead of IDs
@@ -188,4 +192,111 @@ def test_validate_transfer(source_addresses, transfer_details_list, expected_res
 
     # Assertions
     assert result == expected_result
-    assert error == expected_error
\ No newline at end of file
+    assert error == expected_error
+
+     #TEST CODES FOR SPENT TRACKING
+
+def test_spent_utxos_leave_the_balance(db_session):
+    wallet = Wallet("spender")
+    other = Wallet("receiver")
+    funding = Transaction.create_transaction([], [{'address': 'spender', 'amount': 15.0}], [], True)
+    utxo1 = Utxo.create_utxo(wallet.id, funding.id, 10.0)
+    utxo2 = Utxo.create_utxo(wallet.id, funding.id, 5.0)
+    assert Utxo.fetch_wallet_balance(wallet.id) == 15.0
+
+    spend = Transaction.create_transaction([utxo1], [{'address': 'receiver', 'amount': 10.0}], [], False)
+    Utxo.create_utxo(other.id, spend.id, 10.0)
+
+    assert Transaction.is_utxo_spent(utxo1.id)
+    assert not Transaction.is_utxo_spent(utxo2.id)
+    assert Utxo.fetch_available_utxos(wallet) == [utxo2]
+    assert Utxo.fetch_wallet_balance(wallet.id) == 5.0
+    assert Utxo.fetch_wallet_balance(other.id) == 10.0
+    assert spend.spent_utxos == [utxo1]
+
+
+def test_stored_balances_follow_utxos(db_session):
+    wallet = Wallet("spender")
+    other = Wallet("receiver")
+    funding = Transaction.create_transaction([], [{'address': 'spender', 'amount': 15.0}], [], True)
+    utxo1 = Utxo.create_utxo(wallet.id, funding.id, 10.0)
+    Utxo.create_utxo(wallet.id, funding.id, 5.0)
+    spend = Transaction.create_transaction([utxo1], [{'address': 'receiver', 'amount': 10.0}], [], False)
+    Utxo.create_utxo(other.id, spend.id, 10.0)
+
+    assert wallet.balance == Utxo.fetch_wallet_balance(wallet.id) == 5.0
+    assert other.balance == 10.0
+    assert Wallet.fetch_balances(["spender", "receiver", "missing"], batch_size=1) == {"spender": 5.0, "receiver": 10.0}
+
+
+def test_migrate_spent_tracking(tmp_path):
+    # Schema of a wallet.db created before spent_by_transaction_id existed
+    engine = create_engine(f"sqlite:///{tmp_path / 'wallet.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE transactions (id INTEGER PRIMARY KEY, inputs JSON, outputs JSON NOT NULL, "
+                                "signatures JSON NOT NULL, create_money BOOLEAN NOT NULL)"))
+        connection.execute(text("CREATE TABLE utxos (id INTEGER PRIMARY KEY, amount FLOAT NOT NULL, wallet_id INTEGER, "
+                                "transaction_id INTEGER)"))
+        connection.execute(text("INSERT INTO transactions VALUES (1, '[]', '[]', '[]', 1), (2, '[1]', '[]', '[]', 0)"))
+        connection.execute(text("INSERT INTO utxos VALUES (1, 10.0, 1, 1), (2, 10.0, 2, 2)"))
+
+    models.migrate_spent_tracking(engine)
+    models.migrate_spent_tracking(engine)  # Already migrated, nothing to do
+
+    with engine.connect() as connection:
+        rows = connection.execute(text("SELECT id, spent_by_transaction_id FROM utxos ORDER BY id")).fetchall()
+    assert [tuple(row) for row in rows] == [(1, 2), (2, None)]
+    assert 'ix_utxos_wallet_unspent' in [index['name'] for index in inspect(engine).get_indexes('utxos')]
+
+
+def test_migrate_wallet_balances(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'wallet.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE wallets (id INTEGER PRIMARY KEY, address VARCHAR NOT NULL UNIQUE)"))
+        connection.execute(text("CREATE TABLE utxos (id INTEGER PRIMARY KEY, amount FLOAT NOT NULL, wallet_id INTEGER, "
+                                "transaction_id INTEGER, spent_by_transaction_id INTEGER)"))
+        connection.execute(text("INSERT INTO wallets VALUES (1, 'a'), (2, 'b')"))
+        connection.execute(text("INSERT INTO utxos VALUES (1, 10.0, 1, 1, 2), (2, 4.0, 1, 2, NULL), (3, 6.0, 1, 2, NULL)"))
+
+    models.migrate_wallet_balances(engine)
+    models.migrate_wallet_balances(engine)
+
+    with engine.connect() as connection:
+        rows = connection.execute(text("SELECT address, balance FROM wallets ORDER BY id")).fetchall()
+    assert [tuple(row) for row in rows] == [('a', 10.0), ('b', 0.0)]
+
+
+def test_configure_database_migrates_an_old_schema(tmp_path, mocker, restore_database):
+    # A wallet.db from before spent tracking and stored balances
+    url = f"sqlite:///{tmp_path / 'wallet.db'}"
+    engine = create_engine(url)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE wallets (id INTEGER PRIMARY KEY, address VARCHAR NOT NULL UNIQUE, "
+                                "authorize_address_to_create_money BOOLEAN)"))
+        connection.execute(text("CREATE TABLE transactions (id INTEGER PRIMARY KEY, inputs JSON, outputs JSON NOT NULL, "
+                                "signatures JSON NOT NULL, create_money BOOLEAN NOT NULL)"))
+        connection.execute(text("CREATE TABLE utxos (id INTEGER PRIMARY KEY, amount FLOAT NOT NULL, wallet_id INTEGER, "
+                                "transaction_id INTEGER)"))
+        connection.execute(text("INSERT INTO wallets VALUES (1, 'a', 0)"))
+        connection.execute(text("INSERT INTO transactions VALUES (1, '[]', '[]', '[]', 1)"))
+        connection.execute(text("INSERT INTO utxos VALUES (1, 10.0, 1, 1)"))
+    engine.dispose()
+
+    first_engine = models.configure_database(url)
+    assert Wallet.fetch_wallet_by_address('a').balance == 10.0
+    assert Utxo.fetch_available_utxos(Wallet.fetch_wallet_by_address('a'))[0].amount == 10.0
+
+    dispose = mocker.spy(first_engine, 'dispose')
+    models.configure_database(f"sqlite:///{tmp_path / 'other.db'}")
+    dispose.assert_called_once()  # The engine it replaced
+
+
+def test_default_database_is_opened_on_first_use(tmp_path, monkeypatch, restore_database):
+    path = tmp_path / 'lazy.db'
+    monkeypatch.setenv('WALLET_DATABASE_URL', f"sqlite:///{path}")
+    models.session.remove()
+    monkeypatch.setattr(models, 'engine', None)
+
+    assert not path.exists()
+    assert models.session.query(Wallet).count() == 0
+    assert path.exists()
@@ -3,6 +3,7 @@ from pytest_mock import mocker
 from unittest.mock import patch, MagicMock
 import os,sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from keys import KeyPair
 from wallet_manager import Ledger, WalletManager
 from models import Wallet, Utxo, Transaction
 
@@ -10,16 +11,148 @@ from models import Wallet, Utxo, Transaction
 class TestWalletManager:
 
     def test_balance_wallet_found(self, mocker):
-        mock_wallet = MagicMock()
-        mock_utxos = [MagicMock(amount=10.0), MagicMock(amount=5.0)]
+        mock_wallet = MagicMock(balance=15.0)
         
         mocker.patch.object(Wallet, 'fetch_wallet_by_address', return_value=mock_wallet)
-        mocker.patch.object(Utxo, 'fetch_available_utxos', return_value=mock_utxos)
-        mocker.patch.object(Utxo, 'calculate_total_balance', return_value=15.0)
+        mock_available = mocker.patch.object(Utxo, 'fetch_available_utxos')
         
         assert WalletManager.balance('address') == 15.0
+        mock_available.assert_not_called()
 
     def test_balance_wallet_not_found(self, mocker):
         mocker.patch.object(Wallet, 'fetch_wallet_by_address', return_value=None)
         
         assert WalletManager.balance('address') == 0.0
+
+
+    def test_balances(self, mocker):
+        mock_fetch = mocker.patch.object(Wallet, 'fetch_balances', return_value={'a': 3.0, 'b': 4.0})
+
+        assert WalletManager.balances(['a', 'b', 'missing']) == {'a': 3.0, 'b': 4.0, 'missing': 0.0}
+        mock_fetch.assert_called_once_with(['a', 'b', 'missing'])
+
+
+@pytest.fixture
+def funded_wallets(db_session):
+    # Two key pairs with wallets, the first one holding 100 in two UTXOs
+    keypairs = [KeyPair(), KeyPair()]
+    wallets = [Wallet(keypair.create_address()) for keypair in keypairs]
+    funding = Transaction.create_transaction([], [], [], True)
+    Utxo.create_utxo(wallets[0].id, funding.id, 60.0)
+    Utxo.create_utxo(wallets[0].id, funding.id, 40.0)
+    return keypairs, wallets
+
+
+class TestTransferBatch:
+
+    def test_applies_all_transfers_with_one_commit(self, funded_wallets, db_session, mocker):
+        (sender, receiver), (sender_wallet, receiver_wallet) = funded_wallets
+        commit = mocker.spy(db_session, 'commit')
+        transfers = [
+            {'source_address': sender_wallet.address, 'destination_address': receiver_wallet.address, 'amount': 50.0},
+            {'source_address': sender_wallet.address, 'destination_address': receiver_wallet.address, 'amount': 30.0},
+        ]
+
+        assert WalletManager.transfer_batch(transfers, {sender_wallet.address: sender.private_key}) == (True, None)
+        assert commit.call_count == 1
+        assert WalletManager.balance(sender_wallet.address) == 20.0
+        assert WalletManager.balance(receiver_wallet.address) == 80.0
+        assert Utxo.fetch_wallet_balance(sender_wallet.id) == 20.0
+
+    def test_failure_rolls_back_everything(self, funded_wallets, db_session):
+        (sender, receiver), (sender_wallet, receiver_wallet) = funded_wallets
+        transfers = [
+            {'source_address': sender_wallet.address, 'destination_address': receiver_wallet.address, 'amount': 50.0},
+            {'source_address': sender_wallet.address, 'destination_address': receiver_wallet.address, 'amount': 70.0},
+        ]
+
+        is_valid, error = WalletManager.transfer_batch(transfers, {sender_wallet.address: sender.private_key})
+        assert not is_valid
+        assert error.startswith("Insufficient funds")
+        assert WalletManager.balance(sender_wallet.address) == 100.0
+        assert WalletManager.balance(receiver_wallet.address) == 0.0
+        assert db_session.query(Transaction).count() == 1
+
+    def test_utxos_are_fetched_once_per_source_wallet(self, funded_wallets, db_session, mocker):
+        (sender, receiver), (sender_wallet, receiver_wallet) = funded_wallets
+        fetch = mocker.spy(Utxo, 'fetch_available_utxos')
+        transfers = [
+            {'source_address': sender_wallet.address, 'destination_address': receiver_wallet.address, 'amount': 55.0},
+            {'source_address': receiver_wallet.address, 'destination_address': sender_wallet.address, 'amount': 15.0},
+            # Needs the change of the first transfer and the payment of the second
+            {'source_address': sender_wallet.address, 'destination_address': receiver_wallet.address, 'amount': 60.0},
+        ]
+        private_keys = {sender_wallet.address: sender.private_key, receiver_wallet.address: receiver.private_key}
+
+        assert WalletManager.transfer_batch(transfers, private_keys) == (True, None)
+        assert fetch.call_count == 2
+        assert WalletManager.balance(sender_wallet.address) == 0.0
+        assert WalletManager.balance(receiver_wallet.address) == 100.0
+        assert Utxo.fetch_wallet_balance(sender_wallet.id) == 0.0
+
+    def test_stale_utxo_is_not_spent_twice(self, funded_wallets, db_session, mocker):
+        (sender, receiver), (sender_wallet, receiver_wallet) = funded_wallets
+        # A stale view of the wallet: the 60 UTXO was already spent by another writer
+        stale_utxos = Utxo.fetch_available_utxos(sender_wallet)
+        WalletManager.transfer_batch(
+            [{'source_address': sender_wallet.address, 'destination_address': receiver_wallet.address, 'amount': 60.0}],
+            {sender_wallet.address: sender.private_key})
+        mocker.patch('models.Utxo.fetch_available_utxos', return_value=stale_utxos)
+        transfers = [
+            {'source_address': sender_wallet.address, 'destination_address': receiver_wallet.address, 'amount': 60.0},
+        ]
+
+        is_valid, error = WalletManager.transfer_batch(transfers, {sender_wallet.address: sender.private_key})
+        assert not is_valid
+        assert error.endswith("is already spent")
+        assert WalletManager.balance(sender_wallet.address) == 40.0
+        assert WalletManager.balance(receiver_wallet.address) == 60.0
+
+    def test_rejects_an_unknown_source_address(self, funded_wallets):
+        (sender, receiver), (sender_wallet, receiver_wallet) = funded_wallets
+        stranger = KeyPair()  # Valid key, but no wallet for its address
+        transfers = [
+            {'source_address': sender_wallet.address, 'destination_address': receiver_wallet.address, 'amount': 10.0},
+            {'source_address': stranger.create_address(), 'destination_address': receiver_wallet.address, 'amount': 5.0},
+        ]
+        private_keys = {sender_wallet.address: sender.private_key, stranger.create_address(): stranger.private_key}
+
+        is_valid, error = WalletManager.transfer_batch(transfers, private_keys)
+        assert (is_valid, error) == (False, f"Source wallet not found: {stranger.create_address()}")
+        assert WalletManager.balance(sender_wallet.address) == 100.0
+        assert WalletManager.balance(receiver_wallet.address) == 0.0
+
+    def test_rejects_a_key_for_another_address(self, funded_wallets):
+        (sender, receiver), (sender_wallet, receiver_wallet) = funded_wallets
+        transfers = [
+            {'source_address': sender_wallet.address, 'destination_address': receiver_wallet.address, 'amount': 10.0},
+        ]
+
+        is_valid, error = WalletManager.transfer_batch(transfers, {sender_wallet.address: receiver.private_key})
+        assert (is_valid, error) == (False, f"Key does not belong to {sender_wallet.address}")
+
+
+class TestNonInteractiveTransfer:
+
+    def test_transfer_money_with_keys_does_not_prompt(self, funded_wallets, mocker):
+        (sender, receiver), (sender_wallet, receiver_wallet) = funded_wallets
+        prompt = mocker.patch('builtins.input')
+        transfers = [
+            {'source_address': sender_wallet.address, 'destination_address': receiver_wallet.address, 'amount': 40.0},
+        ]
+
+        WalletManager.transfer_money([sender_wallet.address], transfers, [sender.public_key],
+                                     private_keys={sender_wallet.address: sender.private_key}, strategy='auto')
+        prompt.assert_not_called()
+        # The exact 40 UTXO is picked, no change is needed
+        assert WalletManager.balance(sender_wallet.address) == 60.0
+        assert len(Utxo.fetch_available_utxos(sender_wallet)) == 1
+
+    def test_create_money_with_key_does_not_prompt(self, funded_wallets, mocker):
+        (sender, receiver), (sender_wallet, receiver_wallet) = funded_wallets
+        prompt = mocker.patch('builtins.input')
+
+        WalletManager.create_money(sender_wallet.address, receiver_wallet.address, sender.public_key, 5.0,
+                                   private_key=sender.private_key)
+        prompt.assert_not_called()
+        assert WalletManager.balance(receiver_wallet.address) == 5.0
@@ -1,5 +1,7 @@
+import models
 from models import Wallet, Utxo, Transaction
 from keys import KeyPair
+from coin_selection import select_coins, sort_utxos, remove_utxos, insert_utxo
 import binascii
 
 #CLASS TO CREATE MONEY, TRANSFER MONEY AND CHECK BALANCE
@@ -11,10 +13,12 @@ class Ledger:
                 inputs=[],
                 outputs=[{'address': destination_address, 'amount': amount}],
                 create_money=True,
-                signatures=[signature.hex()]
+                signatures=[signature.hex()],
+                commit=False
             )
-            # Creating utxos
-            Utxo.create_utxo(destination_wallet.id, transaction.id, amount)
+            # Creating utxos, committed together with the transaction
+            Utxo.create_utxo(destination_wallet.id, transaction.id, amount, commit=False)
+            models.session.commit()
 
             print(f"Money created and transferred successfully from {authorized_address} to {destination_address}")
         else:
@@ -24,37 +28,56 @@ class Ledger:
     @classmethod
     def process_transaction(cls, is_valid_signature, selected_utxos_ids, destination_address, transfer_amount,
                             total_selected_amount,source_address,source_wallet, signature):
-        if is_valid_signature:
-            signature_hex = binascii.hexlify(signature).decode()  # Convert signature bytes to hex string
-            transaction = Transaction.create_transaction(
-                inputs=selected_utxos_ids,
-                outputs=[{'address': destination_address, 'amount': transfer_amount}],
-                create_money=False,
-                signatures=[signature_hex]  # Use the hex string representation of the signature
-            )
-
-            Utxo.create_utxo(
-                Wallet.fetch_wallet_by_address(destination_address).id,
-                transaction.id,
-                transfer_amount
-            )
-        else:
+        if not is_valid_signature:
             print("Not a valid signature")
+            return
+
+        destination_wallet = Wallet.fetch_wallet_by_address(destination_address)
+        # The transaction, the destination utxo and the change are committed together
+        try:
+            cls.apply_transfer(selected_utxos_ids, total_selected_amount, source_wallet, destination_wallet,
+                               transfer_amount, signature)
+            models.session.commit()
+        except ValueError as error:
+            models.session.rollback()
+            print(f"Transfer failed, nothing was applied: {error}")
+            return
+
+        print(f"Money transferred successfully from {source_address} to {destination_address}.")
+
+    @classmethod
+    def apply_transfer(cls, selected_utxos, total_selected_amount, source_wallet, destination_wallet, transfer_amount,
+                       signature):
+        # Writes one transfer to the session without committing it. Returns
+        # the transaction and the utxos it created.
+        signature_hex = binascii.hexlify(signature).decode()  # Convert signature bytes to hex string
+        transaction = Transaction.create_transaction(
+            inputs=selected_utxos,
+            outputs=[{'address': destination_wallet.address, 'amount': transfer_amount}],
+            create_money=False,
+            signatures=[signature_hex],  # Use the hex string representation of the signature
+            commit=False
+        )
+        created_utxos = [Utxo.create_utxo(destination_wallet.id, transaction.id, transfer_amount, commit=False)]
 
         remaining_change = total_selected_amount - transfer_amount
         # Creating a new utxo in the source address after destroying the used ones
         if remaining_change > 0:
-            change_utxo = Utxo.create_utxo(source_wallet.id, transaction.id, remaining_change)
+            change_utxo = Utxo.create_utxo(source_wallet.id, transaction.id, remaining_change, commit=False)
+            created_utxos.append(change_utxo)
             print(f"Change UTXO created: UTXO ID - {change_utxo.id}, Amount - {remaining_change}")
-
-        print(f"Money transferred successfully from {source_address} to {destination_address}.")
+        return transaction, created_utxos
 
 
 
 class WalletManager:
     
     @classmethod
-    def transfer_money(cls, source_addresses, transfer_details_list, public_keys):
+    def transfer_money(cls, source_addresses, transfer_details_list, public_keys, private_keys=None,
+                       strategy='interactive'):
+        # private_keys optionally maps source addresses to their signing keys,
+        # addresses without one are asked for a passphrase. 'strategy' names
+        # the coin_selection strategy used to pick the UTXOs.
         # Verifying the transfer details
         is_valid, error_message = Transaction.validate_transfer(source_addresses, transfer_details_list)
 
@@ -65,32 +88,29 @@ class WalletManager:
                 transfer_amount = transfer_details.get('amount', 0)
 
                 source_wallet = Wallet.fetch_wallet_by_address(source_address)
-                total_amount = Utxo.calculate_total_balance(
-                    Utxo.fetch_available_utxos(source_wallet)
-                )
+                available_utxos = Utxo.fetch_available_utxos(source_wallet)
+                total_amount = Utxo.calculate_total_balance(available_utxos)
                 # Checking if the total amount in the source address is greater than the transfer amount
                 if total_amount >= transfer_amount:
-                    available_utxos = Utxo.fetch_available_utxos(source_wallet)
-                    selected_utxos_ids, total_selected_amount = Utxo.show_utxos_and_select(
-                        available_utxos, transfer_amount
+                    try:
+                        selected_utxos, total_selected_amount = select_coins(available_utxos, transfer_amount, strategy)
+                    except ValueError as error:
+                        print(f"UTXO selection failed for {source_address}: {error}")
+                        continue
+
+                    transaction_data_bytes = Transaction.transaction_data_bytes(
+                        [utxo.id for utxo in selected_utxos],
+                        [{'address': destination_address, 'amount': transfer_amount}],
+                        False
                     )
-
-                    transaction_data = {
-                        "inputs": selected_utxos_ids,
-                        "outputs": [{'address': destination_address, 'amount': transfer_amount}],
-                        "create_money": False
-                    }
-                    transaction_data_bytes = str(transaction_data).encode('utf-8')
-                    mnemonic_phrase = str(input("Enter the passphrase: "))
-
-                    private_key = KeyPair.mnemonic_to_private_key(mnemonic_phrase)
+                    private_key = cls._private_key(source_address, private_keys)
 
                     # Signing the transaction data
                     signature = Transaction.sign_transaction(private_key, transaction_data_bytes)
                     # Verifying the signature
                     is_valid_signature = Transaction.verify_signature(public_key, transaction_data_bytes, signature)
                     # Creating a transaction and utxos
-                    Ledger.process_transaction(is_valid_signature, selected_utxos_ids, destination_address,
+                    Ledger.process_transaction(is_valid_signature, selected_utxos, destination_address,
                                              transfer_amount, total_selected_amount,source_address,source_wallet, signature)
 
                 else:
@@ -98,8 +118,75 @@ class WalletManager:
         else:
             print(f"Transfer validation failed: {error_message}")
 
+    #Validating, signing and applying a list of transfers as one database transaction
+    @classmethod
+    def transfer_batch(cls, transfer_details_list, private_keys, strategy='auto'):
+        # private_keys maps every source address to its ecdsa SigningKey. UTXOs
+        # are picked with the named coin_selection strategy, and later
+        # transfers can spend the change of earlier ones. Everything is committed once at the end; on any
+        # error nothing is written. Returns (is_valid, error_message).
+        is_valid, error_message = Transaction.validate_transfer(list(private_keys), transfer_details_list)
+        if not is_valid:
+            print(f"Transfer validation failed: {error_message}")
+            return False, error_message
+
+        # Unspent utxos of each source wallet, fetched and sorted once for the
+        # whole batch and kept up to date as the transfers spend and create them
+        available_utxos = {}
+        try:
+            for transfer_details in transfer_details_list:
+                cls._apply_signed_transfer(transfer_details, private_keys[transfer_details.get('source_address')],
+                                           strategy, available_utxos)
+            models.session.commit()
+        except ValueError as error:
+            models.session.rollback()
+            print(f"Batch transfer failed, nothing was applied: {error}")
+            return False, str(error)
+        except Exception:
+            models.session.rollback()
+            raise
+
+        print(f"{len(transfer_details_list)} transfers applied")
+        return True, None
+
+    @classmethod
+    def _apply_signed_transfer(cls, transfer_details, private_key, strategy, available_utxos):
+        source_address = transfer_details.get('source_address')
+        destination_address = transfer_details.get('destination_address')
+        transfer_amount = transfer_details.get('amount')
+
+        public_key = private_key.get_verifying_key()
+        if KeyPair.public_key_to_address(public_key) != source_address:
+            raise ValueError(f"Key does not belong to {source_address}")
+
+        source_wallet = Wallet.fetch_wallet_by_address(source_address)
+        if source_wallet is None:
+            raise ValueError(f"Source wallet not found: {source_address}")
+        destination_wallet = Wallet.fetch_wallet_by_address(destination_address)
+        if source_wallet.id not in available_utxos:
+            available_utxos[source_wallet.id] = sort_utxos(Utxo.fetch_available_utxos(source_wallet))
+        sorted_utxos = available_utxos[source_wallet.id]
+        selected_utxos, total_selected_amount = select_coins(sorted_utxos, transfer_amount, strategy, presorted=True)
+
+        transaction_data_bytes = Transaction.transaction_data_bytes(
+            [utxo.id for utxo in selected_utxos],
+            [{'address': destination_address, 'amount': transfer_amount}],
+            False
+        )
+        signature = Transaction.sign_transaction(private_key, transaction_data_bytes)
+        if not Transaction.verify_signature(public_key, transaction_data_bytes, signature):
+            raise ValueError(f"Not a valid signature for {source_address}")
+
+        _, created_utxos = Ledger.apply_transfer(selected_utxos, total_selected_amount, source_wallet,
+                                                 destination_wallet, transfer_amount, signature)
+        remove_utxos(sorted_utxos, selected_utxos)
+        for utxo in created_utxos:
+            # Change, or a payment to a wallet that is also a source in this batch
+            if utxo.wallet_id in available_utxos:
+                insert_utxo(available_utxos[utxo.wallet_id], utxo)
+
     @classmethod
-    def create_money(cls, authorized_address, destination_address, public_key, amount):
+    def create_money(cls, authorized_address, destination_address, public_key, amount, private_key=None):
         # Verifying if the addresses are valid or not
         is_valid, error_message = Transaction.verify_create_money_inputs(
             authorized_address, destination_address, amount
@@ -114,9 +201,8 @@ class WalletManager:
                 "create_money": True
             }
             transaction_data_bytes = str(transaction_data).encode('utf-8')
-            mnemonic_phrase = str(input("Enter the passphrase: "))
-
-            private_key = KeyPair.mnemonic_to_private_key(mnemonic_phrase)
+            if private_key is None:
+                private_key = cls._private_key(authorized_address, None)
 
             # Sign the transaction_data
             signature = Transaction.sign_transaction(private_key, transaction_data_bytes)
@@ -131,17 +217,30 @@ class WalletManager:
             print(f"Create money validation failed: {error_message}")
         
     
+    #Signing key passed in by the caller, otherwise recovered from a passphrase typed at the terminal
+    @staticmethod
+    def _private_key(address, private_keys):
+        if private_keys and address in private_keys:
+            return private_keys[address]
+        mnemonic_phrase = str(input("Enter the passphrase: "))
+        return KeyPair.mnemonic_to_private_key(mnemonic_phrase)
+
     #Calculating the balance in an address
     @classmethod
     def balance(cls,address):
         wallet = Wallet.fetch_wallet_by_address(address)
 
         if wallet:
-            available_utxos = Utxo.fetch_available_utxos(wallet)
-            total_balance = Utxo.calculate_total_balance(available_utxos)
-            return total_balance
+            # Maintained by Utxo.create_utxo and Transaction.create_transaction
+            return wallet.balance
         else:
             print(f"Wallet not found for address: {address}")
             return 0.0  # Assuming a default balance of 0 if the wallet is not found
 
+    #Calculating the balances of many addresses at once, e.g. for a dashboard
+    @classmethod
+    def balances(cls, addresses):
+        stored = Wallet.fetch_balances(list(addresses))
+        return {address: stored.get(address, 0.0) for address in addresses}
+
 